@@ -5,13 +5,14 @@ from .models import OctoFitUser, Team, Activity, Leaderboard, Workout
 @admin.register(OctoFitUser)
 class OctoFitUserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'age')
-    search_fields = ('username', 'email')
+    # Anchored prefixes ('^') instead of substring scans; /api/search/ does ranked search
+    search_fields = ('^username', '^email')
 
 
 @admin.register(Team)
 class TeamAdmin(admin.ModelAdmin):
     list_display = ('name',)
-    search_fields = ('name',)
+    search_fields = ('^name',)
 
 
 @admin.register(Activity)
@@ -20,14 +21,20 @@ class ActivityAdmin(admin.ModelAdmin):
     list_filter = ('activity_type', 'date')
     search_fields = ('user__username', 'activity_type')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_users()
+
 
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
     list_display = ('user', 'score')
     ordering = ('-score',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_users()
+
 
 @admin.register(Workout)
 class WorkoutAdmin(admin.ModelAdmin):
     list_display = ('name', 'description')
-    search_fields = ('name',)
+    search_fields = ('^name',)
@@ -0,0 +1,134 @@
+"""Async (ASGI) versions of the MongoDB-backed read endpoints.
+
+These serve the same payloads as ``LeaderboardViewSet``, ``WorkoutViewSet``
+and the team list under ``/api/async/``. Their pymongo calls go through
+``mongo.run_async``, so a request waiting on MongoDB does not hold a worker
+thread. They only pay off when
+served by an ASGI server, e.g. ``uvicorn octofit_tracker.asgi:application``;
+under WSGI Django runs them in a thread like any other view.
+"""
+import functools
+
+from django.http import HttpResponseNotAllowed, JsonResponse
+from pymongo import ASCENDING
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from .cache import async_cache_response
+from .mongo import get_db, run_async
+from .pagination import MongoCursorPagination, mongo_projection, requested_fields, select_fields
+from .views import (
+    LEADERBOARD_FIELDS,
+    LEADERBOARD_SOURCES,
+    WORKOUT_FIELDS,
+    WORKOUT_SOURCES,
+    leaderboard_entry,
+    unnamed_teams,
+    workout_entry,
+    workout_query,
+)
+
+TEAM_FIELDS = ('_id', 'team_id', 'name', 'members')
+MEMBER_PROJECTION = {'name': 1, 'username': 1, 'email': 1}
+
+
+def require_get(view):
+    """``require_GET`` for async views (Django's decorator is sync-only before 5.0)."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def not_found(exc):
+    return JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+
+
+@require_get
+@async_cache_response('leaderboard', 'teams', 'users')
+async def leaderboard_list(request):
+    """Rank-ordered leaderboard page, team names included on the entries."""
+    request = Request(request)
+    db = get_db()
+    fields = requested_fields(request, LEADERBOARD_FIELDS)
+    paginator = MongoCursorPagination(ordering=(('rank', ASCENDING), ('_id', ASCENDING)))
+    try:
+        docs = await run_async(
+            paginator.paginate_collection, db.leaderboard, request,
+            projection=mongo_projection(fields, LEADERBOARD_SOURCES),
+        )
+    except NotFound as exc:
+        return not_found(exc)
+
+    teams = {}
+    if fields is None or 'team' in fields:
+        teams = await run_async(unnamed_teams, db, docs)
+
+    entries = [select_fields(leaderboard_entry(doc, teams), fields) for doc in docs]
+    return paginator.get_paginated_data(entries)
+
+
+@require_get
+@async_cache_response('workouts')
+async def workout_list(request):
+    request = Request(request)
+    query, error = workout_query(request.query_params)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    fields = requested_fields(request, WORKOUT_FIELDS)
+    paginator = MongoCursorPagination()
+    try:
+        docs = await run_async(
+            paginator.paginate_collection, get_db().workouts, request, query=query,
+            projection=mongo_projection(fields, WORKOUT_SOURCES),
+        )
+    except NotFound as exc:
+        return not_found(exc)
+    workouts = [select_fields(workout_entry(doc), fields) for doc in docs]
+    return paginator.get_paginated_data(workouts)
+
+
+def member_docs(db, member_ids):
+    return {user['_id']: user for user in db.users.find({'_id': {'$in': member_ids}}, MEMBER_PROJECTION)}
+
+
+@require_get
+@async_cache_response('teams', 'users')
+async def team_list(request):
+    """Teams with their members resolved by one ``$in`` query for the whole page."""
+    request = Request(request)
+    db = get_db()
+    fields = requested_fields(request, TEAM_FIELDS)
+    paginator = MongoCursorPagination()
+    try:
+        docs = await run_async(
+            paginator.paginate_collection, db.teams, request, projection=mongo_projection(fields)
+        )
+    except NotFound as exc:
+        return not_found(exc)
+
+    users = {}
+    member_ids = list({member for doc in docs for member in doc.get('members', [])})
+    if member_ids and (fields is None or 'members' in fields):
+        users = await run_async(member_docs, db, member_ids)
+
+    teams = []
+    for doc in docs:
+        members = [users[member] for member in doc.get('members', []) if member in users]
+        teams.append(select_fields({
+            '_id': str(doc['_id']),
+            'team_id': doc.get('team_id'),
+            'name': doc.get('name', ''),
+            'members': [
+                {
+                    '_id': str(user['_id']),
+                    'name': user.get('name', ''),
+                    'username': user.get('username', ''),
+                    'email': user.get('email', ''),
+                }
+                for user in members
+            ],
+        }, fields))
+    return paginator.get_paginated_data(teams)
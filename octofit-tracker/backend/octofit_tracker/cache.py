@@ -0,0 +1,268 @@
+"""Response cache for the hot read endpoints, invalidated by collection versions.
+
+Every write bumps a version counter per collection in the ``cache_versions``
+collection. Cached list responses are keyed on the request URL plus the
+versions of the collections they depend on, so a write anywhere (in any
+worker) makes the old entries unreachable; they then age out of the LRU or
+TTL. The same key doubles as a strong ETag, so clients revalidating with
+``If-None-Match`` get a 304 without the response being rebuilt.
+``conditional_response`` gives the same ETag/304 handling to endpoints
+whose pages are too varied to be worth storing.
+
+The backend is chosen by ``settings.RESPONSE_CACHE['BACKEND']``: ``'lru'``
+(in-process, the default), ``'django'`` (a Django cache alias) or ``'none'``.
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponseNotModified, JsonResponse
+from pymongo import UpdateOne
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .mongo import get_db, run_async
+
+DEFAULTS = {
+    'BACKEND': 'lru',
+    'MAX_ENTRIES': 1024,
+    'TIMEOUT': 30,
+    'CACHE_ALIAS': 'default',
+}
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries=1024, timeout=30):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCache:
+    """Adapter for a configured Django cache backend."""
+
+    def __init__(self, alias='default', timeout=30):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_ratio'] = round(counters['hits'] / lookups, 3) if lookups else 0.0
+        return counters
+
+
+cache_stats = CacheStats()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+                if config['BACKEND'] == 'django':
+                    _cache = DjangoCache(config['CACHE_ALIAS'], config['TIMEOUT'])
+                elif config['BACKEND'] == 'none':
+                    _cache = NullCache()
+                else:
+                    _cache = LRUCache(config['MAX_ENTRIES'], config['TIMEOUT'])
+    return _cache
+
+
+def bump_versions(db, *collections):
+    """Mark ``collections`` as changed, invalidating responses that depend on them."""
+    if not collections:
+        return
+    db.cache_versions.bulk_write([
+        UpdateOne({'_id': name}, {'$inc': {'version': 1}}, upsert=True)
+        for name in collections
+    ], ordered=False)
+    cache_stats.incr('invalidations', len(collections))
+
+
+def get_versions(db, collections):
+    found = {doc['_id']: doc.get('version', 0) for doc in db.cache_versions.find({'_id': {'$in': list(collections)}})}
+    return [found.get(name, 0) for name in collections]
+
+
+def response_key(request, dependencies, versions):
+    renderer = getattr(request, 'accepted_media_type', '')
+    raw = '|'.join([request.build_absolute_uri(), renderer] + [
+        f'{name}:{version}' for name, version in zip(dependencies, versions)
+    ])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')]
+
+
+def cache_response(*dependencies):
+    """Cache a viewset action's ``Response`` data until ``dependencies`` change.
+
+    Adds an ``ETag`` header and answers a matching ``If-None-Match`` with 304.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            versions = get_versions(get_db(), dependencies)
+            key = response_key(request, dependencies, versions)
+            etag = f'"{key}"'
+            if etag_matches(request, etag):
+                cache_stats.incr('not_modified')
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                cache_stats.incr('hits')
+                return Response(data, headers={'ETag': etag, 'X-Cache': 'HIT'})
+
+            cache_stats.incr('misses')
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data)
+                response['ETag'] = etag
+                response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_response(*dependencies):
+    """ETag and ``If-None-Match`` handling of ``cache_response``, without storing the data.
+
+    For list endpoints with many distinct pages (filters, cursors), where a
+    cache would mostly hold entries that are never read again.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            versions = get_versions(get_db(), dependencies)
+            etag = f'"{response_key(request, dependencies, versions)}"'
+            if etag_matches(request, etag):
+                cache_stats.incr('not_modified')
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
+
+
+def async_cache_response(*dependencies):
+    """``cache_response`` for async Django views returning ``JsonResponse``.
+
+    The wrapped view returns the response data; it is cached and served as JSON.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            versions = await run_async(get_versions, get_db(), dependencies)
+            key = response_key(request, dependencies, versions)
+            etag = f'"{key}"'
+            if etag_matches(request, etag):
+                cache_stats.incr('not_modified')
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                cache_stats.incr('hits')
+                return JsonResponse(data, headers={'ETag': etag, 'X-Cache': 'HIT'})
+
+            cache_stats.incr('misses')
+            result = await view(request, *args, **kwargs)
+            if isinstance(result, JsonResponse):
+                return result
+            cache.set(key, result)
+            return JsonResponse(result, headers={'ETag': etag, 'X-Cache': 'MISS'})
+        return wrapper
+    return decorator
+
+
+class VersionedWritesMixin:
+    """Bumps ``cache_collections`` after every successful write through the viewset."""
+    cache_collections = ()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            bump_versions(get_db(), *self.cache_collections)
+        return response
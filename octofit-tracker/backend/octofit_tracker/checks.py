@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+from pymongo.errors import PyMongoError
+
+from .indexes import missing_indexes
+from .mongo import get_db
+
+
+@register('mongo')
+def check_mongo_indexes(app_configs, **kwargs):
+    """Warn at startup about registered MongoDB indexes that have not been built.
+
+    Disable with ``MONGO_VERIFY_INDEXES = False`` (env ``MONGO_VERIFY_INDEXES=0``).
+    """
+    if not getattr(settings, 'MONGO_VERIFY_INDEXES', True):
+        return []
+    try:
+        missing = missing_indexes(get_db())
+    except PyMongoError as exc:
+        return [Warning(
+            f'Could not verify MongoDB indexes: {exc}',
+            id='octofit_tracker.W002',
+        )]
+    return [
+        Warning(
+            f"Missing MongoDB index {collection}.{model.document['name']}",
+            hint='Run `python manage.py ensure_indexes`.',
+            id='octofit_tracker.W001',
+        )
+        for collection, model in missing
+    ]
@@ -0,0 +1,167 @@
+"""Brotli/gzip response compression negotiated from ``Accept-Encoding``.
+
+``CompressionMiddleware`` compresses JSON, NDJSON and CSV responses of at
+least ``MIN_SIZE`` bytes (smaller bodies are not worth the CPU or the
+encoding overhead) and streams ``StreamingHttpResponse`` exports through an
+incremental compressor. Brotli is used when the ``brotli`` package is
+installed and the client prefers it; otherwise gzip.
+
+HTML is left alone: the browsable API echoes the CSRF token, which makes
+compressed pages a BREACH target.
+
+Encoded bodies get their own strong ETag, the version-based tag from
+``cache.py`` with an ``-br``/``-gzip`` suffix, since they are different
+bytes (the gzip header carries no mtime, so the output is reproducible).
+The suffix is stripped from ``If-None-Match`` before the view sees it, so
+revalidation still answers 304 without rebuilding the response.
+Configured by ``settings.COMPRESSION``.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'COMPRESSION', {})}
+
+
+def available_encodings():
+    """Supported encodings, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding, encodings):
+    """The encoding from ``encodings`` the client accepts with the highest q-value, or ``None``.
+
+    Ties go to the earlier entry of ``encodings``; ``*`` covers encodings not listed.
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def encoded_etag(etag, encoding):
+    """``"tag"`` -> ``"tag-gzip"``: a strong ETag for the encoded representation."""
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def decoded_etag(etag, encodings):
+    """The representation-independent ETag of an ``encoded_etag``, or ``etag`` itself."""
+    for encoding in encodings:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['GZIP_LEVEL'], mtime=0)
+
+
+def compress_stream(chunks, encoding, config):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config['BROTLI_QUALITY'])
+        compress_chunk, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(config['GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress_chunk, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress_chunk(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compresses large API responses with brotli or gzip (see the module docstring)."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.config = get_config()
+        self.encodings = available_encodings()
+
+    def process_request(self, request):
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not self.config['ENABLED'] or not header:
+            return
+        request.encoded_etags = {}
+        tags = []
+        for tag in header.split(','):
+            tag = tag.strip()
+            base = decoded_etag(tag, self.encodings)
+            if base != tag:
+                request.encoded_etags[base] = tag
+            tags.append(base)
+        request.META['HTTP_IF_NONE_MATCH'] = ', '.join(tags)
+
+    def process_response(self, request, response):
+        if not self.config['ENABLED']:
+            return response
+        if response.status_code == 304:
+            # Answer with the tag the client holds, the encoded one if it sent that
+            etag = response.get('ETag')
+            if etag in getattr(request, 'encoded_etags', {}):
+                response['ETag'] = request.encoded_etags[etag]
+            return response
+        media_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if (response.status_code != 200 or response.has_header('Content-Encoding')
+                or media_type not in COMPRESSIBLE_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding, self.config)
+            del response['Content-Length']
+        else:
+            if len(response.content) < self.config['MIN_SIZE']:
+                return response
+            compressed = compress(response.content, encoding, self.config)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        if response.has_header('ETag'):
+            response['ETag'] = encoded_etag(response['ETag'], encoding)
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,104 @@
+"""Streaming export of the ``activities`` collection as NDJSON or CSV.
+
+Rows are read in batches along the ``(date, _id)`` index and written through
+a generator, so memory use does not depend on the number of exported
+activities.
+"""
+import csv
+import json
+import zlib
+from datetime import date, datetime
+
+from bson import ObjectId
+
+EXPORT_FIELDS = ('_id', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date')
+EXPORT_ORDER = [('date', 1), ('_id', 1)]
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CHUNK_SIZE = 64 * 1024
+
+
+def export_value(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_activities(db, since=None, batch_size=1000):
+    """Activities in ``(date, _id)`` order, read from the ``date_1__id_1`` index.
+
+    Each batch is its own query resuming after the last ``(date, _id)`` sent,
+    so a long export holds no server-side cursor between batches and a
+    ``since`` filter is a range on the same index.
+    """
+    projection = {field: 1 for field in EXPORT_FIELDS}
+    start = {'date': {'$gte': since}} if since is not None else {}
+    query = start
+    while True:
+        docs = list(db.activities.find(query, projection).sort(EXPORT_ORDER).limit(batch_size))
+        for doc in docs:
+            yield [export_value(doc.get(field)) for field in EXPORT_FIELDS]
+        if len(docs) < batch_size:
+            return
+        last = docs[-1]
+        after = {'$or': [
+            {'date': {'$gt': last['date']}},
+            {'date': last['date'], '_id': {'$gt': last['_id']}},
+        ]}
+        query = {'$and': [start, after]} if start else after
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), separators=(',', ':')) + '\n'
+
+
+class _LineBuffer:
+    """File-like object for ``csv.writer`` that returns the written line."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def chunked(lines, chunk_size=CHUNK_SIZE):
+    """Join text lines into UTF-8 chunks of roughly ``chunk_size`` bytes."""
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_activities(db, export_format='ndjson', since=None, gzip=False, batch_size=1000):
+    """Yield the encoded export as byte chunks."""
+    rows = iter_activities(db, since=since, batch_size=batch_size)
+    lines = csv_lines(rows) if export_format == 'csv' else ndjson_lines(rows)
+    chunks = chunked(lines)
+    return gzipped(chunks) if gzip else chunks
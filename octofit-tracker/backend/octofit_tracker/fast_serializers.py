@@ -0,0 +1,64 @@
+"""Read-only fast path for the user and activity lists.
+
+DRF ``ModelSerializer`` walks a field tree per row (and ``ActivitySerializer``
+nests a full user serializer per activity), which dominated list latency.
+These functions build the same payloads straight from raw MongoDB documents;
+an activity page loads its users with one ``$in`` query, and
+``ORJSONRenderer`` encodes the result. Writes and detail views still use
+``serializers.py``. ``manage.py benchmark_serializers`` compares both paths.
+"""
+from datetime import date, datetime
+
+USER_FIELDS = ('_id', 'name', 'username', 'email', 'password', 'age')
+ACTIVITY_FIELDS = ('_id', 'user', 'activity_type', 'duration', 'distance', 'calories', 'date')
+ACTIVITY_SOURCES = {'user': ('user_id',)}
+USER_PROJECTION = {field: 1 for field in USER_FIELDS}
+
+
+def _int(value):
+    return int(value) if value is not None else None
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _date(value):
+    """ISO date, as DRF's ``DateField`` renders the model's ``date``."""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def user_row(doc):
+    return {
+        '_id': str(doc['_id']),
+        'name': doc.get('name', ''),
+        'username': doc.get('username'),
+        'email': doc.get('email'),
+        'password': doc.get('password'),
+        'age': _int(doc.get('age', 0)),
+    }
+
+
+def activity_row(doc, users):
+    user = users.get(doc.get('user_id'))
+    return {
+        '_id': str(doc['_id']),
+        'user': user_row(user) if user is not None else None,
+        'activity_type': doc.get('activity_type'),
+        'duration': _float(doc.get('duration', 0)),
+        'distance': _float(doc.get('distance', 0)),
+        'calories': _int(doc.get('calories', 0)),
+        'date': _date(doc.get('date')),
+    }
+
+
+def fetch_users(db, user_ids):
+    """``_id -> user document`` for ``user_ids``, in one query."""
+    user_ids = list({user_id for user_id in user_ids if user_id is not None})
+    if not user_ids:
+        return {}
+    return {user['_id']: user for user in db.users.find({'_id': {'$in': user_ids}}, USER_PROJECTION)}
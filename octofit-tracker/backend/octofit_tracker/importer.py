@@ -0,0 +1,421 @@
+"""Streaming, resumable import of users, teams, activities and workouts.
+
+Files are NDJSON (one object per line) or CSV with a header row, optionally
+gzipped, and are read one record at a time. Records are upserted in chunks
+with one unordered ``bulk_write`` each, keyed on natural keys, so re-running
+an import updates documents instead of duplicating them:
+
+* teams on ``team_id``;
+* users on ``email``, with membership taken from the user's ``team_id``
+  (new users without a ``username`` get a unique one from their email);
+* activities on ``(user_id, date, activity_type)``, where the user is given
+  as ``user_id`` or ``user_email``;
+* workouts on ``title``.
+
+After each chunk the number of records done is saved in
+``import_checkpoints``, keyed by collection and file path and tied to the
+file's size and mtime. An interrupted import resumes after the last saved
+chunk. Upserts are idempotent, so re-applying part of a chunk is harmless.
+Records the server rejects (e.g. a duplicate username) are reported per
+record like validation errors; the rest of the chunk is still written.
+Imported activities recompute their users' leaderboard totals from the
+activities collection (see ``leaderboard.rebuild_totals``).
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from . import leaderboard
+from .ingest import NUMERIC_FIELDS, clean_row
+from .utils import json_constant
+
+COLLECTIONS = ('teams', 'users', 'activities', 'workouts')  # import order
+FORMATS = ('ndjson', 'csv')
+CHUNK_SIZE = 1000
+LIST_SEPARATOR = ';'  # list fields in CSV files, e.g. workout exercises
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return None
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return io.open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_records(path, fmt):
+    """Yield ``(number, row, error)`` for each record; ``number`` counts from 1."""
+    with open_text(path) as fh:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(fh), start=1):
+                yield number, {key: value for key, value in row.items() if value not in ('', None)}, None
+            return
+        number = 0
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            number += 1
+            try:
+                yield number, json.loads(line, parse_constant=json_constant), None
+            except ValueError as exc:
+                yield number, None, f'Invalid JSON - {exc}'
+
+
+def as_number(value):
+    """Numbers from NDJSON pass through; CSV strings become ints or floats."""
+    if isinstance(value, str):
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+    return value
+
+
+def as_list(value):
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+    return value if isinstance(value, list) else []
+
+
+def _required_str(row, field, errors):
+    value = row.get(field)
+    if not isinstance(value, str) or not value.strip():
+        errors[field] = ['This field is required.']
+        return None
+    return value.strip()
+
+
+def _optional_int(row, field, errors):
+    if field not in row:
+        return None
+    value = as_number(row[field])
+    if isinstance(value, bool) or not isinstance(value, int):
+        errors[field] = ['An integer is required.']
+        return None
+    return value
+
+
+def clean_team(row):
+    errors = {}
+    team_id = _optional_int(row, 'team_id', errors)
+    if team_id is None and 'team_id' not in errors:
+        errors['team_id'] = ['This field is required.']
+    name = _required_str(row, 'name', errors)
+    if errors:
+        return None, errors
+    return {'team_id': team_id, 'name': name, 'description': row.get('description', '')}, {}
+
+
+def clean_user(row):
+    """Without a ``username``, new users get one from the email (see ``unique_usernames``)."""
+    errors = {}
+    email = _required_str(row, 'email', errors)
+    if email and '@' not in email:
+        errors['email'] = ['Enter a valid email address.']
+    age = _optional_int(row, 'age', errors)
+    team_id = _optional_int(row, 'team_id', errors)
+    if errors:
+        return None, errors
+    email = email.lower()
+    doc = {
+        'email': email,
+        'name': row.get('name', ''),
+        'age': age or 0,
+    }
+    if row.get('username'):
+        doc['username'] = row['username']
+    if 'password' in row:
+        doc['password'] = row['password']
+    if team_id is not None:
+        doc['team_id'] = team_id
+    return doc, {}
+
+
+def clean_workout(row):
+    errors = {}
+    title = _required_str(row, 'title', errors)
+    duration = _optional_int(row, 'duration', errors)
+    if errors:
+        return None, errors
+    return {
+        'title': title,
+        'description': row.get('description', ''),
+        'difficulty': row.get('difficulty', ''),
+        'duration': duration or 0,
+        'exercises': as_list(row.get('exercises')),
+        'recommended_for': as_list(row.get('recommended_for')),
+    }, {}
+
+
+def upsert(collection, key_fields, docs, now, defaults=None, on_insert=None):
+    """Upsert ``(number, doc)`` pairs on ``key_fields``; returns ``(written, errors)``.
+
+    ``defaults`` only fill fields of new documents, as do the per-record
+    fields in ``on_insert`` (``number -> fields``). Writes rejected by the
+    server, e.g. by a unique index, are reported per record.
+    """
+    defaults = {'created_at': now, **(defaults or {})}
+    on_insert = on_insert or {}
+    operations = []
+    for number, doc in docs:
+        inserted = {**defaults, **on_insert.get(number, {})}
+        operations.append(UpdateOne(
+            {field: doc[field] for field in key_fields},
+            {'$set': doc, '$setOnInsert': {key: value for key, value in inserted.items() if key not in doc}},
+            upsert=True,
+        ))
+    if not operations:
+        return 0, []
+    try:
+        result = collection.bulk_write(operations, ordered=False).bulk_api_result
+    except BulkWriteError as exc:
+        result = exc.details
+    errors = [
+        {'record': docs[error['index']][0], 'errors': {'non_field_errors': [error['errmsg']]}}
+        for error in result.get('writeErrors', [])
+    ]
+    return result['nUpserted'] + result['nMatched'], errors
+
+
+def import_teams(db, rows, now):
+    docs, errors = _clean_all(rows, clean_team)
+    written, write_errors = upsert(db.teams, ('team_id',), docs, now, defaults={'members': []})
+    failed = {error['record'] for error in write_errors}
+    for number, doc in docs:
+        if number not in failed:
+            leaderboard.rename_team(db, doc['team_id'], doc['name'])
+    return written, errors + write_errors
+
+
+def unique_usernames(db, docs):
+    """``number -> {'username': ...}`` for users imported without a username.
+
+    The email's local part is used, with a numeric suffix when another user
+    (stored, or earlier in ``docs``) already has it. Users that already exist
+    keep their username; this only applies on insert.
+    """
+    wanted = {number: doc['email'].split('@')[0] for number, doc in docs if 'username' not in doc}
+    if not wanted:
+        return {}
+    emails = [doc['email'] for _, doc in docs]
+    taken = {doc['username'] for _, doc in docs if 'username' in doc}
+    checked = set()
+    while True:
+        assigned = {}
+        used = set(taken)
+        for number, base in wanted.items():
+            username, suffix = base, 1
+            while username in used:
+                suffix += 1
+                username = f'{base}{suffix}'
+            used.add(username)
+            assigned[number] = username
+        unchecked = set(assigned.values()) - checked
+        if not unchecked:
+            return {number: {'username': username} for number, username in assigned.items()}
+        checked |= unchecked
+        taken.update(
+            user['username'] for user in db.users.find(
+                {'username': {'$in': list(unchecked)}, 'email': {'$nin': emails}}, {'username': 1},
+            )
+        )
+
+
+def import_users(db, rows, now):
+    docs, errors = _clean_all(rows, clean_user)
+    written, write_errors = upsert(
+        db.users, ('email',), docs, now, defaults={'password': ''}, on_insert=unique_usernames(db, docs),
+    )
+    errors.extend(write_errors)
+    users = list(db.users.find(
+        {'email': {'$in': [doc['email'] for _, doc in docs]}},
+        {'email': 1, 'name': 1, 'username': 1, 'team_id': 1},
+    ))
+
+    # Move members to the team named on their row, and keep their entries in step
+    by_team = {}
+    for user in users:
+        if 'team_id' in user:
+            by_team.setdefault(user['team_id'], []).append(user['_id'])
+    if by_team:
+        moved = [oid for oids in by_team.values() for oid in oids]
+        db.teams.update_many({'members': {'$in': moved}}, {'$pull': {'members': {'$in': moved}}})
+        for team_id, oids in by_team.items():
+            db.teams.update_one({'team_id': team_id}, {'$addToSet': {'members': {'$each': oids}}})
+    details = leaderboard.user_details(db, [user['_id'] for user in users], {u['_id']: u for u in users})
+    operations = [UpdateOne({'user_id': oid}, {'$set': detail}) for oid, detail in details.items()]
+    if operations:
+        db.leaderboard.bulk_write(operations, ordered=False)
+    return written, errors
+
+
+def import_activities(db, rows, now):
+    rows, errors = _objects(rows)
+    emails = {row['user_email'].lower() for _, row in rows if isinstance(row.get('user_email'), str)}
+    user_oids = {
+        user['email']: user['_id'] for user in db.users.find({'email': {'$in': list(emails)}}, {'email': 1})
+    }
+    valid = []
+    for number, row in rows:
+        row = {
+            field: as_number(value) if field in NUMERIC_FIELDS else value
+            for field, value in row.items()
+        }
+        if 'user_id' not in row and isinstance(row.get('user_email'), str):
+            row['user_id'] = user_oids.get(row['user_email'].lower())
+            if row['user_id'] is None:
+                errors.append({'record': number, 'errors': {'user_email': ['User does not exist.']}})
+                continue
+        doc, row_errors = clean_row(row)
+        if row_errors:
+            errors.append({'record': number, 'errors': row_errors})
+        else:
+            valid.append((number, doc))
+
+    user_ids = list({doc['user_id'] for _, doc in valid})
+    known = {user['_id'] for user in db.users.find({'_id': {'$in': user_ids}}, {'_id': 1})}
+    docs = []
+    for number, doc in valid:
+        if doc['user_id'] in known:
+            docs.append((number, doc))
+        else:
+            errors.append({'record': number, 'errors': {'user_id': ['User does not exist.']}})
+    written, write_errors = upsert(db.activities, ('user_id', 'date', 'activity_type'), docs, now)
+    leaderboard.rebuild_totals(db, {doc['user_id'] for _, doc in docs})
+    return written, errors + write_errors
+
+
+def import_workouts(db, rows, now):
+    docs, errors = _clean_all(rows, clean_workout)
+    written, write_errors = upsert(db.workouts, ('title',), docs, now)
+    return written, errors + write_errors
+
+
+def _objects(rows):
+    """Split off records that are not JSON objects; returns ``(rows, errors)``."""
+    objects = []
+    errors = []
+    for number, row in rows:
+        if isinstance(row, dict):
+            objects.append((number, row))
+        else:
+            errors.append({'record': number, 'errors': {'non_field_errors': ['Expected an object.']}})
+    return objects, errors
+
+
+def _clean_all(rows, clean):
+    rows, errors = _objects(rows)
+    docs = []
+    for number, row in rows:
+        doc, row_errors = clean(row)
+        if row_errors:
+            errors.append({'record': number, 'errors': row_errors})
+        else:
+            docs.append((number, doc))
+    return docs, errors
+
+
+IMPORTERS = {
+    'teams': import_teams,
+    'users': import_users,
+    'activities': import_activities,
+    'workouts': import_workouts,
+}
+
+
+def checkpoint_id(collection, path):
+    return f'{collection}:{os.path.abspath(path)}'
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def save_checkpoint(db, collection, path, file_fingerprint, position, completed=False):
+    db.import_checkpoints.update_one({'_id': checkpoint_id(collection, path)}, {'$set': {
+        'collection': collection,
+        'path': os.path.abspath(path),
+        'fingerprint': file_fingerprint,
+        'position': position,
+        'completed': completed,
+        'updated_at': datetime.now(),
+    }}, upsert=True)
+
+
+def import_file(db, collection, path, fmt=None, chunk_size=CHUNK_SIZE, resume=True, progress=None):
+    """Import one file into ``collection``; returns a summary dict.
+
+    ``progress(summary)`` is called after every chunk. With ``resume``, records
+    up to the file's checkpoint are skipped, and an import that already
+    completed is a no-op.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f'Cannot tell the format of {path}; pass one of {", ".join(FORMATS)}')
+    importer = IMPORTERS[collection]
+    file_fingerprint = fingerprint(path)
+    checkpoint = db.import_checkpoints.find_one({'_id': checkpoint_id(collection, path)}) if resume else None
+    if checkpoint and checkpoint.get('fingerprint') != file_fingerprint:
+        checkpoint = None
+
+    skip = checkpoint['position'] if checkpoint else 0
+    summary = {
+        'collection': collection,
+        'path': path,
+        'resumed_from': skip,
+        'position': skip,
+        'written': 0,
+        'errors': [],
+        'completed': bool(checkpoint and checkpoint.get('completed')),
+        'skipped': bool(checkpoint and checkpoint.get('completed')),
+        'elapsed': 0.0,
+    }
+    if summary['skipped']:
+        return summary
+    started = time.monotonic()
+
+    def flush(chunk):
+        written, errors = importer(db, [(number, row) for number, row, _ in chunk if row is not None], datetime.now())
+        errors.extend(
+            {'record': number, 'errors': {'non_field_errors': [error]}} for number, _, error in chunk if error
+        )
+        summary['written'] += written
+        summary['errors'].extend(sorted(errors, key=lambda error: error['record']))
+        summary['position'] = chunk[-1][0]
+        summary['elapsed'] = time.monotonic() - started
+        save_checkpoint(db, collection, path, file_fingerprint, summary['position'])
+        if progress:
+            progress(summary)
+
+    chunk = []
+    for record in read_records(path, fmt):
+        if record[0] <= skip:
+            continue
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    save_checkpoint(db, collection, path, file_fingerprint, summary['position'], completed=True)
+    summary['completed'] = True
+    summary['elapsed'] = time.monotonic() - started
+    return summary
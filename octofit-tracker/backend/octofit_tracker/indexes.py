@@ -0,0 +1,160 @@
+"""Declarative registry of the MongoDB indexes behind the API's hot queries.
+
+``manage.py ensure_indexes`` builds them, a system check warns at startup
+when any is missing, and ``index_usage()`` reports ``$indexStats`` counters.
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+INDEXES = {
+    'users': [
+        # populate_db / import lookups and uniqueness
+        IndexModel([('email', ASCENDING)], name='email_1', unique=True),
+        # anchored prefix search (search.py); unique like the model field, the
+        # same index djongo's migrations build
+        IndexModel([('username', ASCENDING)], name='username_1', unique=True),
+        IndexModel([('name', ASCENDING)], name='name_1'),
+        # /api/search/ full-text; names are matched as written, not stemmed
+        IndexModel(
+            [('name', TEXT), ('username', TEXT), ('email', TEXT)], name='search_text',
+            weights={'name': 5, 'username': 5, 'email': 1}, default_language='none',
+        ),
+    ],
+    'teams': [
+        # teams.update_one({'team_id': ...}) in partial_update
+        IndexModel([('team_id', ASCENDING)], name='team_id_1'),
+        # teams.find_one({'members': oid}) and the stats $lookup
+        IndexModel([('members', ASCENDING)], name='members_1'),
+        # anchored prefix search and /api/search/ full-text; name_1 is the unique
+        # index djongo's migrations build for Team.name
+        IndexModel([('name', ASCENDING)], name='name_1', unique=True),
+        IndexModel([('name', TEXT)], name='search_text', default_language='none'),
+    ],
+    'activities': [
+        # per-user / per-team history pages (newest first) and leaderboard rebuilds
+        IndexModel(
+            [('user_id', ASCENDING), ('date', ASCENDING), ('_id', ASCENDING)],
+            name='user_id_1_date_1__id_1',
+        ),
+        # ?type= history pages
+        IndexModel(
+            [('activity_type', ASCENDING), ('date', ASCENDING), ('_id', ASCENDING)],
+            name='activity_type_1_date_1__id_1',
+        ),
+        # unfiltered and date-window pages
+        IndexModel([('date', ASCENDING), ('_id', ASCENDING)], name='date_1__id_1'),
+        # date-window scans in the export and team stats
+        IndexModel([('date', ASCENDING), ('user_id', ASCENDING)], name='date_1_user_id_1'),
+    ],
+    'leaderboard': [
+        IndexModel([('user_id', ASCENDING)], name='user_id_1', unique=True),
+        # team renames copy the name onto the team's entries
+        IndexModel([('team_id', ASCENDING)], name='team_id_1'),
+        # incremental rank shifts and rerank() scans
+        IndexModel([('total_calories', DESCENDING)], name='total_calories_-1'),
+        # leaderboard pages sorted by rank
+        IndexModel([('rank', ASCENDING), ('_id', ASCENDING)], name='rank_1__id_1'),
+    ],
+    'leaderboard_snapshots': [
+        # "as of" pages: latest snapshot lookup, then rank-ordered entries
+        IndexModel(
+            [('period', ASCENDING), ('date', DESCENDING), ('version', DESCENDING),
+             ('rank', ASCENDING), ('_id', ASCENDING)],
+            name='period_1_date_-1_version_-1_rank_1__id_1',
+        ),
+        # previous ranks of a page of users for rank deltas
+        IndexModel(
+            [('period', ASCENDING), ('date', DESCENDING), ('version', DESCENDING), ('user_id', ASCENDING)],
+            name='period_1_date_-1_version_-1_user_id_1',
+        ),
+    ],
+    'workouts': [
+        # import_data upserts keyed on the title, and anchored prefix search
+        IndexModel([('title', ASCENDING)], name='title_1'),
+        # /api/workouts/?difficulty=&duration_min=&duration_max=
+        IndexModel([('difficulty', ASCENDING), ('duration', ASCENDING)], name='difficulty_1_duration_1'),
+        # /api/search/ full-text, stemmed as English
+        IndexModel(
+            [('title', TEXT), ('description', TEXT), ('recommended_for', TEXT)], name='search_text',
+            weights={'title': 10, 'recommended_for': 5, 'description': 2}, default_language='english',
+        ),
+    ],
+    'activity_events': [
+        # idempotency keys: the same change is queued once
+        IndexModel([('key', ASCENDING)], name='key_1', unique=True),
+        # claiming pending events in order and loading / deleting a batch
+        IndexModel([('batch', ASCENDING), ('_id', ASCENDING)], name='batch_1__id_1'),
+    ],
+}
+
+
+def _key(index):
+    """Index key as a list; text fields are listed by name, as the server reports them by weight."""
+    key = index['key']
+    if '_fts' in key:
+        text_fields = sorted(index.get('weights', {}))
+    else:
+        text_fields = sorted(field for field, direction in key.items() if direction == TEXT)
+    return [
+        (field, direction) for field, direction in key.items()
+        if field not in ('_fts', '_ftsx') and direction != TEXT
+    ] + [(field, TEXT) for field in text_fields]
+
+
+def missing_indexes(db, collections=None):
+    """Registered indexes not present on the server, as ``(collection, IndexModel)``.
+
+    Indexes are matched on their key; a unique index also satisfies a
+    non-unique one (djongo's migrations build unique indexes for the
+    model's ``unique=True`` fields under the same default names).
+    """
+    missing = []
+    existing_names = set(db.list_collection_names())
+    for collection, models in INDEXES.items():
+        if collections and collection not in collections:
+            continue
+        existing = []
+        if collection in existing_names:
+            existing = [
+                (_key(info), bool(info.get('unique')))
+                for info in db[collection].list_indexes()
+            ]
+        for model in models:
+            document = model.document
+            if not any(
+                key == _key(document) and (unique or not document.get('unique'))
+                for key, unique in existing
+            ):
+                missing.append((collection, model))
+    return missing
+
+
+def ensure_indexes(db, collections=None):
+    """Build the missing registered indexes in the background; returns their names.
+
+    Indexes that already exist under another name are left alone, so running
+    this repeatedly is a no-op.
+    """
+    created = []
+    for collection, model in missing_indexes(db, collections):
+        options = {key: value for key, value in model.document.items() if key != 'key'}
+        options.setdefault('background', True)
+        name = db[collection].create_index(_key(model.document), **options)
+        created.append(f'{collection}.{name}')
+    return created
+
+
+def index_usage(db, collections=None):
+    """``$indexStats`` usage counters per collection and index."""
+    report = []
+    for collection in INDEXES:
+        if collections and collection not in collections:
+            continue
+        for stats in db[collection].aggregate([{'$indexStats': {}}]):
+            report.append({
+                'collection': collection,
+                'name': stats['name'],
+                'ops': stats.get('accesses', {}).get('ops', 0),
+                'since': stats.get('accesses', {}).get('since'),
+            })
+    report.sort(key=lambda row: (row['collection'], -row['ops']))
+    return report
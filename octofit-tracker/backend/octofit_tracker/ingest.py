@@ -0,0 +1,133 @@
+"""Bulk activity ingestion for wearable syncs.
+
+Rows are validated in one pass (with a single ``$in`` query to check that
+all referenced users exist), written with unordered ``insert_many`` in
+chunks, and rolled up into the leaderboard with one aggregated
+``bulk_write`` (or queued in the outbox as one event per activity when
+``LEADERBOARD_WRITE_BEHIND`` is on). Errors are reported per row, by index
+in the request.
+"""
+import math
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
+
+from . import leaderboard, outbox
+from .utils import parse_iso_datetime
+
+MAX_ROWS = 10000
+CHUNK_SIZE = 1000
+NUMERIC_FIELDS = ('duration', 'distance', 'calories')
+
+
+def clean_row(row):
+    """Return ``(document, errors)`` for one raw input row."""
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+    errors = {}
+    doc = {}
+
+    try:
+        doc['user_id'] = ObjectId(str(row.get('user_id')))
+    except (InvalidId, TypeError):
+        errors['user_id'] = ['A valid user id is required.']
+
+    activity_type = row.get('activity_type')
+    if not isinstance(activity_type, str) or not activity_type.strip():
+        errors['activity_type'] = ['This field is required.']
+    elif len(activity_type) > 100:
+        errors['activity_type'] = ['Ensure this field has no more than 100 characters.']
+    else:
+        doc['activity_type'] = activity_type.strip()
+
+    for field in NUMERIC_FIELDS:
+        value = row.get(field, 0)
+        if (isinstance(value, bool) or not isinstance(value, (int, float))
+                or not math.isfinite(value) or value < 0):
+            errors[field] = ['A finite, non-negative number is required.']
+        else:
+            doc[field] = value
+
+    activity_date = parse_iso_datetime(row.get('date'))
+    if activity_date is None:
+        errors['date'] = ['A valid ISO date or datetime is required.']
+    else:
+        doc['date'] = activity_date
+
+    if isinstance(row.get('notes'), str):
+        doc['notes'] = row['notes']
+    return doc, errors
+
+
+def validate_rows(db, rows):
+    """Validate all rows; returns ``(valid [(index, doc)], errors, users)``."""
+    valid = []
+    errors = []
+    for index, row in enumerate(rows):
+        doc, row_errors = clean_row(row)
+        if row_errors:
+            errors.append({'index': index, 'errors': row_errors})
+        else:
+            valid.append((index, doc))
+
+    user_ids = list({doc['user_id'] for _, doc in valid})
+    users = {
+        user['_id']: user
+        for user in db.users.find({'_id': {'$in': user_ids}}, {'name': 1, 'username': 1, 'team_id': 1})
+    }
+    known = []
+    for index, doc in valid:
+        if doc['user_id'] in users:
+            known.append((index, doc))
+        else:
+            errors.append({'index': index, 'errors': {'user_id': ['User does not exist.']}})
+    return known, errors, users
+
+
+def insert_activities(db, valid, chunk_size=CHUNK_SIZE):
+    """Insert documents in unordered chunks; returns ``(inserted docs, errors)``."""
+    inserted = []
+    errors = []
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        docs = [doc for _, doc in chunk]
+        try:
+            db.activities.insert_many(docs, ordered=False)
+            inserted.extend(docs)
+        except BulkWriteError as exc:
+            failed = {error['index']: error for error in exc.details.get('writeErrors', [])}
+            for position, (index, doc) in enumerate(chunk):
+                if position in failed:
+                    errors.append({'index': index, 'errors': {'non_field_errors': [failed[position]['errmsg']]}})
+                else:
+                    inserted.append(doc)
+    return inserted, errors
+
+
+def ingest_activities(db, rows):
+    """Validate, insert and roll up ``rows``; returns a summary for the response."""
+    valid, errors, users = validate_rows(db, rows)
+    inserted, insert_errors = insert_activities(db, valid)
+    errors.extend(insert_errors)
+
+    if outbox.write_behind():
+        outbox.enqueue_many(db, [
+            (f"activity:{doc['_id']}:create", doc['user_id'], leaderboard.activity_totals(doc))
+            for doc in inserted
+        ])
+    else:
+        apply_rollup(db, inserted, users)
+
+    errors.sort(key=lambda error: error['index'])
+    return {'received': len(rows), 'inserted': len(inserted), 'errors': errors}
+
+
+def apply_rollup(db, inserted, users):
+    """Sum the inserted activities per user and apply them with one ``bulk_write``."""
+    deltas = {}
+    for doc in inserted:
+        totals = leaderboard.activity_totals(doc)
+        current = deltas.get(doc['user_id'])
+        deltas[doc['user_id']] = leaderboard.add_totals(current, totals) if current else totals
+    leaderboard.apply_deltas(db, deltas, users)
@@ -0,0 +1,276 @@
+"""Per-request MongoDB command instrumentation.
+
+Most of the API talks to MongoDB through raw pymongo calls, which Django's
+``connection.queries`` never sees. ``CommandRecorder`` is a pymongo
+``CommandListener`` registered for every client in the process; while a
+request is being handled it records each command's name, collection, filter
+shape, duration and documents returned. The active recording lives in a
+context variable, so calls made through ``mongo.run_async`` by async views
+are attributed to their request as well.
+
+``MongoInstrumentationMiddleware`` turns the recording into a
+``Server-Timing`` header, logs slow requests and repeated same-shape queries
+(N+1 patterns), and feeds per-endpoint counters exposed at
+``/api/mongo/commands/``. Configured by ``settings.MONGO_INSTRUMENTATION``.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,
+    'N_PLUS_ONE_THRESHOLD': 10,
+    'MAX_RECORDED_COMMANDS': 1000,
+}
+
+# Commands whose repetition within one request points at a per-row lookup
+READ_COMMANDS = {'find', 'aggregate', 'count', 'distinct', 'findAndModify'}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'MONGO_INSTRUMENTATION', {})}
+
+
+def _filter_shape(command_name, command):
+    """Top-level filter keys of a command, without their values."""
+    if command_name in ('update', 'delete'):
+        statements = command.get('updates') or command.get('deletes') or [{}]
+        query = statements[0].get('q', {})
+    elif command_name == 'aggregate':
+        stages = command.get('pipeline') or [{}]
+        query = stages[0].get('$match', {})
+    else:
+        query = command.get('filter', command.get('query', {}))
+    return tuple(sorted(query)) if isinstance(query, dict) else ()
+
+
+def _documents_returned(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    if 'value' in reply:
+        return 1 if reply['value'] is not None else 0
+    return reply.get('n', 0)
+
+
+class RequestProfile:
+    """Mongo commands issued while handling one request."""
+
+    def __init__(self, max_commands):
+        self._lock = threading.Lock()
+        self.max_commands = max_commands
+        self.commands = []
+        self.command_count = 0
+        self.mongo_time = 0.0
+        self.pending = {}
+
+    def add(self, command):
+        with self._lock:
+            self.command_count += 1
+            self.mongo_time += command['duration_ms']
+            if len(self.commands) < self.max_commands:
+                self.commands.append(command)
+
+    def repeated_queries(self, threshold):
+        """``(command, collection, shape)`` keys issued at least ``threshold`` times."""
+        shapes = Counter(
+            (command['command'], command['collection'], command['shape'])
+            for command in self.commands
+            if command['command'] in READ_COMMANDS
+        )
+        return {key: count for key, count in shapes.items() if count >= threshold}
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """Records the current context's commands while a profile is active."""
+
+    def __init__(self):
+        self._profile = contextvars.ContextVar('mongo_profile', default=None)
+
+    @property
+    def profile(self):
+        return self._profile.get()
+
+    @contextmanager
+    def recording(self, max_commands=None):
+        """Record the commands issued in this context inside the ``with`` block."""
+        profile = RequestProfile(max_commands or DEFAULTS['MAX_RECORDED_COMMANDS'])
+        token = self._profile.set(profile)
+        try:
+            yield profile
+        finally:
+            self._profile.reset(token)
+
+    def started(self, event):
+        profile = self.profile
+        if profile is None:
+            return
+        command = event.command
+        name = event.command_name
+        collection = command.get('collection') if name == 'getMore' else command.get(name)
+        profile.pending[event.request_id] = {
+            'command': name,
+            'collection': collection if isinstance(collection, str) else None,
+            'shape': _filter_shape(name, command),
+        }
+
+    def _finish(self, event, documents, failed=False):
+        profile = self.profile
+        if profile is None:
+            return
+        command = profile.pending.pop(event.request_id, None)
+        if command is None:
+            return
+        command.update({
+            'duration_ms': event.duration_micros / 1000,
+            'documents': documents,
+            'failed': failed,
+        })
+        profile.add(command)
+
+    def succeeded(self, event):
+        self._finish(event, _documents_returned(event.reply))
+
+    def failed(self, event):
+        self._finish(event, 0, failed=True)
+
+
+class EndpointStats:
+    """Aggregate command counters per endpoint for this worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+    def add(self, endpoint, profile, elapsed_ms, slow, repeated):
+        with self._lock:
+            row = self.endpoints.setdefault(endpoint, {
+                'requests': 0,
+                'commands': 0,
+                'max_commands': 0,
+                'documents': 0,
+                'mongo_ms': 0.0,
+                'total_ms': 0.0,
+                'slow_requests': 0,
+                'n_plus_one_requests': 0,
+                'collections': Counter(),
+            })
+            row['requests'] += 1
+            row['commands'] += profile.command_count
+            row['max_commands'] = max(row['max_commands'], profile.command_count)
+            row['documents'] += sum(command['documents'] for command in profile.commands)
+            row['mongo_ms'] += profile.mongo_time
+            row['total_ms'] += elapsed_ms
+            row['slow_requests'] += int(slow)
+            row['n_plus_one_requests'] += int(bool(repeated))
+            row['collections'].update(
+                command['collection'] for command in profile.commands if command['collection']
+            )
+
+    def snapshot(self):
+        with self._lock:
+            report = {}
+            for endpoint, row in self.endpoints.items():
+                requests = row['requests']
+                report[endpoint] = {
+                    'requests': requests,
+                    'commands': row['commands'],
+                    'commands_per_request': round(row['commands'] / requests, 2),
+                    'max_commands': row['max_commands'],
+                    'documents': row['documents'],
+                    'mongo_ms_avg': round(row['mongo_ms'] / requests, 3),
+                    'total_ms_avg': round(row['total_ms'] / requests, 3),
+                    'slow_requests': row['slow_requests'],
+                    'n_plus_one_requests': row['n_plus_one_requests'],
+                    'collections': dict(row['collections']),
+                }
+            return report
+
+
+command_recorder = CommandRecorder()
+endpoint_stats = EndpointStats()
+monitoring.register(command_recorder)
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match is not None else 'unresolved'
+    return f'{request.method} {view}'
+
+
+class MongoInstrumentationMiddleware:
+    """Adds ``Server-Timing`` for MongoDB and records per-endpoint command stats.
+
+    Works under WSGI and ASGI. Commands issued while a streaming response is
+    iterated happen after the middleware returns and are not included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Same marker Django's MiddlewareMixin uses to run in async mode
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.config['ENABLED']:
+            return self.get_response(request)
+        started = time.perf_counter()
+        with command_recorder.recording(self.config['MAX_RECORDED_COMMANDS']) as profile:
+            request.mongo_profile = profile
+            response = self.get_response(request)
+        return self.process_profile(request, response, profile, started)
+
+    async def __acall__(self, request):
+        if not self.config['ENABLED']:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with command_recorder.recording(self.config['MAX_RECORDED_COMMANDS']) as profile:
+            request.mongo_profile = profile
+            response = await self.get_response(request)
+        return self.process_profile(request, response, profile, started)
+
+    def process_profile(self, request, response, profile, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        response['Server-Timing'] = (
+            f'mongo;dur={profile.mongo_time:.3f};desc="{profile.command_count} commands", '
+            f'app;dur={elapsed_ms:.3f}'
+        )
+
+        endpoint = endpoint_name(request)
+        slow = elapsed_ms >= self.config['SLOW_REQUEST_MS']
+        repeated = profile.repeated_queries(self.config['N_PLUS_ONE_THRESHOLD'])
+        endpoint_stats.add(endpoint, profile, elapsed_ms, slow, repeated)
+
+        if slow:
+            collections = Counter(command['collection'] for command in profile.commands)
+            logger.warning(
+                'Slow request %s %s: %.1f ms, %d Mongo commands (%.1f ms), by collection %s',
+                request.method, request.get_full_path(), elapsed_ms,
+                profile.command_count, profile.mongo_time, dict(collections),
+            )
+        for (command, collection, shape), count in repeated.items():
+            logger.warning(
+                'Possible N+1 in %s: %s on %s with filter %s ran %d times',
+                endpoint, command, collection, list(shape), count,
+            )
+        return response
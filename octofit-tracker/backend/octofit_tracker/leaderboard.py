@@ -0,0 +1,360 @@
+"""Incremental maintenance of the ``leaderboard`` collection.
+
+Each activity write applies an atomic ``$inc`` of its totals to the owner's
+leaderboard entry. Ranks use competition ranking on ``total_calories``
+(1 + number of entries with strictly more calories), so a change to one
+entry only shifts the ranks of entries whose calories lie between its old
+and new totals; that range is updated with a single indexed ``update_many``.
+Bulk writes (``apply_deltas()``, the outbox) do the same for every changed
+entry with ``shift_ranks()``.
+``rerank()`` recomputes every rank in one sorted index scan and is used to
+rebuild the board or repair drift.
+
+Entries carry the user's ``team_id`` and ``team_name`` so the list endpoint
+never has to read ``teams``; ``rename_team()`` and the user move in
+``partial_update`` keep them current, and ``team_drift()`` finds entries that
+disagree with the users and teams collections.
+
+``top_entries()`` and ``entries_around()`` read bounded slices of a board
+through the ``(rank, _id)`` index, so their cost does not grow with it.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+from .cache import bump_versions
+
+TOTAL_FIELDS = ('total_activities', 'total_calories', 'total_distance', 'total_duration')
+
+
+def activity_totals(activity, sign=1):
+    """Leaderboard delta contributed by one activity (a model or a raw doc)."""
+    if isinstance(activity, dict):
+        get = activity.get
+    else:
+        def get(field, default=None):
+            return getattr(activity, field, default)
+    return {
+        'total_activities': sign,
+        'total_calories': sign * (get('calories', 0) or 0),
+        'total_distance': sign * (get('distance', 0) or 0),
+        'total_duration': sign * (get('duration', 0) or 0),
+    }
+
+
+def add_totals(*deltas):
+    return {field: sum(delta[field] for delta in deltas) for field in TOTAL_FIELDS}
+
+
+def user_details(db, user_oids, users=None):
+    """``user_name``/``team_id``/``team_name`` for new leaderboard entries, keyed by user id.
+
+    ``users`` may hold already-loaded user documents to save a query.
+    """
+    user_oids = list(user_oids)
+    if users is None:
+        users = {
+            user['_id']: user
+            for user in db.users.find({'_id': {'$in': user_oids}}, {'name': 1, 'username': 1, 'team_id': 1})
+        }
+    team_ids = {}
+    team_names = {}
+    for team in db.teams.find({'members': {'$in': user_oids}}, {'team_id': 1, 'name': 1, 'members': 1}):
+        team_names[team.get('team_id')] = team.get('name')
+        for member in team.get('members', []):
+            team_ids.setdefault(member, team.get('team_id'))
+    unnamed = {user.get('team_id') for user in users.values()} - set(team_names) - {None}
+    if unnamed:
+        for team in db.teams.find({'team_id': {'$in': list(unnamed)}}, {'team_id': 1, 'name': 1}):
+            team_names[team.get('team_id')] = team.get('name')
+    details = {}
+    for user_oid in user_oids:
+        user = users.get(user_oid, {})
+        team_id = team_ids.get(user_oid, user.get('team_id'))
+        details[user_oid] = {
+            'user_name': user.get('name') or user.get('username', 'N/A'),
+            'team_id': team_id,
+            'team_name': team_names.get(team_id),
+        }
+    return details
+
+
+def apply_delta(db, user_id, delta):
+    """Atomically add ``delta`` to a user's totals and shift affected ranks.
+
+    Creates the user's entry on their first activity.
+    """
+    user_oid = ObjectId(str(user_id))
+    if not any(delta.values()):
+        return
+    before = db.leaderboard.find_one_and_update(
+        {'user_id': user_oid},
+        {
+            '$inc': delta,
+            '$set': {'last_updated': datetime.now()},
+        },
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+
+    if before is None:
+        db.leaderboard.update_one({'user_id': user_oid}, {'$set': user_details(db, [user_oid])[user_oid]})
+        old_calories = None
+        new_calories = delta['total_calories']
+    else:
+        old_calories = before.get('total_calories', 0)
+        new_calories = old_calories + delta['total_calories']
+
+    shift_ranks(db, {user_oid: (old_calories, new_calories)})
+    bump_versions(db, 'leaderboard')
+
+
+def _shift_others(db, others, old_calories, new_calories):
+    """Move the entries ``others`` selects that one entry passed going from ``old_calories`` to ``new_calories``."""
+    others = {'user_id': others}
+    if old_calories is None:
+        # New entry: everyone below it drops one place.
+        db.leaderboard.update_many(
+            {**others, 'total_calories': {'$lt': new_calories}}, {'$inc': {'rank': 1}}
+        )
+    elif new_calories > old_calories:
+        db.leaderboard.update_many(
+            {**others, 'total_calories': {'$gte': old_calories, '$lt': new_calories}},
+            {'$inc': {'rank': 1}},
+        )
+    else:
+        db.leaderboard.update_many(
+            {**others, 'total_calories': {'$gte': new_calories, '$lt': old_calories}},
+            {'$inc': {'rank': -1}},
+        )
+
+
+def shift_ranks(db, changes):
+    """Update ranks after entries' calories changed, touching only the ranges they crossed.
+
+    ``changes`` maps user ObjectIds to ``(old_calories, new_calories)``, with
+    ``old_calories`` None for new entries. Every other entry moves one place
+    per changed entry that crossed its calories, then each changed entry is
+    ranked by counting the entries above it. Returns the number of entries
+    whose calories changed.
+    """
+    moved = {
+        user_oid: (old_calories, new_calories)
+        for user_oid, (old_calories, new_calories) in changes.items()
+        if old_calories != new_calories
+    }
+    if not moved:
+        return 0
+    others = {'$nin': list(moved)} if len(moved) > 1 else {'$ne': next(iter(moved))}
+    for old_calories, new_calories in moved.values():
+        _shift_others(db, others, old_calories, new_calories)
+    db.leaderboard.bulk_write([
+        UpdateOne(
+            {'user_id': user_oid},
+            {'$set': {'rank': db.leaderboard.count_documents({'total_calories': {'$gt': new_calories}}) + 1}},
+        )
+        for user_oid, (_, new_calories) in moved.items()
+    ], ordered=False)
+    return len(moved)
+
+
+def shift_ranks_after_write(db, deltas, created):
+    """``shift_ranks()`` for ``deltas`` that were just added to the board.
+
+    The old calories are read back as the new totals minus the deltas (one
+    ``$in`` query); ``created`` holds the ``_id`` of the entries the write
+    upserted.
+    """
+    created = set(created)
+    changes = {}
+    for doc in db.leaderboard.find({'user_id': {'$in': list(deltas)}}, {'user_id': 1, 'total_calories': 1}):
+        calories = doc.get('total_calories', 0)
+        old_calories = calories - deltas[doc['user_id']].get('total_calories', 0)
+        changes[doc['user_id']] = (None if doc['_id'] in created else old_calories, calories)
+    return shift_ranks(db, changes)
+
+
+def apply_deltas(db, deltas, users=None):
+    """Apply many users' deltas with one ``bulk_write``, then shift the ranks they crossed.
+
+    ``deltas`` maps user ObjectIds to totals deltas; ``users`` is passed on to
+    ``user_details`` for entries that have to be created.
+    """
+    if not deltas:
+        return
+    details = user_details(db, deltas, users)
+    now = datetime.now()
+    operations = [
+        UpdateOne(
+            {'user_id': user_oid},
+            {
+                '$inc': delta,
+                '$set': {'last_updated': now},
+                '$setOnInsert': details[user_oid],
+            },
+            upsert=True,
+        )
+        for user_oid, delta in deltas.items()
+    ]
+    created = db.leaderboard.bulk_write(operations, ordered=False).upserted_ids.values()
+    shift_ranks_after_write(db, deltas, created)
+    bump_versions(db, 'leaderboard')
+
+
+def rebuild_totals(db, user_oids):
+    """Recompute the given users' totals from their activities (one aggregation).
+
+    Used after imports, where upserted activities may replace earlier values
+    and a delta is not known. Users without activities are left alone; ranks
+    are not touched, call ``rerank()`` afterwards.
+    """
+    user_oids = list(user_oids)
+    if not user_oids:
+        return 0
+    totals = {
+        doc.pop('_id'): doc
+        for doc in db.activities.aggregate([
+            {'$match': {'user_id': {'$in': user_oids}}},
+            {'$group': {
+                '_id': '$user_id',
+                'total_activities': {'$sum': 1},
+                'total_calories': {'$sum': {'$ifNull': ['$calories', 0]}},
+                'total_distance': {'$sum': {'$ifNull': ['$distance', 0]}},
+                'total_duration': {'$sum': {'$ifNull': ['$duration', 0]}},
+            }},
+        ])
+    }
+    if not totals:
+        return 0
+    details = user_details(db, totals)
+    now = datetime.now()
+    operations = [
+        UpdateOne(
+            {'user_id': user_oid},
+            {'$set': {**user_totals, 'last_updated': now}, '$setOnInsert': details[user_oid]},
+            upsert=True,
+        )
+        for user_oid, user_totals in totals.items()
+    ]
+    db.leaderboard.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def rerank(db, batch_size=1000):
+    """Recompute every rank from a single scan of the ``total_calories`` index."""
+    operations = []
+    updated = 0
+    rank = 0
+    previous = None
+    cursor = db.leaderboard.find({}, {'total_calories': 1, 'rank': 1}).sort(
+        'total_calories', DESCENDING
+    )
+    for position, doc in enumerate(cursor, start=1):
+        calories = doc.get('total_calories', 0)
+        if calories != previous:
+            rank = position
+            previous = calories
+        if doc.get('rank') != rank:
+            operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'rank': rank}}))
+        if len(operations) >= batch_size:
+            updated += db.leaderboard.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += db.leaderboard.bulk_write(operations, ordered=False).modified_count
+    if updated:
+        bump_versions(db, 'leaderboard')
+    return updated
+
+
+RANK_ORDER = [('rank', ASCENDING), ('_id', ASCENDING)]
+
+
+def top_entries(collection, query, limit, projection=None):
+    """The first ``limit`` entries by rank: one bounded scan of ``(rank, _id)``."""
+    return list(collection.find(query, projection).sort(RANK_ORDER).limit(limit))
+
+
+def entries_around(collection, query, user_oid, window, projection=None):
+    """A user's entry with up to ``window`` entries either side, in rank order.
+
+    Three bounded index reads (the user's entry, the ones above, the ones
+    from it down); ``None`` when the user is not on the board. ``query``
+    selects the board, e.g. a snapshot key for ``leaderboard_snapshots``.
+    """
+    anchor = collection.find_one({**query, 'user_id': user_oid}, {'rank': 1})
+    if anchor is None:
+        return None
+    rank, anchor_id = anchor.get('rank', 0), anchor['_id']
+    above = []
+    if window:
+        above = list(collection.find(
+            {**query, '$or': [{'rank': {'$lt': rank}}, {'rank': rank, '_id': {'$lt': anchor_id}}]},
+            projection,
+        ).sort([('rank', DESCENDING), ('_id', DESCENDING)]).limit(window))
+    below = collection.find(
+        {**query, '$or': [{'rank': {'$gt': rank}}, {'rank': rank, '_id': {'$gte': anchor_id}}]},
+        projection,
+    ).sort(RANK_ORDER).limit(window + 1)
+    return above[::-1] + list(below)
+
+
+def rename_team(db, team_id, name):
+    """Copy a team's (new) name onto its members' leaderboard entries."""
+    result = db.leaderboard.update_many(
+        {'team_id': team_id, 'team_name': {'$ne': name}}, {'$set': {'team_name': name}}
+    )
+    if result.modified_count:
+        bump_versions(db, 'leaderboard')
+    return result.modified_count
+
+
+def team_drift(db):
+    """Yield ``(entry, expected)`` for entries whose team differs from the user's.
+
+    The user's ``team_id`` field is the source of truth, falling back to the
+    team listing them as a member; ``expected`` holds ``team_id`` and
+    ``team_name``. Entries of deleted users are skipped.
+    """
+    names = {
+        team['team_id']: team.get('name')
+        for team in db.teams.find({}, {'team_id': 1, 'name': 1}) if 'team_id' in team
+    }
+    cursor = db.leaderboard.aggregate([
+        {'$project': {'user_id': 1, 'team_id': 1, 'team_name': 1}},
+        {'$lookup': {
+            'from': 'users', 'localField': 'user_id', 'foreignField': '_id',
+            'pipeline': [{'$project': {'team_id': 1}}], 'as': 'user',
+        }},
+        {'$lookup': {
+            'from': 'teams', 'localField': 'user_id', 'foreignField': 'members',
+            'pipeline': [{'$project': {'_id': 0, 'team_id': 1}}], 'as': 'member_of',
+        }},
+    ], allowDiskUse=True)
+    for entry in cursor:
+        if not entry['user']:
+            continue
+        user = entry['user'][0]
+        if 'team_id' in user:
+            team_id = user['team_id']
+        else:
+            team_id = entry['member_of'][0].get('team_id') if entry['member_of'] else None
+        expected = {'team_id': team_id, 'team_name': names.get(team_id)}
+        if entry.get('team_id') != team_id or entry.get('team_name') != expected['team_name']:
+            yield entry, expected
+
+
+def repair_team_drift(db, drift, batch_size=1000):
+    """Apply the ``expected`` values from ``team_drift()``; returns entries fixed."""
+    operations = []
+    repaired = 0
+    for entry, expected in drift:
+        operations.append(UpdateOne({'_id': entry['_id']}, {'$set': expected}))
+        if len(operations) >= batch_size:
+            repaired += db.leaderboard.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        repaired += db.leaderboard.bulk_write(operations, ordered=False).modified_count
+    if repaired:
+        bump_versions(db, 'leaderboard')
+    return repaired
@@ -0,0 +1,47 @@
+import json
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.analytics import activity_stats
+from octofit_tracker.mongo import get_db
+from octofit_tracker.utils import parse_iso_datetime
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the activity report statistics (duration percentiles per type, calorie '
+        'histogram, per-user streaks) for a window as JSON; defaults to the last 7 days'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Window start (ISO date, default 7 days before --end)')
+        parser.add_argument('--end', help='Window end, exclusive (ISO date, default now)')
+        parser.add_argument('--bin-width', type=int, default=100, help='Calories per histogram bin')
+        parser.add_argument('--top', type=int, default=10, help='Users listed by streak')
+        parser.add_argument('--output', help='Write the JSON to this path instead of stdout')
+
+    def handle(self, *args, **options):
+        end = self.parse_date(options['end'], '--end') if options['end'] else datetime.now()
+        start = self.parse_date(options['start'], '--start') if options['start'] else end - timedelta(days=7)
+        if start >= end:
+            raise CommandError('--start must be before --end')
+        if options['bin_width'] < 1 or options['top'] < 1:
+            raise CommandError('--bin-width and --top must be positive')
+
+        stats = activity_stats(get_db(), start, end, options['bin_width'], options['top'])
+        report = json.dumps(stats, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote statistics for {stats['activities']} activities to {options['output']}"
+            ))
+        else:
+            self.stdout.write(report)
+
+    def parse_date(self, value, option):
+        parsed = parse_iso_datetime(value)
+        if parsed is None:
+            raise CommandError(f'Invalid {option}: {value!r}')
+        return parsed
@@ -0,0 +1,153 @@
+import gc
+import math
+import random
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.analytics import PERCENTILES, ActivityColumns, compute_stats
+
+ACTIVITY_TYPES = ('Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing')
+
+
+def percentile(sorted_values, pct):
+    """Linearly interpolated percentile, as ``numpy.percentile`` computes it."""
+    position = pct / 100 * (len(sorted_values) - 1)
+    low = math.floor(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    below, above, fraction = sorted_values[low], sorted_values[high], position - low
+    if fraction >= 0.5:
+        return above - (above - below) * (1 - fraction)
+    return below + (above - below) * fraction
+
+
+def row_stats(docs, end, bin_width=100, top=10):
+    """The ``compute_stats`` report built the dict-per-row way, for comparison."""
+    rows = list(docs)
+    durations = {}
+    for row in rows:
+        durations.setdefault(row.get('activity_type'), []).append(float(row.get('duration') or 0))
+    percentiles = []
+    for name, values in durations.items():
+        values.sort()
+        entry = {'activity_type': name, 'count': len(values), 'mean': sum(values) / len(values)}
+        for pct in PERCENTILES:
+            entry[f'p{pct}'] = percentile(values, pct)
+        percentiles.append(entry)
+    percentiles.sort(key=lambda entry: str(entry['activity_type']))
+
+    bins = {}
+    for row in rows:
+        index = int((row.get('calories') or 0) // bin_width)
+        bins[index] = bins.get(index, 0) + 1
+    histogram = [
+        {'min': index * bin_width, 'max': (index + 1) * bin_width, 'count': bins[index]}
+        for index in sorted(bins)
+    ]
+
+    today = (end - datetime.resolution).toordinal()
+    days = {}
+    for row in rows:
+        days.setdefault(row.get('user_id'), set()).add(row['date'].toordinal())
+    users = []
+    for user_id, active in days.items():
+        longest = run = 0
+        previous = None
+        for day in sorted(active):
+            run = run + 1 if previous is not None and day == previous + 1 else 1
+            longest = max(longest, run)
+            previous = day
+        current = run if previous >= today - 1 else 0
+        users.append((user_id, longest, current))
+    # Ties keep first-seen order, which matches the columnar user codes
+    ranked = sorted(users, key=lambda user: (-user[1], -user[2]))[:top]
+    return {
+        'activities': len(rows),
+        'duration_percentiles': percentiles,
+        'calorie_histogram': histogram,
+        'streaks': {
+            'active_users': len(users),
+            'mean_longest': sum(user[1] for user in users) / len(users) if users else 0.0,
+            'top': [
+                {'user_id': str(user_id), 'longest': longest, 'current': current}
+                for user_id, longest, current in ranked
+            ],
+        },
+    }
+
+
+def columnar_stats(docs, end, bin_width=100, top=10):
+    return compute_stats(ActivityColumns.from_documents(docs), end, bin_width, top)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the columnar activity statistics (array buffers + NumPy) against building '
+        'the same report from one dict per row, on synthetic activities (no database needed)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Activities per run')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=28, help='Spread activity dates over this many days')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the best is reported')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if min(options['rows'], options['users'], options['days'], options['repeat']) < 1:
+            raise CommandError('--rows, --users, --days and --repeat must be positive')
+        end = datetime(2024, 2, 1)
+        user_ids = [ObjectId() for _ in range(options['users'])]
+
+        def documents():
+            # Fresh dicts per run, the way a cursor hands them over
+            rng = random.Random(options['seed'])
+            for _ in range(options['rows']):
+                yield {
+                    'user_id': rng.choice(user_ids),
+                    'activity_type': rng.choice(ACTIVITY_TYPES),
+                    'duration': float(rng.randint(10, 120)),
+                    'calories': rng.randint(50, 900),
+                    'date': end - timedelta(days=rng.randint(1, options['days'])),
+                }
+
+        # Generating the documents stands in for the cursor; its cost is subtracted
+        generate = min(self.timed(lambda: deque(documents(), maxlen=0)) for _ in range(options['repeat']))
+        results = {}
+        outputs = {}
+        for name, build in (('rows', row_stats), ('columnar', columnar_stats)):
+            best = min(self.timed(lambda: build(documents(), end)) for _ in range(options['repeat']))
+            best = max(best - generate, 1e-9)
+            outputs[name], peak = self.peak_memory(lambda: build(documents(), end))
+            results[name] = (options['rows'] / best, peak)
+            self.stdout.write(
+                f'{name:<9} {options["rows"] / best:>12,.0f} rows/s  peak {peak / 2 ** 20:>8.1f} MiB'
+            )
+
+        if outputs['rows'] != outputs['columnar']:
+            raise CommandError('The columnar and dict-per-row reports differ')
+        speedup = results['columnar'][0] / results['rows'][0]
+        memory = results['rows'][1] / max(results['columnar'][1], 1)
+        self.stdout.write(self.style.SUCCESS(
+            f'columnar is {speedup:.1f}x the rows/s of dict-per-row with {memory:.1f}x less peak memory; '
+            'reports match'
+        ))
+
+    def timed(self, run):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        return time.perf_counter() - started
+
+    def peak_memory(self, run):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = run()
+            return result, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,358 @@
+import asyncio
+import io
+import itertools
+import json
+import math
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from octofit_tracker.mongo import command_counter, get_db
+
+PATHS = {
+    'users': '/api/users/',
+    'teams': '/api/teams/',
+    'activities': '/api/activities/',
+    'leaderboard': '/api/leaderboard/',
+    'leaderboard_top': '/api/leaderboard/?top=10',
+    'workouts': '/api/workouts/',
+    # Async views (pymongo via mongo.run_async); see --compare-async
+    'async_teams': '/api/async/teams/',
+    'async_leaderboard': '/api/async/leaderboard/',
+    'async_workouts': '/api/async/workouts/',
+}
+ENDPOINTS = tuple(PATHS) + ('partial_update',)
+# Sync endpoint -> async endpoint serving the same payload
+ASYNC_PAIRS = {
+    'teams': 'async_teams',
+    'leaderboard': 'async_leaderboard',
+    'workouts': 'async_workouts',
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class InProcessTransport:
+    """Sends requests through Django's test client, one client per thread."""
+    mode = 'in-process'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(SERVER_NAME='localhost')
+        before = command_counter.thread_count()
+        if method == 'PATCH':
+            response = client.patch(path, json.dumps(body), content_type='application/json')
+        else:
+            response = client.get(path, HTTP_ACCEPT='application/json')
+        return response.status_code, command_counter.thread_count() - before
+
+
+class ASGIInProcessTransport:
+    """Sends requests through Django's ASGI handler on one event loop.
+
+    Concurrency comes from tasks, not threads, which is how an ASGI server
+    runs the async views. Mongo command counts are not available: the
+    commands run on ``run_async`` executor threads.
+    """
+    mode = 'asgi-in-process'
+    is_async = True
+
+    def __init__(self):
+        self.client = AsyncClient(SERVER_NAME='localhost')
+
+    async def request(self, method, path, body=None):
+        response = await self.client.get(path, HTTP_ACCEPT='application/json')
+        return response.status_code, None
+
+
+class HTTPTransport:
+    """Sends requests to a running server; Mongo command counts are not available."""
+    mode = 'http'
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as exc:
+            return exc.code, None
+        except urllib.error.URLError:
+            return 0, None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the REST API: drive each endpoint at a fixed concurrency and report '
+        'p50/p95/p99 latency, throughput and Mongo commands per request. GET endpoints are '
+        'measured twice: with a distinct query string per request, so every response is built '
+        '(NAME), and with one repeated URL, so the response cache serves it (NAME:cached). '
+        'Results are written as JSON and can be compared against a stored baseline. '
+        'With --compare-async the sync endpoints (WSGI) are measured against their async '
+        'versions (ASGI) at the same concurrency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Seeded users (see populate_db)')
+        parser.add_argument('--teams', type=int, default=10, help='Seeded teams')
+        parser.add_argument('--activities-per-user', default='5', help='Seeded activities per user')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for data and requests')
+        parser.add_argument('--seed-data', action='store_true',
+                            help='First DELETE everything in the configured database and seed it with '
+                                 'populate_db; without it the existing data is benchmarked as is')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent workers')
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS,
+                            help='Only benchmark this endpoint (repeatable)')
+        parser.add_argument('--url', help='Base URL of a running server; default is in-process')
+        parser.add_argument('--compare-async', action='store_true',
+                            help='Compare the sync endpoints under WSGI with their async versions under '
+                                 'ASGI at the same concurrency (in-process, or --url and --asgi-url)')
+        parser.add_argument('--asgi-url',
+                            help='Base URL of an ASGI server (e.g. uvicorn) for --compare-async; '
+                                 '--url is then the WSGI server')
+        parser.add_argument('--output', help='Write the results JSON to this path')
+        parser.add_argument('--baseline', help='Compare against this results JSON and fail on regressions')
+        parser.add_argument('--tolerance', type=float, default=20.0,
+                            help='Allowed p95 latency / throughput regression in percent (default 20)')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if options['asgi_url'] and not (options['compare_async'] and options['url']):
+            raise CommandError('--asgi-url needs --compare-async and --url (the WSGI server)')
+        if options['compare_async'] and options['url'] and not options['asgi_url']:
+            raise CommandError('--compare-async with --url also needs --asgi-url')
+        self.rng = random.Random(options['seed'])
+        self.request_ids = itertools.count(1)
+
+        if options['seed_data']:
+            self.stdout.write(f'Replacing database {get_db().name} with the benchmark dataset...')
+            call_command(
+                'populate_db', users=options['users'], teams=options['teams'],
+                activities_per_user=options['activities_per_user'], seed=options['seed'],
+                stdout=self.stdout if options['verbosity'] > 1 else io.StringIO(),
+            )
+
+        db = get_db()
+        self.user_ids = [str(doc['_id']) for doc in db.users.find({}, {'_id': 1}).limit(10000)]
+        self.team_ids = [doc['team_id'] for doc in db.teams.find({}, {'team_id': 1}) if 'team_id' in doc]
+        transport = HTTPTransport(options['url']) if options['url'] else InProcessTransport()
+
+        results = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'mode': transport.mode,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'dataset': {
+                    'users': db.users.estimated_document_count(),
+                    'teams': db.teams.estimated_document_count(),
+                    'activities': db.activities.estimated_document_count(),
+                },
+            },
+            'endpoints': {},
+        }
+        if options['compare_async']:
+            async_transport = HTTPTransport(options['asgi_url']) if options['asgi_url'] else ASGIInProcessTransport()
+            results['meta']['async_mode'] = async_transport.mode
+            results['comparison'] = self.compare_async(
+                transport, async_transport, options['endpoint'], options['requests'], options['concurrency'],
+                results['endpoints'],
+            )
+        else:
+            for name in options['endpoint'] or ENDPOINTS:
+                results['endpoints'][name] = self.run_endpoint(
+                    transport, name, options['requests'], options['concurrency']
+                )
+                self.report(name, results['endpoints'][name])
+                if name in PATHS:
+                    cached = f'{name}:cached'
+                    results['endpoints'][cached] = self.run_endpoint(
+                        transport, name, options['requests'], options['concurrency'], cached=True
+                    )
+                    self.report(cached, results['endpoints'][cached])
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+        if options['baseline']:
+            with open(options['baseline']) as fh:
+                baseline = json.load(fh)
+            regressions = self.compare(baseline, results, options['tolerance'])
+            for message in regressions:
+                self.stdout.write(self.style.ERROR(message))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+
+    def make_request(self, name, cached=False):
+        """One request for ``name``; unless ``cached``, GETs get a query string no other request has."""
+        if name == 'partial_update':
+            if not self.user_ids or not self.team_ids:
+                raise CommandError('partial_update needs users and teams (see --seed-data)')
+            user_id = self.rng.choice(self.user_ids)
+            return 'PATCH', f'/api/users/{user_id}/', {'team_id': self.rng.choice(self.team_ids)}
+        path = PATHS[name]
+        if not cached:
+            # The response cache keys on the full URL, so this request is built from MongoDB
+            path += f"{'&' if '?' in path else '?'}bench={next(self.request_ids)}"
+        return 'GET', path, None
+
+    def compare_async(self, transport, async_transport, endpoints, total, concurrency, rows):
+        """Run each sync endpoint and its async twin; returns the async/sync ratios.
+
+        Both sides cache the same way, and every request has its own query string,
+        so the ratios compare building the response rather than cache hits.
+        """
+        comparison = {}
+        for name, async_name in ASYNC_PAIRS.items():
+            if endpoints and name not in endpoints and async_name not in endpoints:
+                continue
+            rows[name] = self.run_endpoint(transport, name, total, concurrency)
+            self.report(name, rows[name])
+            rows[async_name] = self.run_endpoint(async_transport, async_name, total, concurrency)
+            self.report(async_name, rows[async_name])
+            sync_row, async_row = rows[name], rows[async_name]
+            comparison[name] = {
+                'throughput_ratio': round(async_row['throughput_rps'] / sync_row['throughput_rps'], 2),
+                'p95_ratio': round(async_row['p95_ms'] / sync_row['p95_ms'], 2) if sync_row['p95_ms'] else None,
+            }
+            self.stdout.write(
+                f"{name:<15} {transport.mode} -> {async_transport.mode}: "
+                f"{comparison[name]['throughput_ratio']}x throughput, "
+                f"{comparison[name]['p95_ratio']}x p95 latency"
+            )
+        return comparison
+
+    def run_endpoint(self, transport, name, total, concurrency, cached=False):
+        requests = [self.make_request(name, cached) for _ in range(total)]
+        # Warm up connections (and, for cached runs, the response cache) before measuring
+        warmup = requests[0] if cached else self.make_request(name)
+        if getattr(transport, 'is_async', False):
+            return asyncio.run(self.run_endpoint_async(transport, warmup, requests, concurrency))
+        transport.request(*warmup)
+
+        latencies = []
+        commands = []
+        errors = 0
+        lock = threading.Lock()
+
+        def send(request):
+            nonlocal errors
+            started = time.perf_counter()
+            status_code, mongo_commands = transport.request(*request)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if mongo_commands is not None:
+                    commands.append(mongo_commands)
+                if not 200 <= status_code < 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(send, requests))
+        wall = time.perf_counter() - started
+        return self.summarize(latencies, commands, errors, wall)
+
+    async def run_endpoint_async(self, transport, warmup, requests, concurrency):
+        """``run_endpoint`` for an async transport: ``concurrency`` tasks on one event loop."""
+        await transport.request(*warmup)
+        latencies = []
+        errors = 0
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(request):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                status_code, _ = await transport.request(*request)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if not 200 <= status_code < 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(request) for request in requests))
+        wall = time.perf_counter() - started
+        return self.summarize(latencies, [], errors, wall)
+
+    def summarize(self, latencies, commands, errors, wall):
+        total = len(latencies)
+        latencies.sort()
+        return {
+            'requests': total,
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'throughput_rps': round(total / wall, 2),
+            'mongo_commands_per_request': round(statistics.fmean(commands), 2) if commands else None,
+        }
+
+    def report(self, name, row):
+        commands = row['mongo_commands_per_request']
+        self.stdout.write(
+            f"{name:<24} p50 {row['p50_ms']:>8.2f} ms  p95 {row['p95_ms']:>8.2f} ms  "
+            f"p99 {row['p99_ms']:>8.2f} ms  {row['throughput_rps']:>8.1f} req/s  "
+            f"mongo/req {commands if commands is not None else '-':>6}  errors {row['errors']}"
+        )
+
+    def compare(self, baseline, results, tolerance):
+        """Return a message per metric that regressed beyond ``tolerance`` percent."""
+        factor = tolerance / 100
+        regressions = []
+        for name, current in results['endpoints'].items():
+            previous = baseline.get('endpoints', {}).get(name)
+            if not previous:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + factor):
+                regressions.append(
+                    f"{name}: p95 {current['p95_ms']} ms vs baseline {previous['p95_ms']} ms"
+                )
+            if current['throughput_rps'] < previous['throughput_rps'] * (1 - factor):
+                regressions.append(
+                    f"{name}: throughput {current['throughput_rps']} req/s "
+                    f"vs baseline {previous['throughput_rps']} req/s"
+                )
+            if (
+                current['mongo_commands_per_request'] is not None
+                and previous.get('mongo_commands_per_request') is not None
+                and current['mongo_commands_per_request'] > previous['mongo_commands_per_request']
+            ):
+                regressions.append(
+                    f"{name}: {current['mongo_commands_per_request']} Mongo commands/request "
+                    f"vs baseline {previous['mongo_commands_per_request']}"
+                )
+            if current['errors'] > previous.get('errors', 0):
+                regressions.append(f"{name}: {current['errors']} errors vs baseline {previous.get('errors', 0)}")
+        return regressions
@@ -0,0 +1,82 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from octofit_tracker.fast_serializers import activity_row, user_row
+from octofit_tracker.models import Activity, OctoFitUser
+from octofit_tracker.renderers import ORJSONRenderer
+from octofit_tracker.serializers import ActivitySerializer, OctoFitUserSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare rows/sec of the DRF serializers + JSONRenderer against the raw-document '
+        'fast path + ORJSONRenderer on synthetic users and activities (no database needed)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows per run')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the best is reported')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rows = options['rows']
+        now = datetime(2024, 1, 1)
+
+        user_docs = [{
+            '_id': ObjectId(),
+            'name': f'Athlete {i}',
+            'username': f'athlete{i}',
+            'email': f'athlete{i}@octofit.example',
+            'password': 'hashed_password',
+            'age': rng.randint(13, 18),
+        } for i in range(max(rows // 10, 1))]
+        activity_docs = [{
+            '_id': ObjectId(),
+            'user_id': rng.choice(user_docs)['_id'],
+            'activity_type': rng.choice(['Running', 'Cycling', 'Swimming']),
+            'duration': float(rng.randint(15, 120)),
+            'distance': round(rng.uniform(1, 25), 2),
+            'calories': rng.randint(100, 800),
+            'date': now - timedelta(days=rng.randint(0, 30)),
+        } for _ in range(rows)]
+
+        # The same rows as unsaved model instances, as the ORM would hand them to DRF
+        users = {doc['_id']: OctoFitUser(**doc) for doc in user_docs}
+        activities = [Activity(
+            _id=doc['_id'], user=users[doc['user_id']], activity_type=doc['activity_type'],
+            duration=doc['duration'], distance=doc['distance'], calories=doc['calories'],
+            date=doc['date'].date(),
+        ) for doc in activity_docs]
+        user_map = {doc['_id']: doc for doc in user_docs}
+
+        cases = [
+            ('users', 'drf', len(users),
+             lambda: JSONRenderer().render(OctoFitUserSerializer(list(users.values()), many=True).data)),
+            ('users', 'fast', len(user_docs),
+             lambda: ORJSONRenderer().render([user_row(doc) for doc in user_docs])),
+            ('activities', 'drf', rows,
+             lambda: JSONRenderer().render(ActivitySerializer(activities, many=True).data)),
+            ('activities', 'fast', rows,
+             lambda: ORJSONRenderer().render([activity_row(doc, user_map) for doc in activity_docs])),
+        ]
+
+        results = {}
+        for name, path, count, run in cases:
+            best = min(self.timed(run) for _ in range(options['repeat']))
+            results[name, path] = count / best
+            self.stdout.write(f'{name:<11} {path:<5} {count / best:>12,.0f} rows/s')
+
+        for name in ('users', 'activities'):
+            speedup = results[name, 'fast'] / results[name, 'drf']
+            self.stdout.write(self.style.SUCCESS(f'{name}: fast path is {speedup:.1f}x the DRF serializers'))
+
+    def timed(self, run):
+        started = time.perf_counter()
+        run()
+        return time.perf_counter() - started
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from octofit_tracker.leaderboard import repair_team_drift, team_drift
+from octofit_tracker.mongo import get_db
+
+
+class Command(BaseCommand):
+    help = (
+        "Find leaderboard entries whose denormalized team_id/team_name disagree with "
+        "the user's team, and optionally repair them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Rewrite the drifted entries')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--show', type=int, default=10, help='Drifted entries to list (default 10)')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        drift = list(team_drift(db))
+        for entry, expected in drift[:options['show']]:
+            self.stdout.write(
+                f"  {entry['user_id']}: team {entry.get('team_id')!r} / {entry.get('team_name')!r}"
+                f" -> {expected['team_id']!r} / {expected['team_name']!r}"
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Leaderboard teams are consistent'))
+            return
+        if not options['repair']:
+            self.stdout.write(self.style.WARNING(
+                f'{len(drift)} drifted leaderboard entries; run with --repair to fix them'
+            ))
+            return
+        repaired = repair_team_drift(db, drift, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} leaderboard entries'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.indexes import INDEXES, ensure_indexes, index_usage, missing_indexes
+from octofit_tracker.mongo import get_db
+
+
+class Command(BaseCommand):
+    help = 'Create the registered MongoDB indexes (safe to run repeatedly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collection', action='append', choices=sorted(INDEXES),
+            help='Only handle this collection (repeatable)',
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only list missing indexes; exit with an error if any are missing',
+        )
+        parser.add_argument(
+            '--report', action='store_true',
+            help='Print $indexStats usage counters instead of building indexes',
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+        collections = options['collection']
+
+        if options['report']:
+            for row in index_usage(db, collections):
+                since = row['since'].isoformat() if row['since'] else '-'
+                self.stdout.write(f"{row['collection']}.{row['name']}: {row['ops']} ops since {since}")
+            return
+
+        if options['check']:
+            missing = missing_indexes(db, collections)
+            for collection, model in missing:
+                self.stdout.write(self.style.WARNING(f"Missing index {collection}.{model.document['name']}"))
+            if missing:
+                raise CommandError(f'{len(missing)} registered index(es) missing')
+            self.stdout.write(self.style.SUCCESS('All registered indexes exist'))
+            return
+
+        created = ensure_indexes(db, collections)
+        for name in created:
+            self.stdout.write(self.style.SUCCESS(f'Created index {name}'))
+        if not created:
+            self.stdout.write(self.style.SUCCESS('All registered indexes already exist'))
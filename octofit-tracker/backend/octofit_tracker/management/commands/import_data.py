@@ -0,0 +1,89 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.cache import bump_versions
+from octofit_tracker.importer import CHUNK_SIZE, COLLECTIONS, FORMATS, import_file
+from octofit_tracker.indexes import ensure_indexes
+from octofit_tracker.leaderboard import rerank
+from octofit_tracker.mongo import get_db
+from octofit_tracker.outbox import process_events
+
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream NDJSON or CSV files of teams, users, activities and workouts into MongoDB, '
+        'upserting on natural keys in batched bulk writes. Progress is checkpointed after '
+        'every batch, so re-running an interrupted import resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        for collection in COLLECTIONS:
+            parser.add_argument(f'--{collection}', action='append', default=[], metavar='PATH',
+                                help=f'File of {collection} to import (repeatable)')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='File format (default: from the extension, .csv or .ndjson, optionally .gz)')
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE, help='Records per bulk_write')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore saved checkpoints and import the files from the start')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        files = [(collection, path) for collection in COLLECTIONS for path in options[collection]]
+        if not files:
+            raise CommandError(f"Nothing to import; pass --{' / --'.join(COLLECTIONS)}")
+        for _, path in files:
+            if not os.path.isfile(path):
+                raise CommandError(f'No such file: {path}')
+
+        db = get_db()
+        ensure_indexes(db, [collection for collection, _ in files] + ['leaderboard'])
+        if options['activities']:
+            # Totals are recomputed from the activities, so apply queued deltas first
+            process_events(db)
+
+        failed = 0
+        for collection, path in files:
+            try:
+                summary = import_file(
+                    db, collection, path, fmt=options['format'], chunk_size=options['batch_size'],
+                    resume=not options['restart'], progress=self.report_progress,
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            failed += len(summary['errors'])
+            self.report_summary(summary)
+
+        if options['activities']:
+            rerank(db)
+        bump_versions(db, *{collection for collection, _ in files}, 'leaderboard')
+        message = f'Import finished with {failed} rejected record(s)'
+        self.stdout.write(self.style.WARNING(message) if failed else self.style.SUCCESS(message))
+
+    def report_progress(self, summary):
+        done = summary['position'] - summary['resumed_from']
+        rate = done / summary['elapsed'] if summary['elapsed'] else 0
+        self.stdout.write(
+            f"  {summary['collection']}: {summary['position']:,} records, "
+            f"{summary['written']:,} written ({rate:,.0f} rows/s)"
+        )
+
+    def report_summary(self, summary):
+        if summary['skipped']:
+            self.stdout.write(f"{summary['path']}: already imported (use --restart to import it again)")
+            return
+        if summary['resumed_from']:
+            self.stdout.write(f"{summary['path']}: resumed after record {summary['resumed_from']:,}")
+        for error in summary['errors'][:MAX_ERRORS_SHOWN]:
+            self.stdout.write(self.style.ERROR(f"  record {error['record']}: {error['errors']}"))
+        if len(summary['errors']) > MAX_ERRORS_SHOWN:
+            self.stdout.write(self.style.ERROR(f"  ... {len(summary['errors']) - MAX_ERRORS_SHOWN} more"))
+        done = summary['position'] - summary['resumed_from']
+        rate = done / summary['elapsed'] if summary['elapsed'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['written']:,} {summary['collection']} from {summary['path']} "
+            f"in {summary['elapsed']:.1f}s ({rate:,.0f} rows/s)"
+        ))
@@ -1,16 +1,168 @@
-from django.core.management.base import BaseCommand
-from pymongo import MongoClient, ASCENDING
+from django.core.management.base import BaseCommand, CommandError
+from bson import ObjectId
+from octofit_tracker.mongo import get_db, close_client
+from octofit_tracker.cache import bump_versions
+from octofit_tracker.indexes import ensure_indexes
+from octofit_tracker.leaderboard import rerank
 from datetime import datetime, timedelta
 import random
+import time
+
+# Sample data - Superheroes; the first users and teams are always these
+HEROES = [
+    ('Iron Man', 'tony.stark@marvel.com'),
+    ('Captain America', 'steve.rogers@marvel.com'),
+    ('Thor', 'thor.odinson@marvel.com'),
+    ('Black Widow', 'natasha.romanoff@marvel.com'),
+    ('Hulk', 'bruce.banner@marvel.com'),
+    ('Batman', 'bruce.wayne@dc.com'),
+    ('Superman', 'clark.kent@dc.com'),
+    ('Wonder Woman', 'diana.prince@dc.com'),
+    ('Flash', 'barry.allen@dc.com'),
+    ('Aquaman', 'arthur.curry@dc.com'),
+]
+
+TEAMS = [
+    ('Team Marvel', 'Earth\'s Mightiest Heroes'),
+    ('Team DC', 'Justice League'),
+]
+
+ACTIVITY_TYPES = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing']
+
+WORKOUTS = [
+    {
+        'title': 'Super Soldier Strength Training',
+        'description': 'Build strength like Captain America',
+        'difficulty': 'Advanced',
+        'duration': 60,
+        'exercises': [
+            'Push-ups: 4 sets of 25',
+            'Pull-ups: 4 sets of 15',
+            'Squats: 4 sets of 30',
+            'Bench Press: 4 sets of 12',
+            'Deadlifts: 4 sets of 10'
+        ],
+        'recommended_for': ['strength', 'muscle building']
+    },
+    {
+        'title': 'Speedster Cardio Blast',
+        'description': 'Run fast like The Flash',
+        'difficulty': 'Intermediate',
+        'duration': 45,
+        'exercises': [
+            'Sprint intervals: 10x100m',
+            'Jumping jacks: 3 sets of 50',
+            'Burpees: 3 sets of 20',
+            'Mountain climbers: 3 sets of 30',
+            'Cool down jog: 10 minutes'
+        ],
+        'recommended_for': ['cardio', 'speed', 'endurance']
+    },
+    {
+        'title': 'Warrior Princess Workout',
+        'description': 'Train like Wonder Woman',
+        'difficulty': 'Advanced',
+        'duration': 75,
+        'exercises': [
+            'Sword swings (or similar): 3 sets of 20',
+            'Shield raises: 3 sets of 25',
+            'Lunges: 4 sets of 15 per leg',
+            'Planks: 4 sets of 90 seconds',
+            'Battle rope: 3 sets of 45 seconds'
+        ],
+        'recommended_for': ['strength', 'endurance', 'agility']
+    },
+    {
+        'title': 'Zen Master Flexibility',
+        'description': 'Find your inner peace with yoga',
+        'difficulty': 'Beginner',
+        'duration': 30,
+        'exercises': [
+            'Sun salutations: 5 rounds',
+            'Warrior poses: Hold each for 1 minute',
+            'Tree pose: 1 minute per side',
+            'Child\'s pose: 3 minutes',
+            'Meditation: 5 minutes'
+        ],
+        'recommended_for': ['flexibility', 'balance', 'mindfulness']
+    },
+    {
+        'title': 'Aquatic Endurance Training',
+        'description': 'Train like the King of Atlantis',
+        'difficulty': 'Intermediate',
+        'duration': 60,
+        'exercises': [
+            'Swimming laps: 20 lengths',
+            'Underwater sprints: 5 sets',
+            'Water treading: 10 minutes',
+            'Pool-edge push-ups: 3 sets of 15',
+            'Water resistance training: 20 minutes'
+        ],
+        'recommended_for': ['swimming', 'endurance', 'full body']
+    },
+    {
+        'title': 'Dark Knight HIIT',
+        'description': 'High intensity training for vigilant heroes',
+        'difficulty': 'Advanced',
+        'duration': 40,
+        'exercises': [
+            'Box jumps: 4 sets of 20',
+            'Kettlebell swings: 4 sets of 25',
+            'Medicine ball slams: 4 sets of 15',
+            'Battle ropes: 4 sets of 45 seconds',
+            'Tire flips: 3 sets of 10'
+        ],
+        'recommended_for': ['HIIT', 'strength', 'power']
+    },
+]
+
+
+def activity_count_range(value):
+    """Parse ``N`` or ``MIN-MAX`` for --activities-per-user."""
+    try:
+        low, _, high = value.partition('-')
+        low = int(low)
+        high = int(high) if high else low
+    except ValueError:
+        raise CommandError(f'Invalid --activities-per-user value: {value!r}')
+    if low < 0 or high < low:
+        raise CommandError(f'Invalid --activities-per-user range: {value!r}')
+    return low, high
 
 
 class Command(BaseCommand):
-    help = 'Populate the octofit_db database with test data'
+    help = (
+        'Replace the octofit_db database with generated test data (scalable for load testing). '
+        'Wipes every collection first; use import_data to load real data in place.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=len(HEROES),
+                            help='Number of users; beyond the 10 heroes, synthetic athletes are generated')
+        parser.add_argument('--teams', type=int, default=len(TEAMS),
+                            help='Number of teams; users are split into contiguous blocks')
+        parser.add_argument('--activities-per-user', default='3-7',
+                            help='Activities per user, as N or MIN-MAX (default 3-7)')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Spread activity dates over this many past days')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed for a reproducible dataset')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Documents per insert_many call')
 
     def handle(self, *args, **options):
+        num_users = options['users']
+        num_teams = options['teams']
+        if num_users < 1 or num_teams < 1 or options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--users, --teams, --days and --batch-size must be positive')
+        min_activities, max_activities = activity_count_range(options['activities_per_user'])
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.days = options['days']
+        self.now = datetime.now()
+
         # Connect to MongoDB
-        client = MongoClient('localhost', 27017)
-        db = client['octofit_db']
+        db = get_db()
 
         self.stdout.write(self.style.SUCCESS('Connected to MongoDB'))
 
@@ -20,267 +172,137 @@ class Command(BaseCommand):
         db.teams.delete_many({})
         db.activities.delete_many({})
         db.leaderboard.delete_many({})
+        db.leaderboard_snapshots.delete_many({})
+        db.activity_events.delete_many({})
         db.workouts.delete_many({})
 
-        # Create unique index on email field
-        db.users.create_index([("email", ASCENDING)], unique=True)
-        self.stdout.write(self.style.SUCCESS('Created unique index on email field'))
+        started = time.monotonic()
 
-        # Sample data - Superheroes
-        marvel_heroes = [
-            {
-                'name': 'Iron Man',
-                'email': 'tony.stark@marvel.com',
-                'password': 'hashed_password',
-                'team_id': 1,
-                'created_at': datetime.now()
-            },
-            {
-                'name': 'Captain America',
-                'email': 'steve.rogers@marvel.com',
-                'password': 'hashed_password',
-                'team_id': 1,
-                'created_at': datetime.now()
-            },
-            {
-                'name': 'Thor',
-                'email': 'thor.odinson@marvel.com',
-                'password': 'hashed_password',
-                'team_id': 1,
-                'created_at': datetime.now()
-            },
-            {
-                'name': 'Black Widow',
-                'email': 'natasha.romanoff@marvel.com',
-                'password': 'hashed_password',
-                'team_id': 1,
-                'created_at': datetime.now()
-            },
-            {
-                'name': 'Hulk',
-                'email': 'bruce.banner@marvel.com',
-                'password': 'hashed_password',
-                'team_id': 1,
-                'created_at': datetime.now()
-            },
-        ]
+        # Insert teams; members are pushed as each chunk of users is inserted
+        teams = []
+        for team_id in range(1, num_teams + 1):
+            name, description = TEAMS[team_id - 1] if team_id <= len(TEAMS) else (f'Team {team_id}', '')
+            teams.append({
+                'team_id': team_id,
+                'name': name,
+                'description': description,
+                'created_at': self.now,
+                'members': [],
+            })
+        db.teams.insert_many(teams)
+        team_names = {team['team_id']: team['name'] for team in teams}
+        self.stdout.write(self.style.SUCCESS(f'Inserted {num_teams} teams'))
 
-        dc_heroes = [
-            {
-                'name': 'Batman',
-                'email': 'bruce.wayne@dc.com',
-                'password': 'hashed_password',
-                'team_id': 2,
-                'created_at': datetime.now()
-            },
-            {
-                'name': 'Superman',
-                'email': 'clark.kent@dc.com',
-                'password': 'hashed_password',
-                'team_id': 2,
-                'created_at': datetime.now()
-            },
-            {
-                'name': 'Wonder Woman',
-                'email': 'diana.prince@dc.com',
-                'password': 'hashed_password',
-                'team_id': 2,
-                'created_at': datetime.now()
-            },
-            {
-                'name': 'Flash',
-                'email': 'barry.allen@dc.com',
-                'password': 'hashed_password',
-                'team_id': 2,
-                'created_at': datetime.now()
-            },
-            {
-                'name': 'Aquaman',
-                'email': 'arthur.curry@dc.com',
-                'password': 'hashed_password',
-                'team_id': 2,
-                'created_at': datetime.now()
-            },
-        ]
+        # Insert users, their activities and their leaderboard entries chunk by chunk.
+        # Each user's totals are summed while their activities are generated, so
+        # the rollup is a single pass that never holds more than one chunk.
+        activities = []
+        leaderboard = []
+        total_activities = 0
+        for chunk_start in range(0, num_users, self.batch_size):
+            users = [
+                self.make_user(index, num_users, num_teams)
+                for index in range(chunk_start, min(chunk_start + self.batch_size, num_users))
+            ]
+            db.users.insert_many(users, ordered=False)
+            members = {}
+            for user in users:
+                members.setdefault(user['team_id'], []).append(user['_id'])
+            for team_id, member_ids in members.items():
+                db.teams.update_one({'team_id': team_id}, {'$push': {'members': {'$each': member_ids}}})
 
-        # Insert users
-        all_users = marvel_heroes + dc_heroes
-        result = db.users.insert_many(all_users)
-        user_ids = result.inserted_ids
-        self.stdout.write(self.style.SUCCESS(f'Inserted {len(user_ids)} users'))
+            for user in users:
+                entry = {
+                    'user_id': user['_id'],
+                    'user_name': user['name'],
+                    'team_id': user['team_id'],
+                    'team_name': team_names[user['team_id']],
+                    'total_activities': 0,
+                    'total_calories': 0,
+                    'total_distance': 0,
+                    'total_duration': 0,
+                    'rank': 0,  # Assigned by rerank() below
+                    'last_updated': self.now,
+                }
+                for _ in range(self.rng.randint(min_activities, max_activities)):
+                    activity = self.make_activity(user['_id'])
+                    activities.append(activity)
+                    entry['total_activities'] += 1
+                    entry['total_calories'] += activity['calories']
+                    entry['total_distance'] += activity['distance']
+                    entry['total_duration'] += activity['duration']
+                    if len(activities) >= self.batch_size:
+                        total_activities += self.flush(db.activities, activities)
+                entry['total_distance'] = round(entry['total_distance'], 2)
+                leaderboard.append(entry)
+            self.flush(db.leaderboard, leaderboard)
 
-        # Insert teams
-        teams = [
-            {
-                'team_id': 1,
-                'name': 'Team Marvel',
-                'description': 'Earth\'s Mightiest Heroes',
-                'created_at': datetime.now(),
-                'members': [user_ids[i] for i in range(5)]
-            },
-            {
-                'team_id': 2,
-                'name': 'Team DC',
-                'description': 'Justice League',
-                'created_at': datetime.now(),
-                'members': [user_ids[i] for i in range(5, 10)]
-            },
-        ]
-        result = db.teams.insert_many(teams)
-        self.stdout.write(self.style.SUCCESS(f'Inserted {len(result.inserted_ids)} teams'))
+            done = chunk_start + len(users)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'  {done}/{num_users} users, {total_activities + len(activities)} activities '
+                f'({(done + total_activities) / elapsed:,.0f} docs/s)'
+            )
+        total_activities += self.flush(db.activities, activities)
+        self.stdout.write(self.style.SUCCESS(f'Inserted {num_users} users'))
+        self.stdout.write(self.style.SUCCESS(f'Inserted {total_activities} activities'))
+        self.stdout.write(self.style.SUCCESS(f'Inserted {num_users} leaderboard entries'))
 
-        # Insert activities
-        activity_types = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing']
-        activities = []
-        
-        for i, user_id in enumerate(user_ids):
-            # Each user has 3-7 activities
-            num_activities = random.randint(3, 7)
-            for j in range(num_activities):
-                activity = {
-                    'user_id': user_id,
-                    'activity_type': random.choice(activity_types),
-                    'duration': random.randint(15, 120),  # minutes
-                    'distance': round(random.uniform(1, 25), 2),  # km
-                    'calories': random.randint(100, 800),
-                    'date': datetime.now() - timedelta(days=random.randint(0, 30)),
-                    'notes': f'Great {random.choice(activity_types).lower()} session'
-                }
-                activities.append(activity)
-        
-        result = db.activities.insert_many(activities)
-        self.stdout.write(self.style.SUCCESS(f'Inserted {len(result.inserted_ids)} activities'))
+        # Build the registered indexes after the bulk load (unique email, leaderboard rank, ...)
+        ensure_indexes(db)
+        self.stdout.write(self.style.SUCCESS('Ensured indexes'))
 
-        # Calculate and insert leaderboard data
-        leaderboard = []
-        for i, user_id in enumerate(user_ids):
-            user = all_users[i]
-            # Calculate total stats from activities
-            user_activities = [a for a in activities if a['user_id'] == user_id]
-            total_activities = len(user_activities)
-            total_calories = sum(a['calories'] for a in user_activities)
-            total_distance = sum(a['distance'] for a in user_activities)
-            total_duration = sum(a['duration'] for a in user_activities)
-            
-            leaderboard_entry = {
-                'user_id': user_id,
-                'user_name': user['name'],
-                'team_id': user['team_id'],
-                'total_activities': total_activities,
-                'total_calories': total_calories,
-                'total_distance': round(total_distance, 2),
-                'total_duration': total_duration,
-                'rank': 0,  # Will be calculated based on total_calories
-                'last_updated': datetime.now()
-            }
-            leaderboard.append(leaderboard_entry)
-        
-        # Sort by total_calories and assign ranks
-        leaderboard.sort(key=lambda x: x['total_calories'], reverse=True)
-        for rank, entry in enumerate(leaderboard, start=1):
-            entry['rank'] = rank
-        
-        result = db.leaderboard.insert_many(leaderboard)
-        self.stdout.write(self.style.SUCCESS(f'Inserted {len(result.inserted_ids)} leaderboard entries'))
+        # Rank by total_calories; later activity writes keep ranks up to date incrementally
+        rerank(db)
+        self.stdout.write(self.style.SUCCESS('Ranked leaderboard entries'))
 
         # Insert workout suggestions
-        workouts = [
-            {
-                'title': 'Super Soldier Strength Training',
-                'description': 'Build strength like Captain America',
-                'difficulty': 'Advanced',
-                'duration': 60,
-                'exercises': [
-                    'Push-ups: 4 sets of 25',
-                    'Pull-ups: 4 sets of 15',
-                    'Squats: 4 sets of 30',
-                    'Bench Press: 4 sets of 12',
-                    'Deadlifts: 4 sets of 10'
-                ],
-                'created_at': datetime.now(),
-                'recommended_for': ['strength', 'muscle building']
-            },
-            {
-                'title': 'Speedster Cardio Blast',
-                'description': 'Run fast like The Flash',
-                'difficulty': 'Intermediate',
-                'duration': 45,
-                'exercises': [
-                    'Sprint intervals: 10x100m',
-                    'Jumping jacks: 3 sets of 50',
-                    'Burpees: 3 sets of 20',
-                    'Mountain climbers: 3 sets of 30',
-                    'Cool down jog: 10 minutes'
-                ],
-                'created_at': datetime.now(),
-                'recommended_for': ['cardio', 'speed', 'endurance']
-            },
-            {
-                'title': 'Warrior Princess Workout',
-                'description': 'Train like Wonder Woman',
-                'difficulty': 'Advanced',
-                'duration': 75,
-                'exercises': [
-                    'Sword swings (or similar): 3 sets of 20',
-                    'Shield raises: 3 sets of 25',
-                    'Lunges: 4 sets of 15 per leg',
-                    'Planks: 4 sets of 90 seconds',
-                    'Battle rope: 3 sets of 45 seconds'
-                ],
-                'created_at': datetime.now(),
-                'recommended_for': ['strength', 'endurance', 'agility']
-            },
-            {
-                'title': 'Zen Master Flexibility',
-                'description': 'Find your inner peace with yoga',
-                'difficulty': 'Beginner',
-                'duration': 30,
-                'exercises': [
-                    'Sun salutations: 5 rounds',
-                    'Warrior poses: Hold each for 1 minute',
-                    'Tree pose: 1 minute per side',
-                    'Child\'s pose: 3 minutes',
-                    'Meditation: 5 minutes'
-                ],
-                'created_at': datetime.now(),
-                'recommended_for': ['flexibility', 'balance', 'mindfulness']
-            },
-            {
-                'title': 'Aquatic Endurance Training',
-                'description': 'Train like the King of Atlantis',
-                'difficulty': 'Intermediate',
-                'duration': 60,
-                'exercises': [
-                    'Swimming laps: 20 lengths',
-                    'Underwater sprints: 5 sets',
-                    'Water treading: 10 minutes',
-                    'Pool-edge push-ups: 3 sets of 15',
-                    'Water resistance training: 20 minutes'
-                ],
-                'created_at': datetime.now(),
-                'recommended_for': ['swimming', 'endurance', 'full body']
-            },
-            {
-                'title': 'Dark Knight HIIT',
-                'description': 'High intensity training for vigilant heroes',
-                'difficulty': 'Advanced',
-                'duration': 40,
-                'exercises': [
-                    'Box jumps: 4 sets of 20',
-                    'Kettlebell swings: 4 sets of 25',
-                    'Medicine ball slams: 4 sets of 15',
-                    'Battle ropes: 4 sets of 45 seconds',
-                    'Tire flips: 3 sets of 10'
-                ],
-                'created_at': datetime.now(),
-                'recommended_for': ['HIIT', 'strength', 'power']
-            },
-        ]
-        
+        workouts = [{**workout, 'created_at': self.now} for workout in WORKOUTS]
         result = db.workouts.insert_many(workouts)
         self.stdout.write(self.style.SUCCESS(f'Inserted {len(result.inserted_ids)} workout suggestions'))
 
+        # Invalidate cached API responses built from the old data
+        bump_versions(db, 'users', 'teams', 'activities', 'leaderboard', 'leaderboard_snapshots', 'workouts')
+
         # Close connection
-        client.close()
+        close_client()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Database population completed successfully in {time.monotonic() - started:.1f}s!'
+        ))
+
+    def flush(self, collection, docs):
+        """Insert and clear the buffered ``docs``; returns how many were written."""
+        count = len(docs)
+        if docs:
+            collection.insert_many(docs, ordered=False)
+            docs.clear()
+        return count
+
+    def make_user(self, index, num_users, num_teams):
+        if index < len(HEROES):
+            name, email = HEROES[index]
+        else:
+            name, email = f'Athlete {index + 1}', f'athlete{index + 1}@octofit.example'
+        return {
+            '_id': ObjectId(),
+            'name': name,
+            # usernames are unique (users.username_1); the email local parts are too
+            'username': email.split('@')[0],
+            'email': email,
+            'password': 'hashed_password',
+            'team_id': index * num_teams // num_users + 1,
+            'created_at': self.now,
+        }
 
-        self.stdout.write(self.style.SUCCESS('Database population completed successfully!'))
+    def make_activity(self, user_id):
+        rng = self.rng
+        return {
+            'user_id': user_id,
+            'activity_type': rng.choice(ACTIVITY_TYPES),
+            'duration': rng.randint(15, 120),  # minutes
+            'distance': round(rng.uniform(1, 25), 2),  # km
+            'calories': rng.randint(100, 800),
+            'date': self.now - timedelta(days=rng.randint(0, self.days)),
+            'notes': f'Great {rng.choice(ACTIVITY_TYPES).lower()} session',
+        }
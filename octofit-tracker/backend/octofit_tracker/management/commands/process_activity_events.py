@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.indexes import ensure_indexes
+from octofit_tracker.mongo import get_db
+from octofit_tracker.outbox import BATCH_SIZE, pending_count, process_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply queued activity events to the leaderboard in batches. '
+        'Runs as a worker until interrupted; use --once from cron or after a backfill.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Events summed into one leaderboard bulk_write')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty (default 1)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        db = get_db()
+        ensure_indexes(db, ['activity_events', 'leaderboard'])
+        try:
+            while True:
+                started = time.perf_counter()
+                processed = process_events(db, batch_size=options['batch_size'])
+                if processed:
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'Applied {processed} events in {elapsed:.2f}s '
+                        f'({pending_count(db)} pending)'
+                    )
+                if options['once']:
+                    break
+                if not processed:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Activity event queue processed'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from octofit_tracker.indexes import ensure_indexes
+from octofit_tracker.leaderboard import rerank
+from octofit_tracker.mongo import get_db
+
+
+class Command(BaseCommand):
+    help = 'Recompute leaderboard ranks from total_calories in one batched pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        db = get_db()
+        ensure_indexes(db, ['leaderboard'])
+        updated = rerank(db, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated rank on {updated} leaderboard entries'))
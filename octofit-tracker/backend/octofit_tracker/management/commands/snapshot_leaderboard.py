@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.indexes import ensure_indexes
+from octofit_tracker.mongo import get_db
+from octofit_tracker.snapshots import PERIODS, take_snapshot
+from octofit_tracker.utils import parse_iso_datetime
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshot the current leaderboard into leaderboard_snapshots. '
+        'Run daily and weekly from cron; re-running a period replaces its snapshot.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', action='append', choices=list(PERIODS),
+                            help='Snapshot period (repeatable, default: all)')
+        parser.add_argument('--date', help='Date the snapshot is filed under (ISO date, default today)')
+        parser.add_argument('--keep', type=int, default=None,
+                            help='Drop snapshots older than this many periods')
+
+    def handle(self, *args, **options):
+        when = None
+        if options['date']:
+            when = parse_iso_datetime(options['date'])
+            if when is None:
+                raise CommandError(f"Invalid --date: {options['date']!r}")
+        db = get_db()
+        ensure_indexes(db, ['leaderboard_snapshots'])
+        for period in options['period'] or PERIODS:
+            snapshot = take_snapshot(db, period, when=when, keep=options['keep'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {period} snapshot for {snapshot['date']:%Y-%m-%d} "
+                f"(version {snapshot['version']}, {snapshot['entries']} entries)"
+            ))
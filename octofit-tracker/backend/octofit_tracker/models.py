@@ -1,5 +1,7 @@
 from djongo import models
 
+from .mongo import get_db
+
 
 class OctoFitUser(models.Model):
     _id = models.ObjectIdField()
@@ -16,6 +18,51 @@ class OctoFitUser(models.Model):
         return self.username
 
 
+def attach_users(instances):
+    """Cache the ``user`` of every instance, loaded with one ``$in`` query on ``users``."""
+    rows = [obj for obj in instances if isinstance(obj, models.Model)]
+    if not rows:
+        return
+    field = rows[0]._meta.get_field('user')
+    user_ids = {obj.user_id for obj in rows if obj.user_id is not None and not field.is_cached(obj)}
+    if not user_ids:
+        return
+    user_fields = OctoFitUser._meta.concrete_fields
+    names = [f.attname for f in user_fields]
+    users = {}
+    for doc in get_db().users.find({'_id': {'$in': list(user_ids)}}, {name: 1 for name in names}):
+        values = [doc.get(f.attname, f.get_default()) for f in user_fields]
+        users[doc['_id']] = OctoFitUser.from_db('default', names, values)
+    for obj in rows:
+        if obj.user_id in users:
+            field.set_cached_value(obj, users[obj.user_id])
+
+
+class UserPrefetchQuerySet(models.QuerySet):
+    """QuerySet whose ``with_users()`` resolves the ``user`` foreign key in one query.
+
+    djongo cannot JOIN, so ``select_related('user')`` does nothing and every
+    ``row.user`` access would be its own lookup.
+    """
+    _prefetch_users = False
+
+    def with_users(self):
+        clone = self._chain()
+        clone._prefetch_users = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._prefetch_users = self._prefetch_users
+        return clone
+
+    def _fetch_all(self):
+        prefetch = self._prefetch_users and self._result_cache is None
+        super()._fetch_all()
+        if prefetch:
+            attach_users(self._result_cache)
+
+
 class Team(models.Model):
     _id = models.ObjectIdField()
     name = models.CharField(max_length=200, unique=True)
@@ -36,8 +83,12 @@ class Activity(models.Model):
     user = models.ForeignKey(OctoFitUser, on_delete=models.CASCADE)
     activity_type = models.CharField(max_length=100)
     duration = models.FloatField(default=0)
+    distance = models.FloatField(default=0)
+    calories = models.IntegerField(default=0)
     date = models.DateField()
 
+    objects = UserPrefetchQuerySet.as_manager()
+
     class Meta:
         db_table = 'activities'
 
@@ -50,6 +101,8 @@ class Leaderboard(models.Model):
     user = models.ForeignKey(OctoFitUser, on_delete=models.CASCADE)
     score = models.IntegerField(default=0)
 
+    objects = UserPrefetchQuerySet.as_manager()
+
     class Meta:
         db_table = 'leaderboard'
 
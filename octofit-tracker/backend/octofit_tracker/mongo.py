@@ -0,0 +1,235 @@
+"""Process-wide pymongo client shared by the raw MongoDB code paths.
+
+Views, serializers and management commands call ``get_db()`` instead of
+building their own ``MongoClient``. The client is created lazily from
+``settings.DATABASES['default']`` and ``settings.MONGO_CLIENT`` and is
+re-created after a fork so gunicorn/uwsgi workers never share sockets
+with their parent.
+
+Async views reach the same client through ``run_async()``, which runs a
+blocking pymongo call on a bounded thread pool (the way Motor does) so the
+event loop is never blocked.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from pymongo import MongoClient, monitoring
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_executor = None
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters for the shared client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkins = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+            self.pool_clears = 0
+
+    def snapshot(self):
+        with self._lock:
+            open_connections = self.connections_created - self.connections_closed
+            return {
+                'connections_open': open_connections,
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'checkins': self.checkins,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'wait_time_total_ms': round(self.wait_time_total * 1000, 3),
+                'wait_time_avg_ms': round(self.wait_time_total * 1000 / self.checkouts, 3)
+                if self.checkouts else 0.0,
+                'wait_time_max_ms': round(self.wait_time_max * 1000, 3),
+                'pool_clears': self.pool_clears,
+            }
+
+    def _wait_elapsed(self):
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._wait_elapsed()
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_check_out_failed(self, event):
+        self._wait_elapsed()
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(self.in_use - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+pool_stats = PoolStats()
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands sent by every client in the process (djongo included).
+
+    ``thread_count()`` gives the commands issued by the current thread, so a
+    caller can measure how many round-trips one request took.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.total = 0
+
+    def thread_count(self):
+        return getattr(self._local, 'count', 0)
+
+    def started(self, event):
+        self._local.count = self.thread_count() + 1
+        with self._lock:
+            self.total += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+command_counter = CommandCounter()
+# Registered globally so clients created later (e.g. djongo's) report too.
+monitoring.register(command_counter)
+
+
+def get_db_name():
+    return settings.DATABASES['default']['NAME']
+
+
+def get_client_options():
+    """Build ``MongoClient`` kwargs from DATABASES and MONGO_CLIENT settings."""
+    client_settings = dict(settings.DATABASES['default'].get('CLIENT', {}))
+    options = dict(getattr(settings, 'MONGO_CLIENT', {}))
+    host = client_settings.pop('host', 'localhost')
+    port = client_settings.pop('port', 27017)
+    options.update(client_settings)
+    options = {key: value for key, value in options.items() if value is not None}
+    return host, port, options
+
+
+def get_client():
+    """Return the shared client, creating it on first use or after a fork."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            if _client_pid != pid:
+                # Inherited from the parent process: never reuse its sockets.
+                _client = None
+                pool_stats.reset()
+            host, port, options = get_client_options()
+            _client = MongoClient(host, port, event_listeners=[pool_stats], **options)
+            _client_pid = pid
+    return _client
+
+
+def get_db():
+    return get_client()[get_db_name()]
+
+
+def close_client():
+    """Close the shared client; the next ``get_db()`` call opens a new one."""
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def get_executor():
+    """Thread pool for ``run_async``, sized to the client's connection pool."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = getattr(settings, 'MONGO_CLIENT', {}).get('maxPoolSize') or 50
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mongo')
+    return _executor
+
+
+async def run_async(func, *args, **kwargs):
+    """Await ``func(*args, **kwargs)``, a blocking pymongo call, without blocking the loop.
+
+    The caller's context variables are carried over, so per-request command
+    recording still sees the call.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+def _reset_after_fork():
+    global _client, _client_pid, _lock, _executor
+    _lock = threading.Lock()
+    _client = None
+    _client_pid = None
+    _executor = None
+    pool_stats.__init__()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,189 @@
+"""Write-behind queue of leaderboard deltas (the ``activity_events`` outbox).
+
+With ``settings.LEADERBOARD_WRITE_BEHIND`` on, activity writes do not touch
+the leaderboard: they append one small event per delta to
+``activity_events`` and return. ``manage.py process_activity_events`` drains
+the outbox in batches, summing the deltas per user and applying them with one
+``bulk_write`` of ``$inc`` upserts, then shifting only the ranks the changed
+entries crossed (``leaderboard.shift_ranks()``), so request latency no longer
+depends on the rollup cost.
+
+Processing is at-least-once and idempotent:
+
+* every event carries a unique ``key`` (``activity:<id>:create``,
+  ``activity:<id>:update:<revision>`` and so on), so enqueueing the same
+  change twice stores it once;
+* a worker claims a batch by stamping its events with a batch id, and every
+  leaderboard entry remembers the last ``APPLIED_BATCHES`` batch ids it
+  received, so a batch that is re-run after a crash skips the entries it
+  already reached (and reranks the whole board, since it cannot tell how
+  far their ranks were shifted);
+* events are deleted only once their batch has been applied, and a batch
+  whose worker stopped for longer than ``lease`` is resumed, under the same
+  batch id, by the next worker.
+"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from . import leaderboard
+from .cache import bump_versions
+
+BATCH_SIZE = 1000
+APPLIED_BATCHES = 20
+LEASE = timedelta(minutes=5)
+DUPLICATE_KEY = 11000
+
+
+def write_behind():
+    return getattr(settings, 'LEADERBOARD_WRITE_BEHIND', False)
+
+
+def event(user_id, delta, key=None):
+    return {
+        'key': key or f'event:{ObjectId()}',
+        'user_id': ObjectId(str(user_id)),
+        'delta': delta,
+        'created_at': datetime.now(),
+        'batch': None,
+    }
+
+
+def enqueue(db, user_id, delta, key=None):
+    """Append one delta; returns False when an event with ``key`` is already queued."""
+    try:
+        db.activity_events.insert_one(event(user_id, delta, key))
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def enqueue_many(db, events):
+    """Append ``(key, user_id, delta)`` events; duplicates are skipped. Returns the number stored."""
+    docs = [event(user_id, delta, key) for key, user_id, delta in events]
+    if not docs:
+        return 0
+    try:
+        return len(db.activity_events.insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as exc:
+        if any(error['code'] != DUPLICATE_KEY for error in exc.details['writeErrors']):
+            raise
+        return exc.details['nInserted']
+
+
+def submit(db, user_id, delta, key=None):
+    """Queue ``delta`` for the worker, or apply it now when write-behind is off."""
+    if write_behind():
+        enqueue(db, user_id, delta, key)
+    else:
+        leaderboard.apply_delta(db, user_id, delta)
+
+
+def pending_count(db):
+    return db.activity_events.count_documents({})
+
+
+def _resume_stale_batch(db, now, lease):
+    """Take over one batch whose worker has not finished it within ``lease``."""
+    stale = db.activity_events.find_one(
+        {'batch': {'$ne': None}, 'claimed_at': {'$lt': now - lease}}, {'batch': 1}
+    )
+    if stale is None:
+        return None
+    result = db.activity_events.update_many(
+        {'batch': stale['batch'], 'claimed_at': {'$lt': now - lease}},
+        {'$set': {'claimed_at': now}},
+    )
+    return stale['batch'] if result.modified_count else None
+
+
+def claim_batch(db, batch_size=BATCH_SIZE, lease=LEASE):
+    """Claim the oldest unclaimed events (or a stale batch); returns the batch id or None."""
+    now = datetime.now()
+    batch_id = _resume_stale_batch(db, now, lease)
+    if batch_id is not None:
+        return batch_id
+    ids = [
+        doc['_id']
+        for doc in db.activity_events.find({'batch': None}, {'_id': 1})
+        .sort('_id', ASCENDING).limit(batch_size)
+    ]
+    if not ids:
+        return None
+    batch_id = ObjectId()
+    result = db.activity_events.update_many(
+        {'_id': {'$in': ids}, 'batch': None}, {'$set': {'batch': batch_id, 'claimed_at': now}}
+    )
+    return batch_id if result.modified_count else None
+
+
+def apply_batch(db, batch_id):
+    """Apply a claimed batch's summed deltas once, then delete its events.
+
+    Returns the number of events processed.
+    """
+    deltas = {}
+    events = 0
+    for doc in db.activity_events.find({'batch': batch_id}, {'user_id': 1, 'delta': 1}):
+        events += 1
+        current = deltas.get(doc['user_id'])
+        deltas[doc['user_id']] = leaderboard.add_totals(current, doc['delta']) if current else doc['delta']
+    deltas = {user_oid: delta for user_oid, delta in deltas.items() if any(delta.values())}
+
+    if deltas:
+        details = leaderboard.user_details(db, deltas)
+        now = datetime.now()
+        updates = [
+            (
+                {'user_id': user_oid, 'applied_batches': {'$ne': batch_id}},
+                {
+                    '$inc': delta,
+                    '$set': {'last_updated': now},
+                    '$push': {'applied_batches': {'$each': [batch_id], '$slice': -APPLIED_BATCHES}},
+                },
+            )
+            for user_oid, delta in deltas.items()
+        ]
+        operations = [
+            UpdateOne(query, {**update, '$setOnInsert': details[query['user_id']]}, upsert=True)
+            for query, update in updates
+        ]
+        skipped = False
+        try:
+            created = db.leaderboard.bulk_write(operations, ordered=False).upserted_ids.values()
+        except BulkWriteError as exc:
+            if any(error['code'] != DUPLICATE_KEY for error in exc.details['writeErrors']):
+                raise
+            created = [upsert['_id'] for upsert in exc.details['upserted']]
+            # An upsert collides with the unique user_id index when the entry
+            # already has this batch (a resumed batch) or another writer created
+            # it concurrently. Retried as plain updates, the first still match
+            # nothing and the second get their delta.
+            conflicts = [UpdateOne(*updates[error['index']]) for error in exc.details['writeErrors']]
+            skipped = db.leaderboard.bulk_write(conflicts, ordered=False).matched_count < len(conflicts)
+        if skipped:
+            # Entries this batch reached before a crash: how far ranks were
+            # shifted for them is not known
+            leaderboard.rerank(db)
+        else:
+            leaderboard.shift_ranks_after_write(db, deltas, created)
+        bump_versions(db, 'leaderboard')
+
+    db.activity_events.delete_many({'batch': batch_id})
+    return events
+
+
+def process_events(db, batch_size=BATCH_SIZE, max_batches=None, lease=LEASE):
+    """Drain the outbox batch by batch; returns the number of events applied."""
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batch_id = claim_batch(db, batch_size, lease)
+        if batch_id is None:
+            break
+        processed += apply_batch(db, batch_id)
+        batches += 1
+    return processed
@@ -0,0 +1,158 @@
+"""Keyset pagination and ``?fields=`` projection for the list endpoints.
+
+ORM-backed viewsets use ``IdCursorPagination`` (DRF's cursor pagination on
+``_id``). Viewsets that read MongoDB directly use ``MongoCursorPagination``,
+which produces the same ``next``/``previous``/``results`` shape from a raw
+pymongo collection. Both seek on an indexed key instead of skipping, so a
+page costs the same wherever it sits in the collection.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from bson import json_util
+from pymongo import ASCENDING
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+FIELDS_QUERY_PARAM = 'fields'
+
+
+class IdCursorPagination(CursorPagination):
+    """Cursor pagination on the ObjectId primary key."""
+    ordering = '_id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class MongoCursorPagination:
+    """Keyset pagination over a raw pymongo collection.
+
+    ``ordering`` is a sequence of ``(field, direction)`` pairs whose last
+    field must be unique (normally ``_id``) and should be backed by an index.
+    """
+    cursor_query_param = 'cursor'
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=(('_id', ASCENDING),)):
+        self.ordering = tuple(ordering)
+
+    def get_page_size(self, request):
+        page_size = self.page_size or api_settings.PAGE_SIZE
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size,
+                )
+            except (KeyError, ValueError):
+                pass
+        return page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json_util.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            if len(position) != len(self.ordering):
+                raise ValueError
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        payload = json_util.dumps({'p': position, 'r': 1 if reverse else 0})
+        encoded = urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_position(self, doc):
+        return [doc.get(field) for field, _ in self.ordering]
+
+    def keyset_filter(self, position, reverse):
+        """Documents strictly after ``position`` in the (possibly reversed) ordering."""
+        clauses = []
+        for index, (field, direction) in enumerate(self.ordering):
+            ascending = (direction == ASCENDING) != reverse
+            clause = {prior: position[i] for i, (prior, _) in enumerate(self.ordering[:index])}
+            clause[field] = {'$gt' if ascending else '$lt': position[index]}
+            clauses.append(clause)
+        return {'$or': clauses}
+
+    def paginate_collection(self, collection, request, query=None, projection=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        query = dict(query or {})
+        if position is not None:
+            keyset = self.keyset_filter(position, reverse)
+            query = {'$and': [query, keyset]} if query else keyset
+        if projection is not None:
+            projection = dict(projection)
+            for field, _ in self.ordering:
+                projection[field] = 1
+        sort = [(field, -direction if reverse else direction) for field, direction in self.ordering]
+
+        docs = list(collection.find(query, projection).sort(sort).limit(self.page_size + 1))
+        has_more = len(docs) > self.page_size
+        docs = docs[:self.page_size]
+        if reverse:
+            docs.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        self.next_link = self.previous_link = None
+        if docs:
+            if has_next:
+                self.next_link = self.encode_cursor(self.get_position(docs[-1]), reverse=False)
+            if has_previous:
+                self.previous_link = self.encode_cursor(self.get_position(docs[0]), reverse=True)
+        elif position is not None:
+            self.previous_link = remove_query_param(self.base_url, self.cursor_query_param)
+        return docs
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+def requested_fields(request, available):
+    """Names from ``?fields=a,b`` that are in ``available``; ``None`` when absent."""
+    raw = request.query_params.get(FIELDS_QUERY_PARAM)
+    if not raw:
+        return None
+    wanted = {name.strip() for name in raw.split(',')}
+    return [name for name in available if name in wanted]
+
+
+def mongo_projection(fields, sources=None):
+    """Mongo projection covering ``fields``; ``sources`` maps derived fields to stored ones."""
+    if fields is None:
+        return None
+    sources = sources or {}
+    projection = {}
+    for name in fields:
+        for source in sources.get(name, (name,)):
+            projection[source] = 1
+    return projection
+
+
+def select_fields(row, fields):
+    if fields is None:
+        return row
+    return {name: row[name] for name in fields}
@@ -0,0 +1,23 @@
+"""JSON renderer backed by orjson.
+
+Produces the same compact UTF-8 output as DRF's ``JSONRenderer``: values
+orjson does not encode itself (datetimes, Decimals, lazy strings, ...) go
+through DRF's ``JSONEncoder.default``. Indented output requested through the
+``Accept`` header falls back to the stdlib renderer.
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=_encoder.default, option=self.options)
@@ -0,0 +1,150 @@
+"""Ranked search over users, teams and workouts.
+
+Each collection is queried twice, both times through an index:
+
+* ``$text`` on the collection's text index (whole words, weighted per
+  field, ``textScore`` ranked);
+* one query per prefix field with anchored, case-sensitive ``^prefix``
+  regexes, tried as typed, lowercased and capitalized, so partial words
+  ("Capt") match. Each is a range scan of that field's ascending index,
+  read in field order, so which hits fit under the limit is deterministic.
+
+Hits are merged per document (prefix hits get ``PREFIX_BOOST`` on top of
+their text score) and ranked across collections. Every query runs with
+``maxTimeMS`` taken from what is left of ``TIME_BUDGET_MS``. The response is
+flagged ``partial`` when a collection ran out of budget and was skipped, or
+when one of its queries was cut off at the per-collection limit, so
+lower-ranked matches may be missing.
+"""
+import logging
+import re
+import time
+
+from django.conf import settings
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'TIME_BUDGET_MS': 200,
+    'MAX_RESULTS': 200,
+}
+
+PREFIX_BOOST = 2.0
+MAX_QUERY_LENGTH = 100
+
+SOURCES = {
+    'users': {
+        'type': 'user',
+        'prefix': ('username', 'name', 'email'),
+        'projection': {'name': 1, 'username': 1, 'email': 1},
+    },
+    'teams': {
+        'type': 'team',
+        'prefix': ('name',),
+        'projection': {'team_id': 1, 'name': 1},
+    },
+    'workouts': {
+        'type': 'workout',
+        'prefix': ('title',),
+        'projection': {'title': 1, 'name': 1, 'difficulty': 1, 'duration': 1},
+    },
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SEARCH', {})}
+
+
+def result_row(collection, doc, score):
+    row = {'type': SOURCES[collection]['type'], '_id': str(doc['_id']), 'score': round(score, 4)}
+    if collection == 'users':
+        row.update(title=doc.get('name') or doc.get('username', ''), username=doc.get('username', ''),
+                   email=doc.get('email', ''))
+    elif collection == 'teams':
+        row.update(title=doc.get('name', ''), team_id=doc.get('team_id'))
+    else:
+        row.update(title=doc.get('title', doc.get('name', '')), difficulty=doc.get('difficulty', ''),
+                   duration=doc.get('duration', 0))
+    return row
+
+
+def prefix_query(field, text):
+    variants = dict.fromkeys([text, text.lower(), text[:1].upper() + text[1:].lower()])
+    return {'$or': [{field: {'$regex': '^' + re.escape(variant)}} for variant in variants]}
+
+
+class Budget:
+    """Remaining milliseconds of a request's time budget."""
+
+    def __init__(self, milliseconds):
+        self.deadline = time.perf_counter() + milliseconds / 1000
+
+    def remaining_ms(self):
+        return int((self.deadline - time.perf_counter()) * 1000)
+
+
+def search_collection(db, collection, text, limit, budget):
+    """``({_id: (doc, score)}, truncated)`` of the best text and prefix matches.
+
+    ``truncated`` is true when a query returned ``limit`` hits. Returns
+    ``None`` if the collection ran over budget.
+    """
+    source = SOURCES[collection]
+    hits = {}
+    boosted = set()
+    truncated = False
+    try:
+        remaining = budget.remaining_ms()
+        if remaining <= 0:
+            return None
+        docs = list(db[collection].find(
+            {'$text': {'$search': text}}, {**source['projection'], 'score': {'$meta': 'textScore'}},
+        ).sort([('score', {'$meta': 'textScore'})]).limit(limit).max_time_ms(remaining))
+        truncated = len(docs) >= limit
+        for doc in docs:
+            hits[doc['_id']] = (doc, doc.pop('score', 0.0))
+
+        for field in source['prefix']:
+            remaining = budget.remaining_ms()
+            if remaining <= 0:
+                return None
+            docs = list(db[collection].find(
+                prefix_query(field, text), source['projection'],
+            ).sort([(field, ASCENDING), ('_id', ASCENDING)]).limit(limit).max_time_ms(remaining))
+            truncated = truncated or len(docs) >= limit
+            for doc in docs:
+                # One boost per document, however many of its fields match
+                if doc['_id'] in boosted:
+                    continue
+                boosted.add(doc['_id'])
+                previous = hits.get(doc['_id'])
+                hits[doc['_id']] = (doc, (previous[1] if previous else 0.0) + PREFIX_BOOST)
+    except OperationFailure as exc:
+        # Time budget exceeded (ExecutionTimeout) or a missing text index
+        logger.warning('Search in %s skipped: %s', collection, exc)
+        return None
+    return hits, truncated
+
+
+def search(db, text, collections=None, limit=None):
+    """Ranked hits for ``text``; returns ``(rows, partial)``.
+
+    At most ``limit`` (capped at ``MAX_RESULTS``) hits are read per query.
+    """
+    config = get_config()
+    limit = min(limit or config['MAX_RESULTS'], config['MAX_RESULTS'])
+    budget = Budget(config['TIME_BUDGET_MS'])
+    rows = []
+    partial = False
+    for collection in collections or SOURCES:
+        result = search_collection(db, collection, text, limit, budget)
+        if result is None:
+            partial = True
+            continue
+        hits, truncated = result
+        partial = partial or truncated
+        rows.extend(result_row(collection, doc, score) for doc, score in hits.values())
+    rows.sort(key=lambda row: (-row['score'], str(row['title']).lower(), row['_id']))
+    return rows, partial
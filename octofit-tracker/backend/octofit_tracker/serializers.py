@@ -1,15 +1,30 @@
 from rest_framework import serializers
-from pymongo import MongoClient
 from bson import ObjectId
 from .models import OctoFitUser, Team, Activity, Leaderboard, Workout
+from .mongo import get_db
 
 
-def get_mongo_db():
-    client = MongoClient('localhost', 27017)
-    return client['octofit_db']
+class FieldsProjectionMixin:
+    """Drops readable fields not listed in ``context['fields']`` (the ``?fields=`` param).
 
+    Only applies to the top-level serializer, never to nested ones.
+    """
 
-class OctoFitUserSerializer(serializers.ModelSerializer):
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if requested is None or parent is not None:
+            return fields
+        for name in list(fields):
+            if name not in requested and not fields[name].write_only:
+                fields.pop(name)
+        return fields
+
+
+class OctoFitUserSerializer(FieldsProjectionMixin, serializers.ModelSerializer):
     _id = serializers.SerializerMethodField()
 
     def get__id(self, obj):
@@ -20,7 +35,41 @@ class OctoFitUserSerializer(serializers.ModelSerializer):
         fields = ['_id', 'name', 'username', 'email', 'password', 'age']
 
 
-class TeamSerializer(serializers.ModelSerializer):
+def fetch_team_docs(db, team_ids):
+    """Load team documents with their members resolved, in a single query.
+
+    Returns a ``str(_id) -> team doc`` map where ``members`` holds the member
+    user documents (``name``, ``username`` and ``email`` only).
+    """
+    team_oids = [ObjectId(str(team_id)) for team_id in team_ids]
+    if not team_oids:
+        return {}
+    pipeline = [
+        {'$match': {'_id': {'$in': team_oids}}},
+        {'$project': {'team_id': 1, 'members': {'$ifNull': ['$members', []]}}},
+        {'$lookup': {
+            'from': 'users',
+            'localField': 'members',
+            'foreignField': '_id',
+            'as': 'members',
+        }},
+        {'$project': {
+            'team_id': 1,
+            'members._id': 1,
+            'members.name': 1,
+            'members.username': 1,
+            'members.email': 1,
+        }},
+    ]
+    return {str(doc['_id']): doc for doc in db.teams.aggregate(pipeline)}
+
+
+class TeamSerializer(FieldsProjectionMixin, serializers.ModelSerializer):
+    """Team with ``team_id`` and members read from the raw team document.
+
+    List views pass the documents for the whole page in ``context['team_docs']``
+    (see ``fetch_team_docs``); otherwise each team is looked up on its own.
+    """
     _id = serializers.SerializerMethodField()
     team_id = serializers.SerializerMethodField()
     members = serializers.SerializerMethodField()
@@ -28,40 +77,40 @@ class TeamSerializer(serializers.ModelSerializer):
     def get__id(self, obj):
         return str(obj._id)
 
+    def get_team_doc(self, obj):
+        team_docs = self.context.setdefault('team_docs', {})
+        key = str(obj._id)
+        if key not in team_docs:
+            try:
+                team_docs.update(fetch_team_docs(get_db(), [obj._id]))
+            except Exception:
+                pass
+        return team_docs.get(key)
+
     def get_team_id(self, obj):
-        try:
-            db = get_mongo_db()
-            team_doc = db.teams.find_one({'_id': ObjectId(str(obj._id))})
-            return team_doc.get('team_id') if team_doc else None
-        except Exception:
-            return None
+        team_doc = self.get_team_doc(obj)
+        return team_doc.get('team_id') if team_doc else None
 
     def get_members(self, obj):
-        try:
-            db = get_mongo_db()
-            team_doc = db.teams.find_one({'_id': ObjectId(str(obj._id))})
-            if not team_doc or not team_doc.get('members'):
-                return []
-            member_ids = [ObjectId(str(mid)) for mid in team_doc['members']]
-            users = list(db.users.find({'_id': {'$in': member_ids}}))
-            return [
-                {
-                    '_id': str(u['_id']),
-                    'name': u.get('name', ''),
-                    'username': u.get('username', ''),
-                    'email': u.get('email', ''),
-                }
-                for u in users
-            ]
-        except Exception:
+        team_doc = self.get_team_doc(obj)
+        if not team_doc:
             return []
+        return [
+            {
+                '_id': str(u['_id']),
+                'name': u.get('name', ''),
+                'username': u.get('username', ''),
+                'email': u.get('email', ''),
+            }
+            for u in team_doc.get('members', [])
+        ]
 
     class Meta:
         model = Team
         fields = ['_id', 'team_id', 'name', 'members']
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(FieldsProjectionMixin, serializers.ModelSerializer):
     _id = serializers.SerializerMethodField()
     user = OctoFitUserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
@@ -73,10 +122,10 @@ class ActivitySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Activity
-        fields = ['_id', 'user', 'user_id', 'activity_type', 'duration', 'date']
+        fields = ['_id', 'user', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date']
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(FieldsProjectionMixin, serializers.ModelSerializer):
     _id = serializers.SerializerMethodField()
     user = OctoFitUserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
@@ -91,7 +140,7 @@ class LeaderboardSerializer(serializers.ModelSerializer):
         fields = ['_id', 'user', 'user_id', 'score']
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
+class WorkoutSerializer(FieldsProjectionMixin, serializers.ModelSerializer):
     _id = serializers.SerializerMethodField()
 
     def get__id(self, obj):
@@ -56,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.instrumentation.MongoInstrumentationMiddleware',
+    'octofit_tracker.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -96,12 +98,34 @@ DATABASES = {
         'NAME': 'octofit_db',
         'ENFORCE_SCHEMA': False,
         'CLIENT': {
-            'host': 'localhost',
-            'port': 27017,
+            'host': os.environ.get('MONGO_HOST', 'localhost'),
+            'port': int(os.environ.get('MONGO_PORT', 27017)),
         }
     }
 }
 
+# Shared pymongo client used by the raw MongoDB code paths (octofit_tracker/mongo.py)
+MONGO_CLIENT = {
+    'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 50)),
+    'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+    'maxIdleTimeMS': int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 60000)),
+    'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+    'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+    'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    'socketTimeoutMS': int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000)),
+}
+
+# Warn on startup (system checks) when an index from octofit_tracker/indexes.py is missing
+MONGO_VERIFY_INDEXES = os.environ.get('MONGO_VERIFY_INDEXES', '1') == '1'
+
+# Per-request MongoDB command recording (octofit_tracker/instrumentation.py)
+MONGO_INSTRUMENTATION = {
+    'ENABLED': os.environ.get('MONGO_INSTRUMENTATION', '1') == '1',
+    'SLOW_REQUEST_MS': int(os.environ.get('MONGO_SLOW_REQUEST_MS', 500)),
+    'N_PLUS_ONE_THRESHOLD': int(os.environ.get('MONGO_N_PLUS_ONE_THRESHOLD', 10)),
+    'MAX_RECORDED_COMMANDS': 1000,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -144,6 +168,47 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST framework
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'octofit_tracker.pagination.IdCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+    'DEFAULT_RENDERER_CLASSES': [
+        'octofit_tracker.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Queue leaderboard deltas from activity writes in the activity_events outbox
+# instead of applying them in the request. Off by default: when on, the board
+# only changes once `manage.py process_activity_events` (a long-running worker,
+# or --once from a scheduler) drains the outbox.
+LEADERBOARD_WRITE_BEHIND = os.environ.get('LEADERBOARD_WRITE_BEHIND', '0') == '1'
+
+# /api/search/ (octofit_tracker/search.py): every MongoDB query of a search runs
+# with maxTimeMS from what is left of TIME_BUDGET_MS; MAX_RESULTS caps hits per collection.
+SEARCH = {
+    'TIME_BUDGET_MS': int(os.environ.get('SEARCH_TIME_BUDGET_MS', 200)),
+    'MAX_RESULTS': 200,
+}
+
+# Brotli/gzip compression of JSON, NDJSON and CSV responses (octofit_tracker/compression.py).
+# Bodies under MIN_SIZE bytes are sent as is; brotli needs the `brotli` package.
+COMPRESSION = {
+    'ENABLED': os.environ.get('COMPRESSION', '1') == '1',
+    'MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+# Response cache for the leaderboard and workout lists (octofit_tracker/cache.py).
+# BACKEND is 'lru' (in-process), 'django' (uses CACHES[CACHE_ALIAS]) or 'none'.
+RESPONSE_CACHE = {
+    'BACKEND': os.environ.get('RESPONSE_CACHE_BACKEND', 'lru'),
+    'MAX_ENTRIES': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1024)),
+    'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 30)),
+    'CACHE_ALIAS': 'default',
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_METHODS = [
@@ -0,0 +1,86 @@
+"""Daily and weekly leaderboard snapshots for historical ranks.
+
+``take_snapshot()`` copies the current ``leaderboard`` into
+``leaderboard_snapshots`` server-side (one ``$merge``), tagged with the
+period, the period's start date and a version. Re-running a snapshot for
+the same period writes a new version and then drops the old one, so readers
+always see a complete snapshot. Reading "as of" a date or the ranks a week
+ago is an indexed lookup on ``(period, date, version, ...)`` instead of a
+recomputation over the activities.
+"""
+from datetime import datetime, timedelta
+
+from pymongo import DESCENDING
+
+from .cache import bump_versions
+
+PERIODS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+
+SNAPSHOT_FIELDS = (
+    'user_id', 'user_name', 'team_id', 'team_name', 'total_calories', 'total_activities',
+    'total_distance', 'total_duration', 'rank',
+)
+
+
+def period_start(period, when):
+    """Midnight of ``when``'s day, or of the Monday of its week for ``weekly``."""
+    day = datetime(when.year, when.month, when.day)
+    if period == 'weekly':
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def snapshot_key(db, period, as_of):
+    """``{'period', 'date', 'version'}`` of the latest snapshot taken on or before ``as_of``."""
+    return db.leaderboard_snapshots.find_one(
+        {'period': period, 'date': {'$lte': as_of}},
+        {'_id': 0, 'period': 1, 'date': 1, 'version': 1},
+        sort=[('date', DESCENDING), ('version', DESCENDING)],
+    )
+
+
+def take_snapshot(db, period, when=None, keep=None):
+    """Snapshot the current leaderboard for ``period``; returns the snapshot key and size.
+
+    ``keep`` prunes snapshots of this period older than that many periods.
+    """
+    now = datetime.now()
+    date = period_start(period, when or now)
+    latest = db.leaderboard_snapshots.find_one(
+        {'period': period, 'date': date}, {'version': 1}, sort=[('version', DESCENDING)]
+    )
+    version = latest['version'] + 1 if latest else 1
+    key = {'period': period, 'date': date, 'version': version}
+
+    db.leaderboard.aggregate([
+        {'$project': {
+            '_id': 0,
+            **{field: 1 for field in SNAPSHOT_FIELDS},
+            **{name: {'$literal': value} for name, value in key.items()},
+            'taken_at': {'$literal': now},
+        }},
+        {'$merge': {'into': 'leaderboard_snapshots', 'whenMatched': 'fail', 'whenNotMatched': 'insert'}},
+    ])
+    db.leaderboard_snapshots.delete_many({'period': period, 'date': date, 'version': {'$lt': version}})
+    if keep:
+        db.leaderboard_snapshots.delete_many({
+            'period': period, 'date': {'$lt': date - PERIODS[period] * keep},
+        })
+    bump_versions(db, 'leaderboard_snapshots')
+    return {**key, 'entries': db.leaderboard_snapshots.count_documents(key)}
+
+
+def previous_ranks(db, period, user_ids, now=None):
+    """``user_id -> rank`` from the latest ``period`` snapshot at least one period old."""
+    key = snapshot_key(db, period, (now or datetime.now()) - PERIODS[period])
+    if key is None or not user_ids:
+        return {}
+    return {
+        doc['user_id']: doc.get('rank')
+        for doc in db.leaderboard_snapshots.find(
+            {**key, 'user_id': {'$in': list(user_ids)}}, {'_id': 0, 'user_id': 1, 'rank': 1}
+        )
+    }
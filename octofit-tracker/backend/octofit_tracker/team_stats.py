@@ -0,0 +1,134 @@
+"""Team leaderboard and per-period team stats computed by MongoDB.
+
+Activities in the window are first grouped per user and period, so the
+``$lookup`` into ``teams`` runs once per active user/period rather than once
+per activity. The groups are then folded per team, and a ``$facet`` returns
+both the window totals and the per-period series in one round-trip.
+Requires MongoDB 5.0+ for ``$dateTrunc``; the ``activities`` (date, user_id)
+and ``teams.members`` indexes are registered in ``indexes.py``.
+"""
+from pymongo import ASCENDING, DESCENDING
+
+PERIODS = ('day', 'week', 'month')
+
+SUMS = {
+    'total_calories': {'$sum': '$total_calories'},
+    'total_distance': {'$sum': '$total_distance'},
+    'total_duration': {'$sum': '$total_duration'},
+    'total_activities': {'$sum': '$total_activities'},
+}
+
+
+def _averages(members_expr):
+    return {
+        'avg_calories_per_activity': {'$divide': ['$total_calories', '$total_activities']},
+        'avg_duration_per_activity': {'$divide': ['$total_duration', '$total_activities']},
+        'avg_calories_per_member': {'$divide': ['$total_calories', members_expr]},
+    }
+
+
+def team_stats_pipeline(start, end, period='week'):
+    period_expr = {'$dateTrunc': {'date': '$date', 'unit': period}}
+    if period == 'week':
+        period_expr['$dateTrunc']['startOfWeek'] = 'monday'
+    return [
+        {'$match': {'date': {'$gte': start, '$lt': end}}},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'period': period_expr},
+            'total_calories': {'$sum': '$calories'},
+            'total_distance': {'$sum': '$distance'},
+            'total_duration': {'$sum': '$duration'},
+            'total_activities': {'$sum': 1},
+        }},
+        {'$lookup': {
+            'from': 'teams',
+            'localField': '_id.user_id',
+            'foreignField': 'members',
+            'as': 'team',
+        }},
+        {'$unwind': '$team'},
+        {'$group': {
+            '_id': {'team_id': '$team.team_id', 'period': '$_id.period'},
+            'name': {'$first': '$team.name'},
+            'members': {'$addToSet': '$_id.user_id'},
+            **SUMS,
+        }},
+        {'$facet': {
+            'teams': [
+                {'$group': {
+                    '_id': '$_id.team_id',
+                    'name': {'$first': '$name'},
+                    'members': {'$push': '$members'},
+                    **SUMS,
+                }},
+                {'$project': {
+                    '_id': 0,
+                    'team_id': '$_id',
+                    'name': 1,
+                    'active_members': {'$size': {'$reduce': {
+                        'input': '$members',
+                        'initialValue': [],
+                        'in': {'$setUnion': ['$$value', '$$this']},
+                    }}},
+                    'total_calories': 1,
+                    'total_distance': 1,
+                    'total_duration': 1,
+                    'total_activities': 1,
+                }},
+                {'$addFields': _averages('$active_members')},
+                {'$sort': {'total_calories': DESCENDING, 'team_id': ASCENDING}},
+            ],
+            'periods': [
+                {'$project': {
+                    '_id': 0,
+                    'team_id': '$_id.team_id',
+                    'period': '$_id.period',
+                    'name': 1,
+                    'active_members': {'$size': '$members'},
+                    'total_calories': 1,
+                    'total_distance': 1,
+                    'total_duration': 1,
+                    'total_activities': 1,
+                }},
+                {'$addFields': _averages('$active_members')},
+                {'$sort': {'period': ASCENDING, 'total_calories': DESCENDING, 'team_id': ASCENDING}},
+            ],
+        }},
+    ]
+
+
+def assign_ranks(rows, key='total_calories'):
+    """Competition ranking over rows already sorted by ``key`` descending."""
+    previous = None
+    rank = 0
+    for position, row in enumerate(rows, start=1):
+        if row[key] != previous:
+            rank = position
+            previous = row[key]
+        row['rank'] = rank
+    return rows
+
+
+def team_stats(db, start, end, period='week'):
+    result = next(db.activities.aggregate(team_stats_pipeline(start, end, period)), None)
+    result = result or {'teams': [], 'periods': []}
+
+    assign_ranks(result['teams'])
+    previous_period = None
+    period_rows = []
+    for row in result['periods']:
+        if row['period'] != previous_period:
+            assign_ranks(period_rows)
+            period_rows = []
+            previous_period = row['period']
+        row['period'] = row['period'].isoformat()
+        period_rows.append(row)
+    assign_ranks(period_rows)
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'period': period,
+        'teams': result['teams'],
+        'periods': result['periods'],
+    }
@@ -1,9 +1,41 @@
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from unittest import mock
 from .models import OctoFitUser, Team, Activity, Leaderboard, Workout
+from . import cache, compression, export, importer, instrumentation, leaderboard, mongo, outbox, snapshots
+from .checks import check_mongo_indexes
+from .indexes import INDEXES, ensure_indexes, missing_indexes
+from .management.commands import benchmark_api
+import bson
 import datetime
+import io
+import gzip
+import json
+import os
+import tempfile
+
+
+def count_mongo_reads(func):
+    """Call ``func`` and return how many find/aggregate calls reached MongoDB."""
+    calls = []
+
+    def counted(name):
+        original = getattr(Collection, name)
+
+        def wrapper(collection, *args, **kwargs):
+            calls.append((collection.name, name))
+            return original(collection, *args, **kwargs)
+        return mock.patch.object(Collection, name, wrapper)
+
+    with counted('find'), counted('find_one'), counted('aggregate'):
+        func()
+    return len(calls)
 
 
 class OctoFitUserTests(TestCase):
@@ -20,6 +52,67 @@ class OctoFitUserTests(TestCase):
         response = self.client.get('/api/users/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_users_is_cursor_paginated(self):
+        OctoFitUser.objects.create(username='second', email='second@example.com', password='pass')
+        response = self.client.get('/api/users/?page_size=1')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_list_users_fields_projection(self):
+        response = self.client.get('/api/users/?fields=_id,username')
+        for user in response.data['results']:
+            self.assertEqual(set(user), {'_id', 'username'})
+
+    def test_partial_update_moves_user_between_teams(self):
+        db = mongo.get_db()
+        db.teams.insert_many([
+            {'team_id': 501, 'name': 'Old Team', 'members': [self.user._id]},
+            {'team_id': 502, 'name': 'New Team', 'members': []},
+        ])
+        with mock.patch.object(Collection, 'update_many', autospec=True,
+                               side_effect=Collection.update_many) as update_many:
+            response = self.client.patch(f'/api/users/{self.user._id}/', {'team_id': 502, 'age': 18}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['team_id'], 502)
+        self.assertEqual(response.data['team'], 'New Team')
+        self.assertEqual(response.data['age'], 18)
+        for call in update_many.call_args_list:
+            self.assertIn('members', call.args[1])
+
+        self.assertEqual(db.teams.find_one({'team_id': 501})['members'], [])
+        self.assertEqual(db.teams.find_one({'team_id': 502})['members'], [self.user._id])
+        self.assertEqual(db.users.find_one({'_id': self.user._id})['team_id'], 502)
+
+    def test_partial_update_moves_leaderboard_team_name(self):
+        db = mongo.get_db()
+        db.teams.insert_one({'team_id': 503, 'name': 'Target Team', 'members': []})
+        db.leaderboard.insert_one({'user_id': self.user._id, 'team_id': None, 'team_name': None, 'rank': 1})
+        self.client.patch(f'/api/users/{self.user._id}/', {'team_id': 503}, format='json')
+        entry = db.leaderboard.find_one({'user_id': self.user._id})
+        self.assertEqual((entry['team_id'], entry['team_name']), (503, 'Target Team'))
+
+    def test_partial_update_rejects_unknown_team(self):
+        db = mongo.get_db()
+        db.teams.insert_one({'team_id': 504, 'name': 'Current Team', 'members': [self.user._id]})
+        db.users.update_one({'_id': self.user._id}, {'$set': {'team_id': 504}})
+        for team_id in (9999, 'blue'):
+            response = self.client.patch(
+                f'/api/users/{self.user._id}/', {'team_id': team_id, 'age': 30}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('team_id', response.data)
+        user = db.users.find_one({'_id': self.user._id})
+        self.assertEqual((user['team_id'], user['age']), (504, self.user.age))
+        self.assertEqual(db.teams.find_one({'team_id': 504})['members'], [self.user._id])
+
+    def test_partial_update_unknown_user(self):
+        response = self.client.patch('/api/users/5f0000000000000000000000/', {'team_id': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_create_user(self):
         data = {
             'username': 'newuser',
@@ -41,6 +134,7 @@ class TeamTests(TestCase):
             age=18,
         )
         self.team = Team.objects.create(name='Alpha Team')
+        cache.bump_versions(mongo.get_db(), 'users', 'teams')
 
     def test_list_teams(self):
         response = self.client.get('/api/teams/')
@@ -51,6 +145,90 @@ class TeamTests(TestCase):
         response = self.client.post('/api/teams/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_rename_updates_leaderboard_team_name(self):
+        db = mongo.get_db()
+        db.teams.update_one({'_id': self.team._id}, {'$set': {'team_id': 901}})
+        db.leaderboard.insert_one({'user_id': self.user._id, 'team_id': 901, 'team_name': 'Alpha Team', 'rank': 1})
+        response = self.client.patch(f'/api/teams/{self.team._id}/', {'name': 'Omega Team'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(db.leaderboard.find_one({'user_id': self.user._id})['team_name'], 'Omega Team')
+
+        reads = count_mongo_reads(lambda: self.client.get('/api/leaderboard/'))
+        response = self.client.get('/api/leaderboard/?fields=team')
+        self.assertIn({'team': 'Omega Team'}, response.data['results'])
+        self.assertEqual(reads, 2)  # cache versions + leaderboard page, no teams lookup
+
+    def test_check_leaderboard_repairs_team_drift(self):
+        db = mongo.get_db()
+        db.teams.update_one({'_id': self.team._id}, {'$set': {'team_id': 902, 'members': [self.user._id]}})
+        db.leaderboard.insert_one({'user_id': self.user._id, 'team_id': 1, 'team_name': 'Stale', 'rank': 1})
+        out = io.StringIO()
+        call_command('check_leaderboard', stdout=out)
+        self.assertIn('1 drifted', out.getvalue())
+        call_command('check_leaderboard', repair=True, stdout=io.StringIO())
+        entry = db.leaderboard.find_one({'user_id': self.user._id})
+        self.assertEqual((entry['team_id'], entry['team_name']), (902, 'Alpha Team'))
+
+    def test_team_stats(self):
+        db = mongo.get_db()
+        db.teams.update_one({'_id': self.team._id}, {'$set': {'team_id': 900, 'members': [self.user._id]}})
+        db.activities.insert_many([
+            {'user_id': self.user._id, 'activity_type': 'Running', 'duration': 30,
+             'distance': 5, 'calories': 300, 'date': datetime.datetime(2024, 1, day)}
+            for day in (1, 2, 9)
+        ])
+        response = self.client.get('/api/teams/stats/?start=2024-01-01&end=2024-01-31&period=week')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        team = next(t for t in response.data['teams'] if t['team_id'] == 900)
+        self.assertEqual(team['total_calories'], 900)
+        self.assertEqual(team['total_activities'], 3)
+        self.assertEqual(team['active_members'], 1)
+        self.assertEqual(team['avg_calories_per_activity'], 300)
+        weeks = [row for row in response.data['periods'] if row['team_id'] == 900]
+        self.assertEqual([row['total_activities'] for row in weeks], [2, 1])
+
+    def test_team_stats_rejects_unknown_period(self):
+        response = self.client.get('/api/teams/stats/?period=year')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def add_teams(self, count):
+        db = mongo.get_db()
+        for _ in range(count):
+            team_id = Team.objects.count() + 1
+            team = Team.objects.create(name=f'Squad {team_id}')
+            db.teams.update_one(
+                {'_id': team._id},
+                {'$set': {'team_id': team_id, 'members': [self.user._id]}},
+            )
+        cache.bump_versions(db, 'teams')
+
+    def test_list_teams_includes_members(self):
+        self.add_teams(1)
+        response = self.client.get('/api/teams/')
+        team = next(t for t in response.data['results'] if t['name'] == 'Squad 2')
+        self.assertEqual(team['team_id'], 2)
+        self.assertEqual(team['members'], [{
+            '_id': str(self.user._id),
+            'name': '',
+            'username': 'teamuser',
+            'email': 'team@example.com',
+        }])
+
+    def test_list_teams_query_count_is_constant(self):
+        self.add_teams(2)
+        few = count_mongo_reads(lambda: self.client.get('/api/teams/'))
+        self.add_teams(8)
+        many = count_mongo_reads(lambda: self.client.get('/api/teams/'))
+        self.assertEqual(few, many)
+
+    def test_list_teams_is_cached_until_teams_change(self):
+        self.assertEqual(self.client.get('/api/teams/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/teams/')['X-Cache'], 'HIT')
+        self.client.patch(f'/api/teams/{self.team._id}/', {'name': 'Omega Team'}, format='json')
+        response = self.client.get('/api/teams/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Omega Team', [team['name'] for team in response.data['results']])
+
 
 class ActivityTests(TestCase):
     def setUp(self):
@@ -66,6 +244,363 @@ class ActivityTests(TestCase):
         response = self.client.get('/api/activities/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_fast_path_matches_serializer(self):
+        created = self.create_activity(250).data
+        response = self.client.get('/api/activities/')
+        row = next(row for row in response.json()['results'] if row['_id'] == created['_id'])
+        detail = self.client.get(f"/api/activities/{created['_id']}/").json()
+        self.assertEqual(row, detail)
+
+        response = self.client.get('/api/activities/?fields=_id,calories')
+        self.assertEqual(set(response.json()['results'][0]), {'_id', 'calories'})
+
+    def test_thousand_row_page_resolves_users_in_one_query(self):
+        db = mongo.get_db()
+        users = [{'username': f'bulk{i}', 'email': f'bulk{i}@example.com', 'password': 'pass', 'age': 14}
+                 for i in range(50)]
+        user_ids = db.users.insert_many(users).inserted_ids
+        db.activities.insert_many([
+            {'user_id': user_ids[i % 50], 'activity_type': 'Running', 'duration': 30.0,
+             'distance': 5.0, 'calories': 100, 'date': datetime.datetime(2024, 1, 1)}
+            for i in range(1000)
+        ])
+
+        results = []
+        reads = count_mongo_reads(
+            lambda: results.extend(self.client.get('/api/activities/?page_size=1000').data['results'])
+        )
+        self.assertEqual(len(results), 1000)
+        self.assertTrue(all(row['user']['username'].startswith('bulk') for row in results))
+        self.assertEqual(reads, 2)  # activities page + one $in for the users
+
+        query_only = count_mongo_reads(lambda: list(Activity.objects.all()[:1000]))
+        with_users = count_mongo_reads(
+            lambda: [activity.user.username for activity in Activity.objects.with_users()[:1000]]
+        )
+        self.assertEqual(with_users, query_only + 1)
+
+    def test_filter_activities(self):
+        db = mongo.get_db()
+        other = OctoFitUser.objects.create(username='other', email='other@example.com', password='pass')
+        db.teams.insert_one({'team_id': 600, 'name': 'Filter Team', 'members': [other._id]})
+        db.activities.insert_many([
+            {'user_id': [self.user._id, other._id][day % 2], 'activity_type': 'Swimming' if day % 3 == 0 else 'Running',
+             'duration': 30.0, 'distance': 1.0, 'calories': day, 'date': datetime.datetime(2024, 1, day)}
+            for day in range(1, 11)
+        ])
+
+        def calories(query):
+            response = self.client.get(f'/api/activities/?fields=calories&{query}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [row['calories'] for row in response.data['results']]
+
+        self.assertEqual(calories(f'user_id={self.user._id}&date_from=2024-01-05'), [9, 7, 5])
+        self.assertEqual(calories('team_id=600&date_to=2024-01-04'), [4, 2])
+        self.assertEqual(calories('type=Swimming'), [9, 6, 3])
+        self.assertEqual(calories('page_size=4')[:4], [10, 9, 8, 7])
+        self.assertEqual(self.client.get('/api/activities/?date_from=soon').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_history_uses_compound_index(self):
+        call_command('ensure_indexes', collection=['activities'], stdout=io.StringIO())
+        plan = mongo.get_db().activities.find({'user_id': self.user._id}).sort(
+            [('date', -1), ('_id', -1)]
+        ).limit(10).explain()['queryPlanner']['winningPlan']
+        self.assertIn('user_id_1_date_1__id_1', json.dumps(plan, default=str))
+        self.assertNotIn('"SORT"', json.dumps(plan, default=str))
+
+    def create_activity(self, calories):
+        data = {
+            'user_id': str(self.user._id),
+            'activity_type': 'Running',
+            'duration': 30,
+            'distance': 5,
+            'calories': calories,
+            'date': '2024-01-01',
+        }
+        return self.client.post('/api/activities/', data, format='json')
+
+    def test_activity_writes_update_leaderboard(self):
+        db = mongo.get_db()
+        response = self.create_activity(300)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.create_activity(200)
+
+        entry = db.leaderboard.find_one({'user_id': self.user._id})
+        self.assertEqual(entry['total_activities'], 2)
+        self.assertEqual(entry['total_calories'], 500)
+        self.assertEqual(entry['total_duration'], 60)
+        self.assertEqual(entry['rank'], 1)
+
+        self.client.patch(f"/api/activities/{response.data['_id']}/", {'calories': 100}, format='json')
+        entry = db.leaderboard.find_one({'user_id': self.user._id})
+        self.assertEqual(entry['total_activities'], 2)
+        self.assertEqual(entry['total_calories'], 300)
+
+        self.client.delete(f"/api/activities/{response.data['_id']}/")
+        entry = db.leaderboard.find_one({'user_id': self.user._id})
+        self.assertEqual(entry['total_activities'], 1)
+        self.assertEqual(entry['total_calories'], 200)
+
+    def test_export_ndjson(self):
+        self.create_activity(250)
+        response = self.client.get('/api/activities/export/?since=2023-12-31')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        row = next(r for r in rows if r['user_id'] == str(self.user._id))
+        self.assertEqual(row['calories'], 250)
+        self.assertEqual(row['activity_type'], 'Running')
+
+    def test_export_streams_in_date_order_across_batches(self):
+        db = mongo.get_db()
+        db.activities.delete_many({})
+        db.activities.insert_many([
+            {'user_id': self.user._id, 'activity_type': 'Running', 'calories': day,
+             'date': datetime.datetime(2024, 1, day)}
+            for day in (5, 3, 3, 9, 1, 7, 3)
+        ])
+        rows = list(export.iter_activities(db, since=datetime.datetime(2024, 1, 2), batch_size=2))
+        calories = [row[export.EXPORT_FIELDS.index('calories')] for row in rows]
+        self.assertEqual(calories, [3, 3, 3, 5, 7, 9])
+        ids = [row[0] for row in rows[:3]]
+        self.assertEqual(ids, sorted(ids))
+
+        call_command('ensure_indexes', collection=['activities'], stdout=io.StringIO())
+        plan = db.activities.find({'date': {'$gte': datetime.datetime(2024, 1, 2)}}).sort(
+            export.EXPORT_ORDER
+        ).limit(2).explain()['queryPlanner']['winningPlan']
+        self.assertIn('date_1__id_1', json.dumps(plan, default=str))
+        self.assertNotIn('"SORT"', json.dumps(plan, default=str))
+
+    def test_export_csv_gzip(self):
+        self.create_activity(250)
+        response = self.client.get('/api/activities/export/?format=csv&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(lines[0], '_id,user_id,activity_type,duration,distance,calories,date')
+        self.assertGreaterEqual(len(lines), 2)
+
+    def test_export_rejects_unknown_format(self):
+        response = self.client.get('/api/activities/export/?format=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_ingest_reports_row_errors(self):
+        rows = [
+            {'user_id': str(self.user._id), 'activity_type': 'Cycling', 'duration': 40,
+             'distance': 12.5, 'calories': 350, 'date': '2024-02-01'},
+            {'user_id': str(self.user._id), 'activity_type': 'Yoga', 'duration': 30,
+             'calories': 120, 'date': '2024-02-02T07:30:00'},
+            {'user_id': str(self.user._id), 'activity_type': 'Running', 'duration': -5,
+             'date': '2024-02-03'},
+        ]
+        response = self.client.post('/api/activities/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [2])
+
+        db = mongo.get_db()
+        entry = db.leaderboard.find_one({'user_id': self.user._id})
+        self.assertEqual(entry['total_activities'], 2)
+        self.assertEqual(entry['total_calories'], 470)
+
+    def test_bulk_ingest_ndjson(self):
+        body = '\n'.join(json.dumps({
+            'user_id': str(self.user._id), 'activity_type': 'Boxing',
+            'duration': 20, 'calories': 200, 'date': '2024-03-0%d' % day,
+        }) for day in range(1, 4))
+        response = self.client.post('/api/activities/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['inserted'], 3)
+
+    def test_bulk_ingest_rejects_non_finite_numbers(self):
+        body = '\n'.join([
+            '{"user_id": "%s", "activity_type": "Boxing", "calories": NaN, "date": "2024-03-01"}',
+            '{"user_id": "%s", "activity_type": "Boxing", "duration": Infinity, "date": "2024-03-02"}',
+            '{"user_id": "%s", "activity_type": "Boxing", "calories": 120, "date": "2024-03-03"}',
+        ]) % ((self.user._id,) * 3)
+        response = self.client.post('/api/activities/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['inserted'], 1)
+        self.assertEqual([(error['index'], list(error['errors'])) for error in response.data['errors']],
+                         [(0, ['calories']), (1, ['duration'])])
+        entry = mongo.get_db().leaderboard.find_one({'user_id': self.user._id})
+        self.assertEqual(entry['total_calories'], 120)
+
+    def test_bulk_ingest_shifts_ranks_without_reranking(self):
+        db = mongo.get_db()
+        ahead, behind = bson.ObjectId(), bson.ObjectId()
+        leaderboard.apply_delta(db, ahead, leaderboard.activity_totals({'calories': 300}))
+        leaderboard.apply_delta(db, behind, leaderboard.activity_totals({'calories': 100}))
+        rows = [
+            {'user_id': str(self.user._id), 'activity_type': 'Cycling', 'duration': 40,
+             'calories': calories, 'date': '2024-02-01'}
+            for calories in (150, 250)
+        ]
+        with mock.patch.object(leaderboard, 'rerank') as rerank:
+            response = self.client.post('/api/activities/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        rerank.assert_not_called()
+        ranks = {entry['user_id']: entry['rank'] for entry in db.leaderboard.find()}
+        self.assertEqual(ranks, {self.user._id: 1, ahead: 2, behind: 3})
+
+    def test_rank_shifts_when_user_overtakes(self):
+        db = mongo.get_db()
+        other = OctoFitUser.objects.create(username='rival', email='rival@example.com', password='pass')
+        leaderboard.apply_delta(db, other._id, leaderboard.activity_totals({'calories': 400}))
+        self.create_activity(300)
+        self.assertEqual(db.leaderboard.find_one({'user_id': other._id})['rank'], 1)
+        self.assertEqual(db.leaderboard.find_one({'user_id': self.user._id})['rank'], 2)
+
+        self.create_activity(300)
+        self.assertEqual(db.leaderboard.find_one({'user_id': self.user._id})['rank'], 1)
+        self.assertEqual(db.leaderboard.find_one({'user_id': other._id})['rank'], 2)
+
+
+@override_settings(LEADERBOARD_WRITE_BEHIND=True)
+class ActivityEventTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.db = mongo.get_db()
+        self.db.activity_events.delete_many({})
+        call_command('ensure_indexes', collection=['activity_events', 'leaderboard'], stdout=io.StringIO())
+        self.user = OctoFitUser.objects.create(username='queued', email='queued@example.com', password='pass')
+
+    def totals(self):
+        return self.db.leaderboard.find_one({'user_id': self.user._id}) or {}
+
+    def test_create_queues_event_instead_of_rollup(self):
+        response = self.client.post('/api/activities/', {
+            'user_id': str(self.user._id), 'activity_type': 'Running',
+            'duration': 30, 'calories': 250, 'date': '2024-01-01',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.totals(), {})
+        event = self.db.activity_events.find_one({'user_id': self.user._id})
+        self.assertEqual(event['key'], f"activity:{response.data['_id']}:create")
+        self.assertEqual(event['delta']['total_calories'], 250)
+
+        out = io.StringIO()
+        call_command('process_activity_events', once=True, stdout=out)
+        self.assertIn('Applied 1 events', out.getvalue())
+        self.assertEqual(self.totals()['total_calories'], 250)
+        self.assertEqual(outbox.pending_count(self.db), 0)
+
+    def test_leaderboard_is_stale_until_events_are_processed(self):
+        self.client.post('/api/activities/', {
+            'user_id': str(self.user._id), 'activity_type': 'Running',
+            'duration': 30, 'calories': 250, 'date': '2024-01-01',
+        }, format='json')
+        names = [entry['user_name'] for entry in self.client.get('/api/leaderboard/').data['results']]
+        self.assertNotIn('queued', names)
+        outbox.process_events(self.db)
+        names = [entry['user_name'] for entry in self.client.get('/api/leaderboard/').data['results']]
+        self.assertIn('queued', names)
+
+    def test_queued_write_keeps_leaderboard_cache(self):
+        self.client.get('/api/leaderboard/')
+        self.client.post('/api/activities/', {
+            'user_id': str(self.user._id), 'activity_type': 'Running',
+            'duration': 30, 'calories': 250, 'date': '2024-01-01',
+        }, format='json')
+        self.assertEqual(self.client.get('/api/leaderboard/')['X-Cache'], 'HIT')
+        outbox.process_events(self.db)
+        self.assertEqual(self.client.get('/api/leaderboard/')['X-Cache'], 'MISS')
+
+    def test_updates_are_keyed_by_revision(self):
+        response = self.client.post('/api/activities/', {
+            'user_id': str(self.user._id), 'activity_type': 'Running',
+            'duration': 30, 'calories': 250, 'date': '2024-01-01',
+        }, format='json')
+        for calories in (200, 150):
+            self.client.patch(f"/api/activities/{response.data['_id']}/", {'calories': calories}, format='json')
+        keys = sorted(event['key'] for event in self.db.activity_events.find({'user_id': self.user._id}))
+        self.assertEqual(keys, [
+            f"activity:{response.data['_id']}:{suffix}" for suffix in ('create', 'update:1', 'update:2')
+        ])
+        outbox.process_events(self.db)
+        self.assertEqual(self.totals()['total_calories'], 150)
+
+    def test_duplicate_keys_are_queued_once(self):
+        delta = leaderboard.activity_totals({'calories': 100})
+        self.assertTrue(outbox.enqueue(self.db, self.user._id, delta, key='activity:1:create'))
+        self.assertFalse(outbox.enqueue(self.db, self.user._id, delta, key='activity:1:create'))
+        stored = outbox.enqueue_many(self.db, [
+            ('activity:1:create', self.user._id, delta), ('activity:2:create', self.user._id, delta),
+        ])
+        self.assertEqual(stored, 1)
+        self.assertEqual(outbox.process_events(self.db), 2)
+        self.assertEqual(self.totals()['total_calories'], 200)
+        self.assertEqual(self.totals()['total_activities'], 2)
+
+    def test_batches_sum_deltas_per_user(self):
+        for calories in (100, 200, 300):
+            outbox.enqueue(self.db, self.user._id, leaderboard.activity_totals({'calories': calories}))
+        outbox.enqueue(self.db, self.user._id, leaderboard.activity_totals({'calories': 100}, sign=-1))
+        self.assertEqual(outbox.process_events(self.db, batch_size=3, max_batches=1), 3)
+        self.assertEqual(self.totals()['total_calories'], 600)
+        self.assertEqual(outbox.process_events(self.db, batch_size=3), 1)
+        self.assertEqual(self.totals()['total_calories'], 500)
+        self.assertEqual(self.totals()['total_activities'], 2)
+        self.assertEqual(self.totals()['rank'], 1)
+
+    def test_replayed_batch_is_applied_once(self):
+        outbox.enqueue(self.db, self.user._id, leaderboard.activity_totals({'calories': 150}))
+        batch_id = outbox.claim_batch(self.db)
+        events = list(self.db.activity_events.find({'batch': batch_id}))
+        outbox.apply_batch(self.db, batch_id)
+
+        # A worker that died before deleting its events: the batch is resumed after the lease.
+        for event in events:
+            event['claimed_at'] -= datetime.timedelta(hours=1)
+        self.db.activity_events.insert_many(events)
+        self.assertEqual(outbox.claim_batch(self.db), batch_id)
+        outbox.apply_batch(self.db, batch_id)
+        self.assertEqual(self.totals()['total_calories'], 150)
+        self.assertEqual(outbox.pending_count(self.db), 0)
+
+    def test_batches_shift_ranks_without_reranking(self):
+        others = [bson.ObjectId() for _ in range(3)]
+        for other, calories in zip(others, (400, 300, 100)):
+            leaderboard.apply_delta(self.db, other, leaderboard.activity_totals({'calories': calories}))
+        outbox.enqueue(self.db, self.user._id, leaderboard.activity_totals({'calories': 350}))
+        outbox.enqueue(self.db, others[2], leaderboard.activity_totals({'calories': 400}))
+        with mock.patch.object(leaderboard, 'rerank') as rerank:
+            outbox.process_events(self.db)
+        rerank.assert_not_called()
+        ranks = {entry['user_id']: entry['rank'] for entry in self.db.leaderboard.find()}
+        self.assertEqual(ranks, {others[2]: 1, others[0]: 2, self.user._id: 3, others[1]: 4})
+
+    def test_batch_resumed_after_a_partial_write_completes_it(self):
+        other = bson.ObjectId()
+        leaderboard.apply_delta(self.db, other, leaderboard.activity_totals({'calories': 200}))
+        outbox.enqueue(self.db, self.user._id, leaderboard.activity_totals({'calories': 150}))
+        outbox.enqueue(self.db, other, leaderboard.activity_totals({'calories': 100}))
+        batch_id = outbox.claim_batch(self.db)
+        events = list(self.db.activity_events.find({'batch': batch_id}))
+        outbox.apply_batch(self.db, batch_id)
+
+        # The worker died after reaching only this user's entry
+        self.db.leaderboard.update_one(
+            {'user_id': other}, {'$inc': {'total_calories': -100}, '$pull': {'applied_batches': batch_id}}
+        )
+        for event in events:
+            event['claimed_at'] -= datetime.timedelta(hours=1)
+        self.db.activity_events.insert_many(events)
+        self.assertEqual(outbox.claim_batch(self.db), batch_id)
+        outbox.apply_batch(self.db, batch_id)
+        self.assertEqual(self.totals()['total_calories'], 150)
+        self.assertEqual(self.totals()['rank'], 2)
+        self.assertEqual(self.db.leaderboard.find_one({'user_id': other})['total_calories'], 300)
+        self.assertEqual(self.db.leaderboard.find_one({'user_id': other})['rank'], 1)
+
+    def test_synchronous_rollup_when_write_behind_is_off(self):
+        with self.settings(LEADERBOARD_WRITE_BEHIND=False):
+            self.client.post('/api/activities/', {
+                'user_id': str(self.user._id), 'activity_type': 'Running',
+                'duration': 30, 'calories': 90, 'date': '2024-01-01',
+            }, format='json')
+        self.assertEqual(self.totals()['total_calories'], 90)
+        self.assertEqual(outbox.pending_count(self.db), 0)
+
 
 class LeaderboardTests(TestCase):
     def setUp(self):
@@ -81,6 +616,243 @@ class LeaderboardTests(TestCase):
         response = self.client.get('/api/leaderboard/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_leaderboard_pages_follow_rank(self):
+        db = mongo.get_db()
+        db.leaderboard.delete_many({})
+        db.leaderboard.insert_many([
+            {'user_name': f'hero{rank}', 'team_id': None, 'total_calories': 1000 - rank, 'rank': rank}
+            for rank in range(1, 6)
+        ])
+        cache.bump_versions(db, 'leaderboard')
+        names = []
+        url = '/api/leaderboard/?page_size=2&fields=user_name,rank'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            for entry in response.data['results']:
+                self.assertEqual(set(entry), {'user_name', 'rank'})
+                names.append(entry['user_name'])
+            url = response.data['next']
+        self.assertEqual(names, [f'hero{rank}' for rank in range(1, 6)])
+
+    def test_leaderboard_cache_and_etag(self):
+        first = self.client.get('/api/leaderboard/?page_size=3')
+        second = self.client.get('/api/leaderboard/?page_size=3')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+
+        response = self.client.get('/api/leaderboard/?page_size=3', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_activity_write_invalidates_leaderboard_cache(self):
+        first = self.client.get('/api/leaderboard/')
+        self.client.post('/api/activities/', {
+            'user_id': str(self.user._id), 'activity_type': 'Running',
+            'duration': 10, 'calories': 80, 'date': '2024-01-01',
+        }, format='json')
+        response = self.client.get('/api/leaderboard/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('lbuser', [entry['user_name'] for entry in response.data['results']])
+
+    def seed_board(self, size):
+        db = mongo.get_db()
+        db.leaderboard.delete_many({})
+        user_ids = [bson.ObjectId() for _ in range(size)]
+        db.leaderboard.insert_many([
+            {'user_id': user_id, 'user_name': f'racer{rank}', 'team_id': None,
+             'total_calories': 1000 - rank, 'rank': rank}
+            for rank, user_id in enumerate(user_ids, start=1)
+        ])
+        cache.bump_versions(db, 'leaderboard')
+        return user_ids
+
+    def test_leaderboard_top_n(self):
+        self.seed_board(30)
+        response = self.client.get('/api/leaderboard/?top=10&fields=rank')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['rank'] for entry in response.data['results']], list(range(1, 11)))
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(self.client.get('/api/leaderboard/?top=0').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_leaderboard_around_user(self):
+        user_ids = self.seed_board(30)
+        response = self.client.get(f'/api/leaderboard/?around={user_ids[14]}&window=2&fields=rank')
+        self.assertEqual([entry['rank'] for entry in response.data['results']], [13, 14, 15, 16, 17])
+        response = self.client.get(f'/api/leaderboard/?around={user_ids[0]}&fields=rank')
+        self.assertEqual([entry['rank'] for entry in response.data['results']], [1, 2, 3])
+
+        response = self.client.get(f'/api/leaderboard/?around={bson.ObjectId()}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/leaderboard/?around=not-an-id')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_leaderboard_around_is_bounded_index_scan(self):
+        user_ids = self.seed_board(200)
+        call_command('ensure_indexes', collection=['leaderboard'], stdout=io.StringIO())
+        responses = []
+        reads = count_mongo_reads(lambda: responses.append(
+            self.client.get(f'/api/leaderboard/?around={user_ids[100]}&window=5&fields=rank')
+        ))
+        self.assertEqual(len(responses[0].data['results']), 11)
+        self.assertEqual(reads, 4)  # cache versions + the user's entry + above + from it down
+        plan = mongo.get_db().leaderboard.find({'rank': {'$lt': 50}}).sort(
+            [('rank', -1), ('_id', -1)]
+        ).limit(5).explain()['queryPlanner']['winningPlan']
+        self.assertIn('rank_1__id_1', json.dumps(plan, default=str))
+        self.assertNotIn('"SORT"', json.dumps(plan, default=str))
+
+    def test_leaderboard_single_user_rank(self):
+        user_ids = self.seed_board(5)
+        response = self.client.get(f'/api/leaderboard/{user_ids[3]}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['rank'], response.data['user_name']), (4, 'racer4'))
+        response = self.client.get(f'/api/leaderboard/{user_ids[3]}/?fields=rank')
+        self.assertEqual(response.data, {'rank': 4})
+        self.assertEqual(self.client.get(f'/api/leaderboard/{bson.ObjectId()}/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_leaderboard_invalid_cursor(self):
+        response = self.client.get('/api/leaderboard/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LeaderboardSnapshotTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.db = mongo.get_db()
+        self.db.leaderboard.delete_many({})
+        self.db.leaderboard_snapshots.delete_many({})
+        self.users = [OctoFitUser.objects.create(
+            username=f'snap{i}', email=f'snap{i}@example.com', password='pass', age=20,
+        )._id for i in range(3)]
+        self.set_ranks([1, 2, 3])
+
+    def set_ranks(self, ranks):
+        for user_id, rank in zip(self.users, ranks):
+            self.db.leaderboard.update_one(
+                {'user_id': user_id},
+                {'$set': {'user_name': str(user_id), 'rank': rank, 'total_calories': 100 - rank}},
+                upsert=True,
+            )
+
+    def test_snapshot_rerun_replaces_version(self):
+        call_command('snapshot_leaderboard', period=['daily'], stdout=io.StringIO())
+        call_command('snapshot_leaderboard', period=['daily'], stdout=io.StringIO())
+        key = snapshots.snapshot_key(self.db, 'daily', datetime.datetime.now())
+        self.assertEqual(key['version'], 2)
+        self.assertEqual(self.db.leaderboard_snapshots.count_documents({'period': 'daily'}), 3)
+
+    def test_leaderboard_as_of_date(self):
+        last_week = datetime.datetime.now() - datetime.timedelta(days=7)
+        snapshots.take_snapshot(self.db, 'daily', when=last_week)
+        self.set_ranks([3, 2, 1])
+        response = self.client.get(f'/api/leaderboard/?as_of={last_week.date().isoformat()}&fields=rank')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['rank'] for entry in response.data['results']], [1, 2, 3])
+
+        response = self.client.get('/api/leaderboard/?as_of=2000-01-01')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rank_delta_since_last_week(self):
+        snapshots.take_snapshot(self.db, 'weekly', when=datetime.datetime.now() - datetime.timedelta(days=7))
+        self.set_ranks([3, 2, 1])
+        cache.bump_versions(self.db, 'leaderboard')
+        response = self.client.get('/api/leaderboard/?delta=weekly&fields=user_name,rank')
+        deltas = {entry['user_name']: entry['rank_delta'] for entry in response.data['results']}
+        self.assertEqual(deltas, {str(self.users[0]): -2, str(self.users[1]): 0, str(self.users[2]): 2})
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        db = mongo.get_db()
+        db.teams.insert_one({'team_id': 7, 'name': 'Async Team', 'members': []})
+        db.leaderboard.insert_many([
+            {'user_name': f'async{rank}', 'team_id': 7, 'total_calories': 100 - rank, 'rank': rank}
+            for rank in range(1, 4)
+        ])
+        cache.bump_versions(db, 'leaderboard', 'teams')
+
+    def test_async_leaderboard_matches_sync(self):
+        sync = self.client.get('/api/leaderboard/?page_size=2')
+        response = self.client.get('/api/async/leaderboard/?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], json.loads(json.dumps(sync.data['results'])))
+        self.assertEqual(response.json()['results'][0]['team'], 'Async Team')
+        self.assertIn('mongo;dur=', response['Server-Timing'])
+
+    def test_async_workouts_and_teams(self):
+        self.assertEqual(self.client.get('/api/async/workouts/').status_code, status.HTTP_200_OK)
+        teams = self.client.get('/api/async/teams/?fields=name,members').json()['results']
+        self.assertIn({'name': 'Async Team', 'members': []}, teams)
+
+    def test_async_rejects_writes_and_bad_cursor(self):
+        response = self.client.post('/api/async/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        response = self.client.get('/api/async/leaderboard/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ActivityStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.db = mongo.get_db()
+        self.db.activities.delete_many({})
+        self.user = OctoFitUser.objects.create(username='streaker', email='streak@example.com', password='pass')
+        other = OctoFitUser.objects.create(username='casual', email='casual@example.com', password='pass')
+        day = datetime.datetime(2024, 3, 1)
+        rows = [(self.user._id, 'Running', 30, 250, 0), (self.user._id, 'Running', 50, 420, 1),
+                (self.user._id, 'Yoga', 20, 90, 2), (self.user._id, 'Running', 40, 380, 2),
+                (self.user._id, 'Running', 60, 510, 4), (other._id, 'Yoga', 45, 150, 0)]
+        self.db.activities.insert_many([
+            {'user_id': user_id, 'activity_type': activity_type, 'duration': duration,
+             'distance': 0, 'calories': calories, 'date': day + datetime.timedelta(days=offset)}
+            for user_id, activity_type, duration, calories, offset in rows
+        ])
+        cache.bump_versions(self.db, 'activities')
+
+    def test_stats_endpoint(self):
+        response = self.client.get('/api/stats/?start=2024-03-01&end=2024-03-06&bin_width=200')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['activities'], 6)
+
+        running = response.data['duration_percentiles'][0]
+        self.assertEqual((running['activity_type'], running['count'], running['mean']), ('Running', 4, 45.0))
+        self.assertEqual(running['p50'], 45.0)
+        self.assertEqual(
+            [(row['min'], row['count']) for row in response.data['calorie_histogram']],
+            [(0, 2), (200, 2), (400, 2)],
+        )
+
+        streaks = response.data['streaks']
+        self.assertEqual(streaks['active_users'], 2)
+        leader = streaks['top'][0]
+        self.assertEqual((leader['user_name'], leader['longest'], leader['current']), ('streaker', 3, 1))
+
+    def test_negative_calories_get_their_own_bin(self):
+        self.db.activities.insert_one({
+            'user_id': self.user._id, 'activity_type': 'Yoga', 'duration': 10, 'distance': 0,
+            'calories': -50, 'date': datetime.datetime(2024, 3, 3),
+        })
+        cache.bump_versions(self.db, 'activities')
+        response = self.client.get('/api/stats/?start=2024-03-01&end=2024-03-06&bin_width=200')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['min'], row['count']) for row in response.data['calorie_histogram']],
+            [(-200, 1), (0, 2), (200, 2), (400, 2)],
+        )
+
+    def test_stats_rejects_bad_params(self):
+        self.assertEqual(self.client.get('/api/stats/?start=2024-03-06&end=2024-03-01').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/stats/?bin_width=0').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_activity_stats_command(self):
+        out = io.StringIO()
+        call_command('activity_stats', start='2024-03-01', end='2024-03-06', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['activities'], 6)
+
 
 class WorkoutTests(TestCase):
     def setUp(self):
@@ -104,6 +876,140 @@ class WorkoutTests(TestCase):
         response = self.client.post('/api/workouts/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_filter_by_difficulty_and_duration(self):
+        db = mongo.get_db()
+        db.workouts.delete_many({})
+        db.workouts.insert_many([
+            {'title': 'Stretch', 'difficulty': 'Easy', 'duration': 15},
+            {'title': 'Tempo Run', 'difficulty': 'Medium', 'duration': 40},
+            {'title': 'Intervals', 'difficulty': 'Hard', 'duration': 30},
+            {'title': 'Long Ride', 'difficulty': 'Hard', 'duration': 120},
+        ])
+        cache.bump_versions(db, 'workouts')
+        response = self.client.get('/api/workouts/?difficulty=Medium,Hard&duration_min=30&duration_max=60')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(w['title'] for w in response.data['results']), ['Intervals', 'Tempo Run'])
+        response = self.client.get('/api/workouts/?duration_min=long')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.db = mongo.get_db()
+        for collection in ('users', 'teams', 'workouts'):
+            self.db[collection].delete_many({})
+        call_command('ensure_indexes', collection=['users', 'teams', 'workouts'], stdout=io.StringIO())
+        self.db.users.insert_many([
+            {'username': 'captain', 'name': 'Captain Marvel', 'email': 'marvel@example.com'},
+            {'username': 'ironman', 'name': 'Tony Stark', 'email': 'tony@example.com'},
+        ])
+        self.db.teams.insert_one({'team_id': 1, 'name': 'Marvel Runners', 'members': []})
+        self.db.workouts.insert_many([
+            {'title': 'Marathon Prep', 'description': 'Long runs for runners', 'difficulty': 'Hard',
+             'duration': 90, 'recommended_for': ['runners']},
+            {'title': 'Core Strength', 'description': 'Planks and crunches', 'difficulty': 'Easy',
+             'duration': 20, 'recommended_for': ['everyone']},
+        ])
+        cache.bump_versions(self.db, 'users', 'teams', 'workouts')
+
+    def test_full_text_across_collections(self):
+        response = self.client.get('/api/search/?q=marvel')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['partial'])
+        self.assertEqual(
+            sorted((row['type'], row['title']) for row in response.data['results']),
+            [('team', 'Marvel Runners'), ('user', 'Captain Marvel')],
+        )
+
+    def test_prefix_matches_partial_words(self):
+        response = self.client.get('/api/search/?q=Capt')
+        self.assertEqual([row['title'] for row in response.data['results']], ['Captain Marvel'])
+        response = self.client.get('/api/search/?q=mara&type=workouts')
+        self.assertEqual([row['title'] for row in response.data['results']], ['Marathon Prep'])
+
+    def test_results_are_ranked(self):
+        response = self.client.get('/api/search/?q=runners')
+        titles = [row['title'] for row in response.data['results']]
+        self.assertEqual(set(titles), {'Marvel Runners', 'Marathon Prep'})
+        scores = [row['score'] for row in response.data['results']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_pagination(self):
+        first = self.client.get('/api/search/?q=marvel&page_size=1')
+        self.assertEqual(len(first.data['results']), 1)
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 1)
+        self.assertIsNone(second.data['next'])
+        self.assertNotEqual(first.data['results'][0]['_id'], second.data['results'][0]['_id'])
+
+    def test_partial_when_cut_off_at_max_results(self):
+        with self.settings(SEARCH={'TIME_BUDGET_MS': 200, 'MAX_RESULTS': 1}):
+            response = self.client.get('/api/search/?q=marvel&type=users,teams')
+        self.assertTrue(response.data['partial'])
+        self.assertFalse(self.client.get('/api/search/?q=marvel&type=users,teams').data['partial'])
+
+    def test_rejects_bad_params(self):
+        for url in ('/api/search/', '/api/search/?q=' + 'x' * 101, '/api/search/?q=a&type=activities',
+                    '/api/search/?q=a&page_size=500'):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST, url)
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.db = mongo.get_db()
+        self.db.workouts.delete_many({})
+        self.db.workouts.insert_many([
+            {'title': f'Workout {i}', 'description': 'Intervals and recovery ' * 10, 'difficulty': 'Medium',
+             'duration': 30}
+            for i in range(20)
+        ])
+        cache.bump_versions(self.db, 'workouts')
+
+    def test_gzip_with_encoded_etag(self):
+        plain = self.client.get('/api/workouts/')
+        response = self.client.get('/api/workouts/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(response['ETag'], plain['ETag'][:-1] + '-gzip"')
+
+        revalidated = self.client.get('/api/workouts/', HTTP_ACCEPT_ENCODING='gzip',
+                                      HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/api/workouts/?page_size=1&fields=title', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_negotiation(self):
+        self.assertEqual(compression.negotiate('gzip, br;q=0.5', ('br', 'gzip')), 'gzip')
+        self.assertEqual(compression.negotiate('br, gzip', ('br', 'gzip')), 'br')
+        self.assertEqual(compression.negotiate('*;q=0.1', ('gzip',)), 'gzip')
+        self.assertIsNone(compression.negotiate('gzip;q=0, identity', ('gzip',)))
+
+    def test_streaming_export_is_compressed(self):
+        response = self.client.get('/api/activities/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        gzip.decompress(b''.join(response.streaming_content))
+
+    def test_activity_list_revalidates_on_collection_versions(self):
+        first = self.client.get('/api/activities/')
+        self.assertEqual(
+            self.client.get('/api/activities/', HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        cache.bump_versions(self.db, 'activities')
+        self.assertEqual(
+            self.client.get('/api/activities/', HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+            status.HTTP_200_OK,
+        )
+
 
 class ApiRootTests(TestCase):
     def setUp(self):
@@ -116,3 +1022,268 @@ class ApiRootTests(TestCase):
     def test_root_redirects_to_api(self):
         response = self.client.get('/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class MongoPoolTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_get_db_reuses_shared_client(self):
+        self.assertIs(mongo.get_db().client, mongo.get_db().client)
+
+    def test_client_recreated_in_forked_process(self):
+        parent_client = mongo.get_client()
+        # The replaced client is no longer shared; close it and its monitor threads
+        self.addCleanup(parent_client.close)
+        mongo._client_pid = -1  # pretend the client was inherited from a parent process
+        self.assertIsNot(mongo.get_client(), parent_client)
+
+    def test_pool_stats(self):
+        mongo.get_db().command('ping')
+        response = self.client.get('/api/mongo/pool/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(response.data['checkouts'], 1)
+        self.assertIn('wait_time_avg_ms', response.data)
+        self.assertIn('in_use', response.data)
+
+
+class MongoInstrumentationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        instrumentation.endpoint_stats.reset()
+
+    def test_server_timing_and_endpoint_stats(self):
+        response = self.client.get('/api/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('mongo;dur=', response['Server-Timing'])
+
+        stats = self.client.get('/api/mongo/commands/').data
+        row = stats['GET octofit_tracker:leaderboard-list']
+        self.assertEqual(row['requests'], 1)
+        self.assertGreaterEqual(row['commands'], 1)
+        self.assertIn('leaderboard', row['collections'])
+
+    def test_records_command_details(self):
+        db = mongo.get_db()
+        db.workouts.insert_many([{'title': 'A'}, {'title': 'B'}])
+        with instrumentation.command_recorder.recording() as profile:
+            list(db.workouts.find({'title': {'$exists': True}}))
+        command = profile.commands[-1]
+        self.assertEqual(command['command'], 'find')
+        self.assertEqual(command['collection'], 'workouts')
+        self.assertEqual(command['shape'], ('title',))
+        self.assertEqual(command['documents'], 2)
+
+    def test_detects_repeated_queries(self):
+        db = mongo.get_db()
+        with instrumentation.command_recorder.recording() as profile:
+            for _ in range(5):
+                db.users.find_one({'email': 'nobody@example.com'})
+        self.assertEqual(profile.repeated_queries(5), {('find', 'users', ('email',)): 5})
+        self.assertEqual(profile.repeated_queries(6), {})
+
+
+class IndexTests(TestCase):
+    def test_ensure_indexes_is_idempotent(self):
+        call_command('ensure_indexes', stdout=io.StringIO())
+        call_command('ensure_indexes', stdout=io.StringIO())
+        self.assertEqual(missing_indexes(mongo.get_db()), [])
+        self.assertEqual([w for w in check_mongo_indexes(None) if w.id == 'octofit_tracker.W001'], [])
+
+    def test_migration_unique_index_satisfies_registry(self):
+        db = mongo.get_db()
+        # The unique username_1 that djongo's migrations build for OctoFitUser.username
+        db.users.create_index('username', name='username_1', unique=True)
+        registry = {'users': [IndexModel([('username', 1)], name='username_1')]}
+        with mock.patch.dict(INDEXES, registry, clear=True):
+            self.assertEqual(missing_indexes(db), [])
+            self.assertEqual(ensure_indexes(db), [])
+            self.assertEqual(ensure_indexes(db), [])
+
+    def test_check_warns_about_missing_index(self):
+        db = mongo.get_db()
+        call_command('ensure_indexes', stdout=io.StringIO())
+        db.leaderboard.drop_index('rank_1__id_1')
+        warnings = check_mongo_indexes(None)
+        self.assertIn('leaderboard.rank_1__id_1', ' '.join(w.msg for w in warnings))
+        call_command('ensure_indexes', collection=['leaderboard'], stdout=io.StringIO())
+
+    def test_index_report(self):
+        call_command('ensure_indexes', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('ensure_indexes', report=True, stdout=out)
+        for collection in INDEXES:
+            self.assertIn(f'{collection}.', out.getvalue())
+
+
+class PopulateDbTests(TestCase):
+    def test_generates_requested_volume_with_consistent_rollups(self):
+        call_command(
+            'populate_db', users=25, teams=3, activities_per_user='4', days=7, seed=1,
+            batch_size=10, stdout=io.StringIO(),
+        )
+        db = mongo.get_db()
+        self.assertEqual(db.users.count_documents({}), 25)
+        self.assertEqual(db.teams.count_documents({}), 3)
+        self.assertEqual(db.activities.count_documents({}), 100)
+        self.assertEqual(sum(len(team['members']) for team in db.teams.find()), 25)
+
+        totals = {
+            row['_id']: row['calories']
+            for row in db.activities.aggregate([{'$group': {'_id': '$user_id', 'calories': {'$sum': '$calories'}}}])
+        }
+        for entry in db.leaderboard.find():
+            self.assertEqual(entry['total_calories'], totals[entry['user_id']])
+            self.assertEqual(entry['total_activities'], 4)
+        self.assertEqual(db.leaderboard.find_one({'rank': 1})['total_calories'], max(totals.values()))
+
+    def test_seeds_with_unique_indexes_in_place(self):
+        db = mongo.get_db()
+        call_command('ensure_indexes', collection=['users', 'teams'], stdout=io.StringIO())
+        for _ in range(2):
+            call_command('populate_db', users=15, teams=2, activities_per_user='1', seed=2,
+                         batch_size=4, stdout=io.StringIO())
+        self.assertEqual(len(db.users.distinct('username')), 15)
+        self.assertEqual(db.users.find_one({'email': 'tony.stark@marvel.com'})['username'], 'tony.stark')
+
+
+class ImportDataTests(TestCase):
+    def setUp(self):
+        self.db = mongo.get_db()
+        self.db.import_checkpoints.delete_many({})
+        self.directory = tempfile.mkdtemp()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as fh:
+            fh.write(content)
+        return path
+
+    def test_import_upserts_on_natural_keys(self):
+        teams = self.write('teams.csv', 'team_id,name\n801,Import Team\n')
+        users = self.write('users.ndjson', '\n'.join(json.dumps(row) for row in [
+            {'email': 'Imported@Example.com', 'username': 'imported', 'name': 'Imported', 'team_id': 801},
+            {'name': 'no email'},
+        ]))
+        activities = self.write('activities.csv', (
+            'user_email,activity_type,duration,distance,calories,date\n'
+            'imported@example.com,Running,30,5,300,2024-01-01\n'
+            'imported@example.com,Yoga,20,,100,2024-01-02\n'
+            'nobody@example.com,Running,10,1,50,2024-01-03\n'
+        ))
+        out = io.StringIO()
+        call_command('import_data', teams=[teams], users=[users], activities=[activities],
+                     batch_size=2, stdout=out)
+        self.assertIn('rows/s', out.getvalue())
+        self.assertIn("record 2: {'email'", out.getvalue())
+        self.assertIn("record 3: {'user_email'", out.getvalue())
+
+        user = self.db.users.find_one({'email': 'imported@example.com'})
+        self.assertEqual(self.db.teams.find_one({'team_id': 801})['members'], [user['_id']])
+        entry = self.db.leaderboard.find_one({'user_id': user['_id']})
+        self.assertEqual((entry['total_activities'], entry['total_calories']), (2, 400))
+        self.assertEqual(entry['team_name'], 'Import Team')
+
+        # A corrected file is a new version: the same records are updated, not duplicated
+        self.write('activities.csv', (
+            'user_email,activity_type,duration,distance,calories,date\n'
+            'imported@example.com,Running,30,5,350,2024-01-01\n'
+        ))
+        os.utime(activities, (0, 0))
+        call_command('import_data', activities=[activities], stdout=io.StringIO())
+        self.assertEqual(self.db.activities.count_documents({'user_id': user['_id']}), 2)
+        self.assertEqual(self.db.leaderboard.find_one({'user_id': user['_id']})['total_calories'], 450)
+
+    def test_usernames_are_unique_and_conflicts_are_per_record(self):
+        call_command('ensure_indexes', collection=['users'], stdout=io.StringIO())
+        self.db.users.delete_many({'email': {'$regex': '^john'}})
+        self.db.users.insert_one({'email': 'john@old.example', 'username': 'john', 'password': ''})
+        path = self.write('users.ndjson', '\n'.join(json.dumps(row) for row in [
+            {'email': 'john@a.example'},
+            {'email': 'john@b.example'},
+            {'email': 'johnny@c.example', 'username': 'john'},
+            {'email': 'john@d.example', 'username': 'john.d'},
+        ]))
+        out = io.StringIO()
+        call_command('import_data', users=[path], stdout=out)
+        self.assertIn('record 3:', out.getvalue())
+        self.assertIn('Import finished with 1 rejected record(s)', out.getvalue())
+        usernames = {
+            user['email']: user['username'] for user in self.db.users.find({'email': {'$regex': '^john'}})
+        }
+        self.assertEqual(usernames, {
+            'john@old.example': 'john', 'john@a.example': 'john2', 'john@b.example': 'john3',
+            'john@d.example': 'john.d',
+        })
+        checkpoint = self.db.import_checkpoints.find_one()
+        self.assertEqual((checkpoint['position'], checkpoint['completed']), (4, True))
+
+    def test_interrupted_import_resumes_from_checkpoint(self):
+        path = self.write('workouts.ndjson', '\n'.join(
+            json.dumps({'title': f'Imported workout {n}', 'duration': n}) for n in range(1, 6)
+        ))
+        failing = mock.Mock(side_effect=[(2, []), RuntimeError])
+        with mock.patch.dict(importer.IMPORTERS, {'workouts': failing}):
+            with self.assertRaises(RuntimeError):
+                call_command('import_data', workouts=[path], batch_size=2, stdout=io.StringIO())
+        checkpoint = self.db.import_checkpoints.find_one()
+        self.assertEqual((checkpoint['position'], checkpoint['completed']), (2, False))
+
+        out = io.StringIO()
+        call_command('import_data', workouts=[path], batch_size=2, stdout=out)
+        self.assertIn('resumed after record 2', out.getvalue())
+        titles = {doc['title'] for doc in self.db.workouts.find({'title': {'$regex': '^Imported workout'}})}
+        self.assertEqual(titles, {f'Imported workout {n}' for n in range(3, 6)})
+
+        out = io.StringIO()
+        call_command('import_data', workouts=[path], stdout=out)
+        self.assertIn('already imported', out.getvalue())
+
+
+class BenchmarkTests(TestCase):
+    def row(self, p95, rps, commands):
+        return {'p95_ms': p95, 'throughput_rps': rps, 'mongo_commands_per_request': commands, 'errors': 0}
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark_api.percentile(values, 50), 50)
+        self.assertEqual(benchmark_api.percentile(values, 99), 99)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'endpoints': {'teams': self.row(10.0, 500.0, 3)}}
+        current = {'endpoints': {'teams': self.row(15.0, 300.0, 12)}}
+        regressions = benchmark_api.Command().compare(baseline, current, tolerance=20)
+        self.assertEqual(len(regressions), 3)
+
+        current = {'endpoints': {'teams': self.row(11.0, 450.0, 3)}}
+        self.assertEqual(benchmark_api.Command().compare(baseline, current, tolerance=20), [])
+
+    def test_compare_sync_and_async_endpoints(self):
+        out = io.StringIO()
+        call_command(
+            'benchmark_api', seed_data=True, users=10, teams=2, activities_per_user='1', requests=6, concurrency=3,
+            compare_async=True, endpoint=['workouts'], stdout=out,
+        )
+        self.assertIn('async_workouts', out.getvalue())
+        self.assertIn('in-process -> asgi-in-process', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('benchmark_api', compare_async=True, url='http://localhost:8000', stdout=io.StringIO())
+
+    def test_serializer_benchmark(self):
+        out = io.StringIO()
+        call_command('benchmark_serializers', rows=50, repeat=1, stdout=out)
+        self.assertIn('activities: fast path is', out.getvalue())
+
+    def test_analytics_benchmark_reports_match(self):
+        out = io.StringIO()
+        call_command('benchmark_analytics', rows=2000, users=30, repeat=1, stdout=out)
+        self.assertIn('reports match', out.getvalue())
+
+    def test_in_process_run_counts_mongo_commands(self):
+        out = io.StringIO()
+        call_command(
+            'benchmark_api', seed_data=True, users=20, teams=2, activities_per_user='2', requests=5, concurrency=2,
+            endpoint=['teams', 'partial_update'], stdout=out,
+        )
+        self.assertIn('teams', out.getvalue())
+        self.assertIn('partial_update', out.getvalue())
@@ -7,12 +7,19 @@ import os
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from octofit_tracker import async_views
 from octofit_tracker.views import (
     api_root,
+    activities_export,
+    mongo_command_stats,
+    mongo_pool_stats,
+    response_cache_stats,
     OctoFitUserViewSet,
     TeamViewSet,
     ActivityViewSet,
     LeaderboardViewSet,
+    SearchViewSet,
+    StatsViewSet,
     WorkoutViewSet,
 )
 
@@ -22,6 +29,8 @@ router.register(r'teams', TeamViewSet, basename='team')
 router.register(r'activities', ActivityViewSet, basename='activity')
 router.register(r'leaderboard', LeaderboardViewSet, basename='leaderboard')
 router.register(r'workouts', WorkoutViewSet, basename='workout')
+router.register(r'stats', StatsViewSet, basename='stats')
+router.register(r'search', SearchViewSet, basename='search')
 
 codespace_name = os.environ.get('CODESPACE_NAME')
 if codespace_name:
@@ -34,6 +43,13 @@ app_name = 'octofit_tracker'
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api_root, name='api-root'),
+    path('api/mongo/pool/', mongo_pool_stats, name='mongo-pool-stats'),
+    path('api/mongo/commands/', mongo_command_stats, name='mongo-command-stats'),
+    path('api/cache/stats/', response_cache_stats, name='response-cache-stats'),
+    path('api/async/leaderboard/', async_views.leaderboard_list, name='async-leaderboard-list'),
+    path('api/async/workouts/', async_views.workout_list, name='async-workout-list'),
+    path('api/async/teams/', async_views.team_list, name='async-team-list'),
+    path('api/activities/export/', activities_export, name='activities-export'),
     path('api/', include((router.urls, 'octofit_tracker'), namespace='octofit_tracker')),
     path('', api_root, name='root'),
 ]
@@ -0,0 +1,31 @@
+from datetime import datetime, time
+
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parse_iso_datetime(value):
+    """Parse an ISO date or datetime string; ``None`` if it is not one.
+
+    Plain dates become midnight, matching how activity dates are stored.
+    """
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            parsed = datetime.combine(parsed_date, time.min) if parsed_date else None
+    except ValueError:
+        return None
+    return parsed
+
+
+def json_constant(name):
+    """``parse_constant`` hook that keeps ``NaN``/``Infinity``/``-Infinity`` as strings.
+
+    ``json.loads`` would turn them into non-finite floats; as strings they
+    fail number validation for their own row.
+    """
+    return name
@@ -1,25 +1,39 @@
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from rest_framework import viewsets, status
+from rest_framework.parsers import JSONParser
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
 from rest_framework.reverse import reverse
-from pymongo import MongoClient
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
 from .models import OctoFitUser, Team, Activity, Leaderboard, Workout
+from .mongo import get_db, pool_stats
+from . import leaderboard, outbox, snapshots
+from .instrumentation import endpoint_stats
+from .cache import VersionedWritesMixin, cache_response, cache_stats, conditional_response
+from .team_stats import PERIODS, team_stats
+from .analytics import activity_stats
+from .search import MAX_QUERY_LENGTH, SOURCES as SEARCH_SOURCES, search
+from .export import EXPORT_FORMATS, export_activities
+from .ingest import MAX_ROWS, ingest_activities
+from .parsers import NDJSONParser
+from .fast_serializers import ACTIVITY_SOURCES, activity_row, fetch_users, user_row
+from .utils import parse_iso_datetime
+from .pagination import MongoCursorPagination, mongo_projection, requested_fields, select_fields
 from .serializers import (
     OctoFitUserSerializer,
     TeamSerializer,
     ActivitySerializer,
     LeaderboardSerializer,
     WorkoutSerializer,
+    fetch_team_docs,
 )
 
 
-def get_mongo_db():
-    client = MongoClient('localhost', 27017)
-    return client['octofit_db']
-
-
 @api_view(['GET'])
 def api_root(request, format=None):
     return Response({
@@ -28,16 +42,112 @@ def api_root(request, format=None):
         'activities': reverse('octofit_tracker:activity-list', request=request, format=format),
         'leaderboard': reverse('octofit_tracker:leaderboard-list', request=request, format=format),
         'workouts': reverse('octofit_tracker:workout-list', request=request, format=format),
+        'stats': reverse('octofit_tracker:stats-list', request=request, format=format),
+        'search': reverse('octofit_tracker:search-list', request=request, format=format),
     })
 
 
-class OctoFitUserViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+def mongo_pool_stats(request, format=None):
+    """Connection pool counters of this worker's shared MongoDB client."""
+    return Response(pool_stats.snapshot())
+
+
+@api_view(['GET'])
+def mongo_command_stats(request, format=None):
+    """MongoDB commands per endpoint recorded by this worker's instrumentation middleware."""
+    return Response(endpoint_stats.snapshot())
+
+
+@api_view(['GET'])
+def response_cache_stats(request, format=None):
+    """Hit/miss counters of this worker's response cache."""
+    return Response(cache_stats.snapshot())
+
+
+@require_GET
+def activities_export(request):
+    """Stream the activity history as NDJSON or CSV for analytics pulls.
+
+    Query params: ``format`` (``ndjson`` or ``csv``), ``since`` (ISO date or
+    datetime) and ``gzip`` (``1`` to compress the stream).
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse(
+            {'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    since = None
+    if request.GET.get('since'):
+        since = parse_iso_datetime(request.GET['since'])
+        if since is None:
+            return JsonResponse({'error': 'Invalid since date'}, status=status.HTTP_400_BAD_REQUEST)
+    use_gzip = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    filename = f'activities.{export_format}'
+    content_type = EXPORT_FORMATS[export_format]
+    if use_gzip:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(
+        export_activities(get_db(), export_format=export_format, since=since, gzip=use_gzip),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class ProjectedListMixin:
+    """Applies ``?fields=`` to list responses and pushes it down to the query with ``only()``."""
+
+    def get_requested_fields(self):
+        if self.action != 'list':
+            return None
+        if not hasattr(self, '_requested_fields'):
+            serializer_fields = self.get_serializer_class()().fields
+            readable = [name for name, field in serializer_fields.items() if not field.write_only]
+            self._requested_fields = requested_fields(self.request, readable)
+        return self._requested_fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        if fields is not None:
+            model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+            queryset = queryset.only(*[name for name in fields if name in model_fields] or ['_id'])
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_requested_fields()
+        return context
+
+
+class OctoFitUserViewSet(VersionedWritesMixin, ProjectedListMixin, viewsets.ModelViewSet):
     queryset = OctoFitUser.objects.all()
     serializer_class = OctoFitUserSerializer
+    cache_collections = ('users', 'teams')
+
+    @conditional_response('users')
+    def list(self, request, *args, **kwargs):
+        """Read-only fast path: raw documents to rows, no ``ModelSerializer``."""
+        fields = self.get_requested_fields()
+        paginator = MongoCursorPagination()
+        docs = paginator.paginate_collection(get_db().users, request, projection=mongo_projection(fields))
+        return paginator.get_paginated_response([select_fields(user_row(doc), fields) for doc in docs])
 
     def partial_update(self, request, pk=None):
-        """Update user fields + team membership directly in MongoDB."""
-        db = get_mongo_db()
+        """Update user fields + team membership directly in MongoDB.
+
+        The user's ``team_id`` field is the source of truth for membership;
+        the move updates it atomically with the other fields, then pulls the
+        user from the (index-matched) teams that still list them and adds
+        them to the new team. A ``team_id`` that names no team is rejected
+        with 400 before anything is written. The response is built from the
+        write results.
+        """
+        db = get_db()
         try:
             user_oid = ObjectId(pk)
         except Exception:
@@ -56,30 +166,58 @@ class OctoFitUserViewSet(viewsets.ModelViewSet):
                 else:
                     update_fields[field] = val
 
-        if update_fields:
-            db.users.update_one({'_id': user_oid}, {'$set': update_fields})
-
-        # Handle team membership change
-        if 'team_id' in request.data:
+        # Resolve the target team, if membership is changing
+        team_doc = None
+        move_team = 'team_id' in request.data
+        if move_team:
             new_team_id = request.data.get('team_id')
-            # Remove user from all teams first
-            db.teams.update_many({}, {'$pull': {'members': user_oid}})
-            if new_team_id is not None:
-                try:
-                    new_team_id = int(new_team_id)
-                except (ValueError, TypeError):
-                    new_team_id = None
+            team_error = None
+            try:
+                new_team_id = int(new_team_id) if new_team_id is not None else None
+            except (ValueError, TypeError):
+                team_error = 'A valid integer is required.'
+            else:
                 if new_team_id is not None:
-                    # Add user to the chosen team
-                    db.teams.update_one({'team_id': new_team_id}, {'$addToSet': {'members': user_oid}})
+                    team_doc = db.teams.find_one({'team_id': new_team_id}, {'team_id': 1, 'name': 1})
+                    if team_doc is None:
+                        team_error = 'Team does not exist.'
+            if team_error:
+                # Nothing is written; an unknown user still answers 404
+                if not db.users.find_one({'_id': user_oid}, {'_id': 1}):
+                    return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+                return Response({'team_id': [team_error]}, status=status.HTTP_400_BAD_REQUEST)
+            update_fields['team_id'] = new_team_id
 
-        # Return updated user doc
-        doc = db.users.find_one({'_id': user_oid})
-        if not doc:
+        if update_fields:
+            before = db.users.find_one_and_update(
+                {'_id': user_oid},
+                {'$set': update_fields},
+                return_document=ReturnDocument.BEFORE,
+            )
+        else:
+            before = db.users.find_one({'_id': user_oid})
+        if not before:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+        doc = {**before, **update_fields}
+
+        if move_team:
+            new_team_id = update_fields['team_id']
+            # Only teams that still list the user are touched (members index)
+            db.teams.update_many(
+                {'members': user_oid, 'team_id': {'$ne': new_team_id}},
+                {'$pull': {'members': user_oid}},
+            )
+            if new_team_id is not None:
+                db.teams.update_one({'team_id': new_team_id}, {'$addToSet': {'members': user_oid}})
+            db.leaderboard.update_one({'user_id': user_oid}, {'$set': {
+                'team_id': new_team_id,
+                'team_name': team_doc.get('name') if team_doc else None,
+            }})
+        elif doc.get('team_id') is not None:
+            team_doc = db.teams.find_one({'team_id': doc['team_id']}, {'team_id': 1, 'name': 1})
+        else:
+            team_doc = db.teams.find_one({'members': user_oid}, {'team_id': 1, 'name': 1})
 
-        # Find current team
-        team_doc = db.teams.find_one({'members': user_oid})
         return Response({
             '_id': str(doc['_id']),
             'name': doc.get('name', ''),
@@ -91,55 +229,508 @@ class OctoFitUserViewSet(viewsets.ModelViewSet):
         })
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(VersionedWritesMixin, ProjectedListMixin, viewsets.ModelViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
+    cache_collections = ('teams',)
+
+    def perform_update(self, serializer):
+        """Renames are copied onto the members' leaderboard entries."""
+        team = serializer.save()
+        db = get_db()
+        team_doc = db.teams.find_one({'_id': team._id}, {'team_id': 1, 'name': 1})
+        if team_doc and team_doc.get('team_id') is not None:
+            leaderboard.rename_team(db, team_doc['team_id'], team_doc.get('name'))
+
+    def perform_destroy(self, instance):
+        db = get_db()
+        team_doc = db.teams.find_one({'_id': instance._id}, {'team_id': 1})
+        instance.delete()
+        if team_doc and team_doc.get('team_id') is not None:
+            leaderboard.rename_team(db, team_doc['team_id'], None)
+
+    @cache_response('teams', 'users')
+    def list(self, request, *args, **kwargs):
+        """Resolve team ids and members for the whole page in one query."""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        teams = list(page if page is not None else queryset)
 
+        context = self.get_serializer_context()
+        fields = context['fields']
+        if fields is None or 'team_id' in fields or 'members' in fields:
+            context['team_docs'] = fetch_team_docs(get_db(), [team._id for team in teams])
+        serializer = self.get_serializer_class()(teams, many=True, context=context)
 
-class ActivityViewSet(viewsets.ModelViewSet):
-    queryset = Activity.objects.all()
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @action(detail=False)
+    def stats(self, request):
+        """Team totals, averages and ranks for a window, overall and per period.
+
+        Query params: ``start``/``end`` (ISO dates, default the last 30 days)
+        and ``period`` (``day``, ``week`` or ``month``).
+        """
+        period = request.query_params.get('period', 'week')
+        if period not in PERIODS:
+            return Response(
+                {'error': f"period must be one of: {', '.join(PERIODS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        start, end = parse_window(request.query_params, timedelta(days=30))
+        if start is None:
+            return Response({'error': 'Invalid start/end window'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(team_stats(get_db(), start, end, period))
+
+
+class ActivityViewSet(VersionedWritesMixin, ProjectedListMixin, viewsets.ModelViewSet):
+    """Activities; every write submits its delta for the owner's leaderboard entry.
+
+    With ``LEADERBOARD_WRITE_BEHIND`` the delta is queued in the outbox and
+    applied by ``process_activity_events`` (see ``outbox.py``).
+    """
+    queryset = Activity.objects.with_users()
     serializer_class = ActivitySerializer
+    # The leaderboard version is bumped where the board changes (leaderboard.py, outbox.py)
+    cache_collections = ('activities',)
+
+    def filter_query(self, db, params):
+        """Mongo filter for ``user_id``, ``team_id``, ``type``, ``date_from`` and ``date_to``.
+
+        Returns ``(query, error)``; dates are ISO dates or datetimes, inclusive.
+        """
+        query = {}
+        if params.get('user_id'):
+            try:
+                query['user_id'] = ObjectId(params['user_id'])
+            except Exception:
+                return None, 'Invalid user_id'
+        if params.get('team_id'):
+            try:
+                team_id = int(params['team_id'])
+            except ValueError:
+                return None, 'Invalid team_id'
+            team = db.teams.find_one({'team_id': team_id}, {'members': 1}) or {}
+            members = team.get('members', [])
+            if 'user_id' in query:
+                members = [member for member in members if member == query['user_id']]
+            query['user_id'] = {'$in': members}
+        if params.get('type'):
+            query['activity_type'] = params['type']
+        dates = {}
+        for param, operator in (('date_from', '$gte'), ('date_to', '$lte')):
+            if params.get(param):
+                value = parse_iso_datetime(params[param])
+                if value is None:
+                    return None, f'Invalid {param}'
+                dates[operator] = value
+        if dates:
+            query['date'] = dates
+        return query, None
+
+    @conditional_response('activities', 'teams', 'users')
+    def list(self, request, *args, **kwargs):
+        """Newest-first activities, filtered in MongoDB and cursor paginated.
+
+        Read-only fast path; the page's users are loaded with one ``$in`` query.
+        The ``(user_id|activity_type, date, _id)`` indexes keep a filtered page
+        O(page size) however many activities there are.
+        """
+        db = get_db()
+        query, error = self.filter_query(db, request.query_params)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        fields = self.get_requested_fields()
+        paginator = MongoCursorPagination(ordering=(('date', DESCENDING), ('_id', DESCENDING)))
+        docs = paginator.paginate_collection(
+            db.activities, request, query=query, projection=mongo_projection(fields, ACTIVITY_SOURCES)
+        )
+        users = {}
+        if fields is None or 'user' in fields:
+            users = fetch_users(db, [doc.get('user_id') for doc in docs])
+        return paginator.get_paginated_response(
+            [select_fields(activity_row(doc, users), fields) for doc in docs]
+        )
+
+    def perform_create(self, serializer):
+        activity = serializer.save()
+        outbox.submit(
+            get_db(), activity.user_id, leaderboard.activity_totals(activity),
+            key=f'activity:{activity._id}:create',
+        )
+
+    def perform_update(self, serializer):
+        old_user_id = serializer.instance.user_id
+        removed = leaderboard.activity_totals(serializer.instance, sign=-1)
+        activity = serializer.save()
+        added = leaderboard.activity_totals(activity)
+        db = get_db()
+        # Every update takes the next revision, which keys its events
+        revision = db.activities.find_one_and_update(
+            {'_id': activity._id}, {'$inc': {'revision': 1}},
+            projection={'revision': 1}, return_document=ReturnDocument.AFTER,
+        )['revision']
+        key = f'activity:{activity._id}:update:{revision}'
+        if activity.user_id == old_user_id:
+            outbox.submit(db, activity.user_id, leaderboard.add_totals(added, removed), key=key)
+        else:
+            outbox.submit(db, old_user_id, removed, key=f'{key}:remove')
+            outbox.submit(db, activity.user_id, added, key=f'{key}:add')
+
+    def perform_destroy(self, instance):
+        db = get_db()
+        activity_id = instance._id
+        instance.delete()
+        outbox.submit(
+            db, instance.user_id, leaderboard.activity_totals(instance, sign=-1),
+            key=f'activity:{activity_id}:delete',
+        )
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """Insert many activities from a JSON array or NDJSON body.
+
+        Responds 201 when every row was stored, 207 with per-row errors when
+        only some were, and 400 when none were.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'error': 'Expected a JSON array or NDJSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > MAX_ROWS:
+            return Response(
+                {'error': f'At most {MAX_ROWS} activities per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        result = ingest_activities(get_db(), rows)
+        if not result['errors']:
+            response_status = status.HTTP_201_CREATED
+        elif result['inserted']:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(result, status=response_status)
+
+
+LEADERBOARD_FIELDS = (
+    '_id', 'user_name', 'team', 'total_calories', 'total_activities',
+    'total_distance', 'total_duration', 'rank',
+)
+LEADERBOARD_SOURCES = {'team': ('team_id', 'team_name')}
+
+WORKOUT_FIELDS = (
+    '_id', 'title', 'description', 'difficulty', 'duration', 'exercises', 'recommended_for',
+)
+WORKOUT_SOURCES = {'title': ('title', 'name')}
+
+
+def leaderboard_entry(doc, teams):
+    team_id = doc.get('team_id')
+    return {
+        '_id': str(doc['_id']),
+        'user_name': doc.get('user_name', 'N/A'),
+        'team': doc.get('team_name') or teams.get(team_id, f'Team {team_id}' if team_id else 'N/A'),
+        'total_calories': doc.get('total_calories', 0),
+        'total_activities': doc.get('total_activities', 0),
+        'total_distance': doc.get('total_distance', 0),
+        'total_duration': doc.get('total_duration', 0),
+        'rank': doc.get('rank', 0),
+    }
+
+
+MAX_TOP = 100
+DEFAULT_WINDOW = 2
+MAX_WINDOW = 50
+MAX_BIN_WIDTH = 10000
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+
+
+def parse_bounded_int(value, maximum, minimum=1):
+    """``int(value)`` if it lies in ``[minimum, maximum]``, else ``None``."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if minimum <= value <= maximum else None
+
+
+def parse_window(params, default_length):
+    """``(start, end)`` from ISO ``start``/``end`` params; ``(None, None)`` if invalid.
+
+    ``end`` defaults to now and ``start`` to ``default_length`` before it.
+    """
+    end = parse_iso_datetime(params['end']) if params.get('end') else datetime.now()
+    start = end - default_length if end else None
+    if params.get('start'):
+        start = parse_iso_datetime(params['start'])
+    if start is None or end is None or start >= end:
+        return None, None
+    return start, end
+
+
+def workout_query(params):
+    """``(query, error)`` for the ``difficulty`` and ``duration_min``/``duration_max`` filters.
+
+    ``difficulty`` takes a comma-separated list; the filters are served by
+    the ``difficulty_1_duration_1`` index.
+    """
+    query = {}
+    if params.get('difficulty'):
+        levels = [level.strip() for level in params['difficulty'].split(',') if level.strip()]
+        query['difficulty'] = {'$in': levels}
+    duration = {}
+    for param, operator in (('duration_min', '$gte'), ('duration_max', '$lte')):
+        if params.get(param) is None:
+            continue
+        try:
+            duration[operator] = int(params[param])
+        except ValueError:
+            return None, f'{param} must be an integer'
+    if duration:
+        query['duration'] = duration
+    return query, None
+
+
+def unnamed_teams(db, docs):
+    """``team_id -> name`` for entries in ``docs`` that lack a ``team_name``."""
+    team_ids = list({
+        doc['team_id'] for doc in docs
+        if doc.get('team_id') is not None and not doc.get('team_name')
+    })
+    if not team_ids:
+        return {}
+    return {
+        t.get('team_id'): t.get('name', 'Unknown')
+        for t in db.teams.find({'team_id': {'$in': team_ids}}, {'team_id': 1, 'name': 1})
+    }
+
+
+def workout_entry(doc):
+    return {
+        '_id': str(doc['_id']),
+        'title': doc.get('title', doc.get('name', 'N/A')),
+        'description': doc.get('description', ''),
+        'difficulty': doc.get('difficulty', 'N/A'),
+        'duration': doc.get('duration', 0),
+        'exercises': doc.get('exercises', []),
+        'recommended_for': doc.get('recommended_for', []),
+    }
 
 
 class LeaderboardViewSet(ViewSet):
-    """Returns leaderboard data directly from MongoDB."""
+    """Returns leaderboard data directly from MongoDB, one rank-ordered page at a time."""
+
+    def get_board(self, db, params):
+        """``(collection, query, now, error response)`` for the current or an ``as_of`` board."""
+        period = params.get('period', 'daily')
+        delta = params.get('delta')
+        if period not in snapshots.PERIODS or (delta and delta not in snapshots.PERIODS):
+            return None, None, None, Response(
+                {'error': f"period and delta must be one of: {', '.join(snapshots.PERIODS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not params.get('as_of'):
+            return db.leaderboard, {}, datetime.now(), None
+        as_of = parse_iso_datetime(params['as_of'])
+        if as_of is None:
+            return None, None, None, Response({'error': 'Invalid as_of date'}, status=status.HTTP_400_BAD_REQUEST)
+        query = snapshots.snapshot_key(db, period, as_of)
+        if query is None:
+            return None, None, None, Response(
+                {'error': f'No {period} leaderboard snapshot on or before {params["as_of"]}'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return db.leaderboard_snapshots, query, as_of, None
+
+    def get_projection(self, fields):
+        projection = mongo_projection(fields, LEADERBOARD_SOURCES)
+        if self.request.query_params.get('delta') and projection is not None:
+            projection['user_id'] = 1
+        return projection
+
+    def get_entries(self, db, docs, fields, now):
+        """Serialize ``docs``, adding ``rank_delta`` when ``?delta=`` is given."""
+        # Entries carry team_name; only ones written before it existed need a lookup
+        teams = {}
+        if fields is None or 'team' in fields:
+            teams = unnamed_teams(db, docs)
+
+        entries = [select_fields(leaderboard_entry(doc, teams), fields) for doc in docs]
+        delta = self.request.query_params.get('delta')
+        if delta:
+            user_ids = [doc['user_id'] for doc in docs if doc.get('user_id') is not None]
+            ranks = snapshots.previous_ranks(db, delta, user_ids, now)
+            for entry, doc in zip(entries, docs):
+                previous = ranks.get(doc.get('user_id'))
+                entry['rank_delta'] = previous - doc.get('rank', 0) if previous is not None else None
+        return entries
+
+    @cache_response('leaderboard', 'leaderboard_snapshots', 'teams', 'users')
+    def list(self, request):
+        """Current leaderboard, or a historical one from ``leaderboard_snapshots``.
+
+        Query params: ``as_of`` (ISO date) reads the latest ``period`` snapshot
+        (``daily`` or ``weekly``, default ``daily``) taken on or before it;
+        ``delta`` (``daily`` or ``weekly``) adds each entry's ``rank_delta``
+        against the snapshot one period earlier (positive means moved up).
+        ``top=N`` returns only the first N entries and ``around=<user_id>``
+        the ``window`` entries (default 2) either side of that user; both are
+        bounded scans of the rank index and are not paginated.
+        """
+        db = get_db()
+        params = request.query_params
+        collection, query, now, error = self.get_board(db, params)
+        if error:
+            return error
+        fields = requested_fields(request, LEADERBOARD_FIELDS)
+        projection = self.get_projection(fields)
+
+        if params.get('top') or params.get('around'):
+            docs, error = self.bounded_docs(collection, query, projection, params)
+            if error:
+                return error
+            return Response({'next': None, 'previous': None, 'results': self.get_entries(db, docs, fields, now)})
+
+        paginator = MongoCursorPagination(ordering=(('rank', ASCENDING), ('_id', ASCENDING)))
+        docs = paginator.paginate_collection(collection, request, query=query, projection=projection)
+        return paginator.get_paginated_response(self.get_entries(db, docs, fields, now))
+
+    def bounded_docs(self, collection, query, projection, params):
+        """Docs for ``?top=`` or ``?around=``; returns ``(docs, error response)``."""
+        if params.get('top'):
+            top = parse_bounded_int(params['top'], MAX_TOP)
+            if top is None:
+                return None, Response(
+                    {'error': f'top must be an integer from 1 to {MAX_TOP}'}, status=status.HTTP_400_BAD_REQUEST
+                )
+            return leaderboard.top_entries(collection, query, top, projection), None
+
+        window = parse_bounded_int(params.get('window', DEFAULT_WINDOW), MAX_WINDOW, minimum=0)
+        if window is None:
+            return None, Response(
+                {'error': f'window must be an integer from 0 to {MAX_WINDOW}'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            user_oid = ObjectId(params['around'])
+        except Exception:
+            return None, Response({'error': 'Invalid user id'}, status=status.HTTP_400_BAD_REQUEST)
+        docs = leaderboard.entries_around(collection, query, user_oid, window, projection)
+        if docs is None:
+            return None, Response({'error': 'User is not on the leaderboard'}, status=status.HTTP_404_NOT_FOUND)
+        return docs, None
+
+    @cache_response('leaderboard', 'leaderboard_snapshots', 'teams', 'users')
+    def retrieve(self, request, pk=None):
+        """One user's entry and rank, by user id; a single ``user_id`` index lookup."""
+        db = get_db()
+        collection, query, now, error = self.get_board(db, request.query_params)
+        if error:
+            return error
+        try:
+            user_oid = ObjectId(pk)
+        except Exception:
+            return Response({'error': 'Invalid user id'}, status=status.HTTP_400_BAD_REQUEST)
+        fields = requested_fields(request, LEADERBOARD_FIELDS)
+        doc = collection.find_one({**query, 'user_id': user_oid}, self.get_projection(fields))
+        if doc is None:
+            return Response({'error': 'User is not on the leaderboard'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_entries(db, [doc], fields, now)[0])
+
+
+class StatsViewSet(ViewSet):
+    """Activity report statistics, computed column-wise (see ``analytics.py``)."""
+
+    @cache_response('activities', 'users')
+    def list(self, request):
+        """Duration percentiles per type, a calorie histogram and per-user streaks.
+
+        Query params: ``start``/``end`` (ISO dates, default the last 7 days),
+        ``bin_width`` (calories per histogram bin, default 100) and ``top``
+        (users listed by streak, default 10).
+        """
+        params = request.query_params
+        start, end = parse_window(params, timedelta(days=7))
+        if start is None:
+            return Response({'error': 'Invalid start/end window'}, status=status.HTTP_400_BAD_REQUEST)
+        bin_width = parse_bounded_int(params.get('bin_width', 100), MAX_BIN_WIDTH)
+        top = parse_bounded_int(params.get('top', 10), MAX_TOP)
+        if bin_width is None or top is None:
+            return Response(
+                {'error': f'bin_width must be 1 to {MAX_BIN_WIDTH} and top 1 to {MAX_TOP}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(activity_stats(get_db(), start, end, bin_width, top))
 
+
+class SearchViewSet(ViewSet):
+    """Ranked search over users, teams and workouts (see ``search.py``)."""
+
+    @cache_response('users', 'teams', 'workouts')
     def list(self, request):
-        db = get_mongo_db()
-
-        # Build a team_id -> team_name map
-        teams = {t.get('team_id'): t.get('name', 'Unknown') for t in db.teams.find({})}
-
-        entries = []
-        for doc in db.leaderboard.find({}).sort('rank', 1):
-            team_id = doc.get('team_id')
-            entries.append({
-                '_id': str(doc['_id']),
-                'user_name': doc.get('user_name', 'N/A'),
-                'team': teams.get(team_id, f'Team {team_id}' if team_id else 'N/A'),
-                'total_calories': doc.get('total_calories', 0),
-                'total_activities': doc.get('total_activities', 0),
-                'total_distance': doc.get('total_distance', 0),
-                'total_duration': doc.get('total_duration', 0),
-                'rank': doc.get('rank', 0),
-            })
-        return Response(entries)
+        """Query params: ``q`` (required), ``type`` (comma-separated ``users``,
+        ``teams``, ``workouts``), ``page`` and ``page_size``.
+
+        ``partial`` is true when a collection was skipped for running over
+        the search time budget, or one of its queries was cut off at
+        ``SEARCH['MAX_RESULTS']`` hits, so lower-ranked matches may be missing.
+        Every page is sliced from the same ranked hits.
+        """
+        params = request.query_params
+        text = params.get('q', '').strip()
+        if not text or len(text) > MAX_QUERY_LENGTH:
+            return Response(
+                {'error': f'q is required and at most {MAX_QUERY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        collections = list(SEARCH_SOURCES)
+        if params.get('type'):
+            collections = [name.strip() for name in params['type'].split(',') if name.strip()]
+            if not collections or any(name not in SEARCH_SOURCES for name in collections):
+                return Response(
+                    {'error': f"type must be a comma-separated list of {', '.join(SEARCH_SOURCES)}"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        page = parse_bounded_int(params.get('page', 1), 10 ** 6)
+        page_size = parse_bounded_int(params.get('page_size', DEFAULT_SEARCH_PAGE_SIZE), MAX_SEARCH_PAGE_SIZE)
+        if page is None or page_size is None:
+            return Response(
+                {'error': f'page must be positive and page_size 1 to {MAX_SEARCH_PAGE_SIZE}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        rows, partial = search(get_db(), text, collections)
+        offset = (page - 1) * page_size
+        url = request.build_absolute_uri()
+        next_link = previous_link = None
+        if len(rows) > offset + page_size:
+            next_link = replace_query_param(url, 'page', page + 1)
+        if page > 1:
+            previous_link = replace_query_param(url, 'page', page - 1) if page > 2 else remove_query_param(url, 'page')
+        return Response({
+            'query': text,
+            'partial': partial,
+            'next': next_link,
+            'previous': previous_link,
+            'results': rows[offset:offset + page_size],
+        })
 
 
 class WorkoutViewSet(ViewSet):
-    """Returns workout data directly from MongoDB."""
+    """Returns workout data directly from MongoDB, one page at a time."""
 
+    @cache_response('workouts')
     def list(self, request):
-        db = get_mongo_db()
-        workouts = []
-        for doc in db.workouts.find({}):
-            workouts.append({
-                '_id': str(doc['_id']),
-                'title': doc.get('title', doc.get('name', 'N/A')),
-                'description': doc.get('description', ''),
-                'difficulty': doc.get('difficulty', 'N/A'),
-                'duration': doc.get('duration', 0),
-                'exercises': doc.get('exercises', []),
-                'recommended_for': doc.get('recommended_for', []),
-            })
-        return Response(workouts)
+        """Query params: ``difficulty`` (comma-separated) and ``duration_min``/``duration_max`` (minutes)."""
+        query, error = workout_query(request.query_params)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        db = get_db()
+        fields = requested_fields(request, WORKOUT_FIELDS)
+        paginator = MongoCursorPagination()
+        docs = paginator.paginate_collection(
+            db.workouts, request, query=query, projection=mongo_projection(fields, WORKOUT_SOURCES)
+        )
+        workouts = [select_fields(workout_entry(doc), fields) for doc in docs]
+        return paginator.get_paginated_response(workouts)